@@ -0,0 +1 @@
+# bench — офлайн-замеры производительности бота (без сети и реальных ключей)
@@ -0,0 +1,648 @@
+# bench/fakes.py
+"""
+Локальные подделки внешних сервисов для офлайн-бенчмарков.
+
+Google Sheets и Calendar подменяются на уровне google_clients (листы,
+таблица и сервис Calendar — объекты в памяти, задержка — time.sleep в
+потоке пула, как у настоящих блокирующих клиентов). OpenAI и Yandex STT
+отвечают через httpx.MockTransport общего пула http_pool — реальные
+SDK-клиенты и разбор ответов работают как в бою. Telegram — поддельные
+Message / CallbackQuery / Bot с задержкой на каждый вызов API.
+
+У каждого сервиса свой Profile: задержка, разброс, доля ошибок и объём
+данных (строк в листе, событий в календаре, символов ответа, байт аудио).
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import datetime as dt
+import itertools
+import threading
+from collections import Counter
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional
+
+import httpx
+from gspread.utils import a1_range_to_grid_range
+from telegram.error import NetworkError
+
+SERVICES = ("sheets", "calendar", "openai", "yandex", "telegram")
+
+# Окружение, в котором бот думает, что всё настроено. Ключи заведомо
+# фиктивные: даже без подмены транспорта запрос никуда не уйдёт.
+FAKE_ENV = {
+    "TELEGRAM_TOKEN": "000000:bench",
+    "GOOGLE_SHEET_ID": "bench-sheet",
+    "GOOGLE_CREDENTIALS_JSON": '{"type": "service_account", "bench": true}',
+    "CALENDAR_ID": "bench@group.calendar.google.com",
+    "OPENAI_API_KEY": "sk-bench",
+    "YANDEX_API_KEY": "bench",
+    "YANDEX_FOLDER_ID": "bench",
+    "GPT_CACHE_PATH": "",
+}
+# Умолчания, которые можно переопределить окружением: квоты настоящих API
+# к подделкам не относятся (YANDEX_RPS=5 — проверить поведение под квотой),
+# состояние диалогов и журнал Inbox не пишутся на диск (PERSISTENCE_PATH=/tmp/...,
+# INBOX_JOURNAL_PATH=/tmp/... — с SQLite),
+# фоновый прогрев кешей не смешивается с замерами (PREWARM_ON_START=1 — с ним)
+FAKE_DEFAULTS = {f"{name}_RPS": "0" for name in ("SHEETS", "CALENDAR", "OPENAI", "YANDEX")}
+FAKE_DEFAULTS["PERSISTENCE_PATH"] = ""
+FAKE_DEFAULTS["INBOX_JOURNAL_PATH"] = ""
+FAKE_DEFAULTS["PREWARM_ON_START"] = "0"
+FAKE_DEFAULTS["SHEET_MIRROR_PATH"] = ""
+
+
+class FakeServiceError(RuntimeError):
+    """Сбой, внесённый профилем (error_rate); для resilience выглядит как 503."""
+    status_code = 503
+
+
+@dataclass
+class Profile:
+    latency: float = 0.0    # секунды на вызов (для потокового ответа — до первого кусочка)
+    jitter: float = 0.0     # ± равномерный разброс задержки, секунды
+    error_rate: float = 0.0  # доля вызовов, завершающихся ошибкой
+    payload: int = 0        # объём данных (смысл зависит от сервиса)
+    interval: float = 0.0   # пауза между кусочками потокового ответа / страницами
+
+    def delay(self, rng: random.Random) -> float:
+        if not self.jitter:
+            return self.latency
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+
+DEFAULT_PROFILES: Dict[str, Profile] = {
+    "sheets": Profile(latency=0.12, jitter=0.04, payload=300),
+    "calendar": Profile(latency=0.15, jitter=0.05, payload=400),
+    "openai": Profile(latency=0.7, jitter=0.2, payload=700, interval=0.015),
+    "yandex": Profile(latency=0.6, jitter=0.2, payload=120),
+    "telegram": Profile(latency=0.06, jitter=0.02, payload=48 * 1024),
+}
+
+
+@dataclass
+class Fakes:
+    """Профили всех сервисов, общий ГПСЧ и счётчик обращений."""
+    profiles: Dict[str, Profile] = field(default_factory=lambda: {k: replace(v) for k, v in DEFAULT_PROFILES.items()})
+    seed: int = 1
+    calls: Counter = field(default_factory=Counter)
+
+    def __post_init__(self):
+        self.rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def _roll(self, service: str, op: str):
+        p = self.profiles[service]
+        with self._lock:
+            self.calls[f"{service}.{op}"] += 1
+            delay = p.delay(self.rng)
+            failed = self.rng.random() < p.error_rate
+        return delay, failed
+
+    def hit(self, service: str, op: str) -> None:
+        """Блокирующий вызов (Google-клиенты работают в пуле потоков)."""
+        delay, failed = self._roll(service, op)
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise FakeServiceError(f"{service}.{op}: injected failure")
+
+    async def ahit(self, service: str, op: str) -> bool:
+        """Асинхронный вызов; True — вызов должен завершиться ошибкой."""
+        delay, failed = self._roll(service, op)
+        if delay:
+            await asyncio.sleep(delay)
+        return failed
+
+
+# ── Google Sheets ──────────────────────────────────────────────────
+CATEGORIES = ("Бар", "Кухня", "Маркетинг", "Финансы", "Персонал", "НГ")
+STATUSES = ("В работе", "Не начато", "Ожидание", "Новая", "Готово")
+
+
+def _sheet_data(rows: int, rng: random.Random) -> Dict[str, List[List]]:
+    today = dt.date.today()
+    kpi = [["Дата", "План_выручка", "Факт_выручка", "Средний_чек", "%_НГ_дат_продано", "Комментарий"]]
+    for i in range(max(1, rows // 10)):
+        kpi.append([(today - dt.timedelta(days=i)).isoformat(), "1500000", str(900000 + i * 1000),
+                    str(1800 + i % 50), f"{40 + i % 30}%", ""])
+    ops = [["ID", "Категория", "Проект", "Задача", "Ответственный", "Дедлайн", "Статус",
+            "Приоритет", "Прогресс_%", "Заметки"]]
+    for i in range(rows):
+        ops.append([str(i + 1), CATEGORIES[i % len(CATEGORIES)], f"Проект {i % 17}", f"Задача №{i}",
+                    "В.П.", (today + dt.timedelta(days=rng.randint(-5, 60))).isoformat(),
+                    STATUSES[i % len(STATUSES)], str(1 + i % 3), str(rng.randint(0, 100)), "x" * 40])
+    eff = [["Направление", "Действие", "Потенциал_прироста_%", "Статус"]]
+    for i in range(max(1, rows // 10)):
+        eff.append([f"{CATEGORIES[i % len(CATEGORIES)]} / зал", f"Действие {i}", f"+{5 + i % 20}", "Идея"])
+    inbox = [["Создано", "Категория", "Текст", "Срок", "Статус", "Ответственный", "Автор"]]
+    return {
+        "03_Finance_KPI": kpi,
+        "02_Operations_Sobranie": ops,
+        "10_Effectiveness_Checklist": eff,
+        "09_Inbox_Ideas": inbox,
+    }
+
+
+class FakeWorksheet:
+    def __init__(self, fakes: Fakes, book: "FakeSpreadsheet", title: str, values: List[List]):
+        self.fakes = fakes
+        self.book = book
+        self.title = title
+        self.values = values
+        self._lock = threading.Lock()
+
+    def _cell(self, r: int, c: int) -> str:
+        row = self.values[r] if r < len(self.values) else []
+        return str(row[c]) if c < len(row) else ""
+
+    def _range(self, a1: str, major_dimension: str) -> List[List[str]]:
+        g = a1_range_to_grid_range(a1)
+        width = max((len(r) for r in self.values), default=0)
+        r0, r1 = g.get("startRowIndex", 0), min(g.get("endRowIndex", len(self.values)), len(self.values))
+        c0, c1 = g.get("startColumnIndex", 0), min(g.get("endColumnIndex", width), width)
+        if major_dimension == "COLUMNS":
+            out = [[self._cell(r, c) for r in range(r0, r1)] for c in range(c0, c1)]
+        else:
+            out = [[self._cell(r, c) for c in range(c0, c1)] for r in range(r0, r1)]
+        for line in out:  # как API: хвостовые пустые ячейки не возвращаются
+            while line and line[-1] == "":
+                line.pop()
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def row_values(self, row: int) -> List[str]:
+        self.fakes.hit("sheets", "row_values")
+        with self._lock:
+            return [str(v) for v in self.values[row - 1]] if row <= len(self.values) else []
+
+    def batch_get(self, ranges, major_dimension: str = "ROWS", **kwargs):
+        self.fakes.hit("sheets", "batch_get")
+        with self._lock:
+            return [self._range(a1, major_dimension) for a1 in ranges]
+
+    def get_values(self, *args, **kwargs):
+        self.fakes.hit("sheets", "get_values")
+        with self._lock:
+            return [[str(v) for v in row] for row in self.values]
+
+    def append_rows(self, rows, value_input_option: str = "RAW", **kwargs):
+        self.fakes.hit("sheets", "append_rows")
+        with self._lock:
+            self.values.extend([list(r) for r in rows])
+        self.book.touch()
+        return {"updates": {"updatedRows": len(rows)}}
+
+    def append_row(self, row, value_input_option: str = "RAW", **kwargs):
+        return self.append_rows([row], value_input_option)
+
+
+class FakeSpreadsheet:
+    def __init__(self, fakes: Fakes, sheet_id: str):
+        self.fakes = fakes
+        self.id = sheet_id
+        data = _sheet_data(fakes.profiles["sheets"].payload, random.Random(fakes.seed))
+        self._sheets = {title: FakeWorksheet(fakes, self, title, values) for title, values in data.items()}
+        self._revision = itertools.count(1)
+        self.revision = next(self._revision)
+
+    def touch(self) -> None:
+        self.revision = next(self._revision)
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self.fakes.hit("sheets", "worksheet")
+        return self._sheets[title]
+
+    def get_lastUpdateTime(self) -> str:
+        self.fakes.hit("sheets", "drive_revision")
+        return f"2026-01-01T00:00:{self.revision:02d}Z"
+
+
+# ── Google Calendar ────────────────────────────────────────────────
+class _Request:
+    def __init__(self, fn, apply=None):
+        self._fn = fn
+        self.apply = apply  # тот же запрос без задержки/сбоя — для batch
+
+    def execute(self):
+        return self._fn()
+
+
+class _Batch:
+    """new_batch_http_request(): одна задержка на весь пакет, ответы — в callback."""
+
+    def __init__(self, fakes: Fakes, callback=None):
+        self.fakes = fakes
+        self.callback = callback
+        self._requests = []
+
+    def add(self, request: _Request, callback=None, request_id=None):
+        self._requests.append((request, callback or self.callback, request_id or str(len(self._requests) + 1)))
+
+    def execute(self):
+        self.fakes.hit("calendar", "batch")
+        for request, callback, request_id in self._requests:
+            try:
+                response, error = request.apply(), None
+            except Exception as e:
+                response, error = None, e
+            callback(request_id, response, error)
+
+
+class FakeCalendarService:
+    def __init__(self, fakes: Fakes):
+        self.fakes = fakes
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._tokens = itertools.count(1)
+        now = dt.datetime.now(dt.timezone.utc).replace(minute=0, second=0, microsecond=0)
+        n = fakes.profiles["calendar"].payload
+        start = now - dt.timedelta(days=7)
+        step = dt.timedelta(days=60) / max(1, n)
+        self.items = [self._event(start + step * i, 60, f"Событие {i}") for i in range(n)]
+
+    def _event(self, start: dt.datetime, minutes: int, summary: str, description: str = "") -> Dict:
+        eid = f"ev{next(self._ids)}"
+        return {
+            "id": eid,
+            "status": "confirmed",
+            "summary": summary,
+            "description": description,
+            "htmlLink": f"https://calendar.local/{eid}",
+            "start": {"dateTime": start.isoformat()},
+            "end": {"dateTime": (start + dt.timedelta(minutes=minutes)).isoformat()},
+        }
+
+    def events(self):
+        return self
+
+    def list(self, calendarId=None, timeMin=None, timeMax=None, syncToken=None, pageToken=None,
+             maxResults=250, **kwargs):
+        def run():
+            self.fakes.hit("calendar", "list")
+            if syncToken:
+                return {"items": [], "nextSyncToken": f"sync{next(self._tokens)}"}
+            lo = dt.datetime.fromisoformat(timeMin.replace("Z", "+00:00")) if timeMin else None
+            hi = dt.datetime.fromisoformat(timeMax.replace("Z", "+00:00")) if timeMax else None
+            with self._lock:
+                items = [
+                    e for e in self.items
+                    if (lo is None or dt.datetime.fromisoformat(e["end"]["dateTime"]) > lo)
+                    and (hi is None or dt.datetime.fromisoformat(e["start"]["dateTime"]) < hi)
+                ]
+            items.sort(key=lambda e: e["start"]["dateTime"])
+            offset = int(pageToken or 0)
+            page = items[offset:offset + maxResults]
+            resp = {"items": [dict(e) for e in page]}
+            if offset + maxResults < len(items):
+                resp["nextPageToken"] = str(offset + maxResults)
+            else:
+                resp["nextSyncToken"] = f"sync{next(self._tokens)}"
+            return resp
+        return _Request(run)
+
+    def insert(self, calendarId=None, body=None, **kwargs):
+        def apply():
+            event = dict(body)
+            event.update(id=f"ev{next(self._ids)}", status="confirmed")
+            event["htmlLink"] = f"https://calendar.local/{event['id']}"
+            with self._lock:
+                self.items.append(event)
+            return event
+
+        def run():
+            self.fakes.hit("calendar", "insert")
+            return apply()
+        return _Request(run, apply)
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self.fakes, callback)
+
+    def freebusy(self):
+        return _FreeBusy(self)
+
+
+class _FreeBusy:
+    def __init__(self, calendar: FakeCalendarService):
+        self.calendar = calendar
+
+    def query(self, body=None):
+        def run():
+            self.calendar.fakes.hit("calendar", "freebusy")
+            lo, hi = body["timeMin"], body["timeMax"]
+            with self.calendar._lock:
+                busy = [
+                    {"start": e["start"]["dateTime"], "end": e["end"]["dateTime"]}
+                    for e in self.calendar.items
+                    if _utc(e["end"]["dateTime"]) > _utc(lo) and _utc(e["start"]["dateTime"]) < _utc(hi)
+                ]
+            return {"calendars": {item["id"]: {"busy": busy} for item in body["items"]}}
+        return _Request(run)
+
+
+def _utc(value: str) -> dt.datetime:
+    return dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+# ── OpenAI и Yandex STT (httpx.MockTransport) ──────────────────────
+def _answer(chars: int) -> str:
+    base = "1) Что хорошо: выручка растёт. 2) Риски: средний чек. 3) Шаги: проверить смены и предзаказы. "
+    return (base * (chars // len(base) + 1))[:chars]
+
+
+class FakeAIServer:
+    """Обработчик запросов к api.openai.com и stt.api.cloud.yandex.net."""
+
+    def __init__(self, fakes: Fakes):
+        self.fakes = fakes
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        host, path = request.url.host, request.url.path
+        if host == "stt.api.cloud.yandex.net":
+            await request.aread()
+            if await self.fakes.ahit("yandex", "recognize"):
+                return httpx.Response(500, json={"error_code": "INTERNAL", "error_message": "injected"})
+            return httpx.Response(200, json={"result": _answer(self.fakes.profiles["yandex"].payload)})
+        if path.endswith("/audio/transcriptions"):
+            await request.aread()
+            if await self.fakes.ahit("openai", "transcribe"):
+                return httpx.Response(500, json={"error": {"message": "injected", "type": "server_error"}})
+            return httpx.Response(200, json={"text": _answer(self.fakes.profiles["yandex"].payload)})
+        if path.endswith("/chat/completions"):
+            body = json.loads(await request.aread() or b"{}")
+            if await self.fakes.ahit("openai", "chat_stream" if body.get("stream") else "chat"):
+                return httpx.Response(500, json={"error": {"message": "injected", "type": "server_error"}})
+            text = _answer(self.fakes.profiles["openai"].payload)
+            if body.get("stream"):
+                return httpx.Response(200, headers={"content-type": "text/event-stream"},
+                                      content=self._sse(body.get("model", ""), text))
+            return httpx.Response(200, json=self._completion(body.get("model", ""), text))
+        return httpx.Response(404, json={"error": {"message": f"no fake for {host}{path}"}})
+
+    @staticmethod
+    def _completion(model: str, text: str) -> Dict:
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 120, "completion_tokens": len(text) // 4, "total_tokens": 120 + len(text) // 4},
+        }
+
+    async def _sse(self, model: str, text: str, piece: int = 8):
+        interval = self.fakes.profiles["openai"].interval
+        for i in range(0, len(text), piece):
+            chunk = {
+                "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": text[i:i + piece]}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+            if interval:
+                await asyncio.sleep(interval)
+        yield b"data: [DONE]\n\n"
+
+
+# ── Telegram ───────────────────────────────────────────────────────
+class FakeFile:
+    def __init__(self, fakes: Fakes, size: int):
+        self.fakes = fakes
+        self.file_size = size
+
+    async def download_as_bytearray(self) -> bytearray:
+        if await self.fakes.ahit("telegram", "download"):
+            raise NetworkError("injected failure")
+        return bytearray(os.urandom(self.file_size))
+
+    async def download_to_drive(self, path: str) -> str:
+        data = await self.download_as_bytearray()
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+
+class FakeVoice:
+    def __init__(self, size: int):
+        self.file_id = "voice-bench"
+        self.file_size = size
+        self.duration = max(1, size // 4000)
+
+
+class FakeBot:
+    def __init__(self, fakes: Fakes):
+        self.fakes = fakes
+        self.sent: Counter = Counter()
+
+    async def _api(self, method: str) -> None:
+        self.sent[method] += 1
+        if await self.fakes.ahit("telegram", method):
+            raise NetworkError("injected failure")
+
+    async def get_file(self, file_id: str) -> FakeFile:
+        await self._api("getFile")
+        return FakeFile(self.fakes, self.fakes.profiles["telegram"].payload)
+
+    async def send_message(self, chat_id, text, **kwargs) -> "FakeMessage":
+        await self._api("sendMessage")
+        return FakeMessage(self, text=text)
+
+    sendMessage = send_message
+
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, bot: FakeBot, text: Optional[str] = None, voice: Optional[FakeVoice] = None,
+                 chat_id: int = 1):
+        self.bot = bot
+        self.message_id = next(self._ids)
+        self.chat_id = chat_id
+        self.text = text
+        self.voice = voice
+
+    async def reply_text(self, text: str, **kwargs) -> "FakeMessage":
+        await self.bot._api("sendMessage")
+        return FakeMessage(self.bot, text=text, chat_id=self.chat_id)
+
+    async def edit_text(self, text: str, **kwargs) -> "FakeMessage":
+        await self.bot._api("editMessageText")
+        self.text = text
+        return self
+
+
+class FakeCallbackQuery:
+    def __init__(self, bot: FakeBot, data: str, message: FakeMessage):
+        self.bot = bot
+        self.data = data
+        self.message = message
+
+    async def answer(self, *args, **kwargs) -> bool:
+        await self.bot._api("answerCallbackQuery")
+        return True
+
+    async def edit_message_text(self, text: str, **kwargs) -> FakeMessage:
+        return await self.message.edit_text(text, **kwargs)
+
+
+class FakeUpdate:
+    _ids = itertools.count(1)
+
+    def __init__(self, message: Optional[FakeMessage] = None, callback_query: Optional[FakeCallbackQuery] = None):
+        self.update_id = next(self._ids)
+        self.message = message
+        self.callback_query = callback_query
+        self.effective_chat = None
+
+
+class FakeContext:
+    def __init__(self, bot: FakeBot, user_data: Optional[Dict] = None):
+        self.bot = bot
+        self.user_data = {} if user_data is None else user_data
+        self.error = None
+
+
+# ── Установка подделок ─────────────────────────────────────────────
+def configure_env() -> None:
+    """Вызывать до импорта модулей бота: они читают окружение при импорте."""
+    os.environ.update(FAKE_ENV)
+    for key, value in FAKE_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+
+
+def install(fakes: Fakes) -> None:
+    """Подменяет Google-клиенты и транспорт общего HTTP-пула на подделки."""
+    import google_clients
+    import http_pool
+
+    books: Dict[str, FakeSpreadsheet] = {}
+    calendar = FakeCalendarService(fakes)
+    lock = threading.Lock()
+
+    def spreadsheet(sheet_id, creds_src, scopes, loader):
+        with lock:
+            if sheet_id not in books:
+                books[sheet_id] = FakeSpreadsheet(fakes, sheet_id)
+            return books[sheet_id]
+
+    def worksheet(sheet_id, creds_src, title, scopes, loader):
+        return spreadsheet(sheet_id, creds_src, scopes, loader)._sheets[title]
+
+    spreadsheet(FAKE_ENV["GOOGLE_SHEET_ID"], None, None, None)  # данные листов — до замеров памяти
+    google_clients.spreadsheet = spreadsheet
+    google_clients.worksheet = worksheet
+    google_clients.calendar_service = lambda creds_src, scopes, loader: calendar
+
+    http_pool._client = httpx.AsyncClient(transport=httpx.MockTransport(FakeAIServer(fakes)),
+                                          timeout=http_pool.DEFAULT_TIMEOUT)
+    http_pool._openai = None
+    fakes.books = books
+    fakes.calendar = calendar
+
+
+# ── Telegram Bot API (локальный HTTP-сервер) ───────────────────────
+class FakeBotAPI:
+    """
+    Минимальный Bot API для нагрузочных прогонов через настоящий webhook:
+    getMe, setWebhook/deleteWebhook, sendMessage, editMessageText,
+    answerCallbackQuery, getFile и скачивание файлов. Задержка и ошибки —
+    из профиля "telegram"; payload — размер скачиваемого голосового.
+    """
+
+    BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+    def __init__(self, fakes: Fakes, host: str = "127.0.0.1", port: int = 0):
+        from http.server import ThreadingHTTPServer
+
+        self.fakes = fakes
+        self._message_ids = itertools.count(1_000_000)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-bot-api", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"{self.url}/file/bot"
+
+    def start(self) -> "FakeBotAPI":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _message(self, params: Dict) -> Dict:
+        chat_id = int(params.get("chat_id") or 1)
+        return {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self.BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    def _result(self, method: str, params: Dict):
+        if method == "getMe":
+            return self.BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params)
+        if method == "getFile":
+            return {"file_id": params.get("file_id", ""), "file_unique_id": "bench",
+                    "file_size": self.fakes.profiles["telegram"].payload, "file_path": "voice/bench.ogg"}
+        return True  # setWebhook, deleteWebhook, answerCallbackQuery, ...
+
+    def _handler(self):
+        from http.server import BaseHTTPRequestHandler
+        from urllib.parse import parse_qsl
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code: int, body: bytes, ctype: str = "application/json") -> None:
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith("/file/"):
+                    try:
+                        api.fakes.hit("telegram", "download")
+                    except FakeServiceError:
+                        return self._send(502, b"")
+                    return self._send(200, os.urandom(api.fakes.profiles["telegram"].payload),
+                                      "application/octet-stream")
+                self._send(404, b"")
+
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                ctype = self.headers.get("Content-Type", "")
+                if "json" in ctype:
+                    params = json.loads(raw or b"{}")
+                else:
+                    params = dict(parse_qsl(raw.decode("utf-8")))
+                try:
+                    api.fakes.hit("telegram", method)
+                except FakeServiceError:
+                    body = {"ok": False, "error_code": 500, "description": "Internal Server Error: injected"}
+                    return self._send(500, json.dumps(body).encode("utf-8"))
+                body = {"ok": True, "result": api._result(method, params)}
+                self._send(200, json.dumps(body, ensure_ascii=False).encode("utf-8"))
+
+        return Handler
@@ -0,0 +1,247 @@
+# bench/handlers_bench.py
+"""
+Офлайн-бенчмарк хендлеров бота на подделках всех внешних сервисов.
+
+    python -m bench.handlers_bench                       # все сценарии
+    python -m bench.handlers_bench -s status day voice -n 200 -c 16
+    python -m bench.handlers_bench --latency openai=1.5 --error-rate yandex=0.2
+    python -m bench.handlers_bench --zero                # без задержек — чистый CPU бота
+
+Для каждого сценария: задержка p50/p95/p99, пропускная способность,
+ошибки, обращения к внешним сервисам на вызов и (отдельным проходом под
+tracemalloc) пик и прирост памяти. Сеть не нужна — см. bench/fakes.py.
+"""
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, List, Tuple
+
+from bench import fakes as F
+
+VOICE_TEXTS = ("купить лёд к пятнице", "позвонить поставщику завтра в 10:00", "обновить меню через неделю")
+
+
+@dataclass
+class Result:
+    scenario: str
+    n: int
+    concurrency: int
+    errors: int = 0
+    wall_s: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list, repr=False)
+    calls: Dict[str, float] = field(default_factory=dict)
+    alloc_peak_kib: float = None
+    alloc_retained_kib: float = None
+
+    def pct(self, q: float) -> float:
+        data = sorted(self.latencies_ms)
+        if not data:
+            return 0.0
+        return data[min(len(data) - 1, int(q * len(data)))]
+
+    def summary(self) -> Dict:
+        out = {k: v for k, v in asdict(self).items() if k != "latencies_ms"}
+        out.update(
+            p50_ms=round(self.pct(0.50), 1),
+            p95_ms=round(self.pct(0.95), 1),
+            p99_ms=round(self.pct(0.99), 1),
+            throughput_rps=round(self.n / self.wall_s, 2) if self.wall_s else 0.0,
+        )
+        return out
+
+
+# ── Сценарии ───────────────────────────────────────────────────────
+# Каждый сценарий: фабрика (bot, i) -> корутина одного вызова хендлера
+def _scenarios(main, bot: F.FakeBot, free_top: List) -> Dict[str, Callable[[int], object]]:
+    def command(handler, **kw):
+        def make(i):
+            update = F.FakeUpdate(message=F.FakeMessage(bot, text="/cmd"))
+            return handler(update, F.FakeContext(bot), **kw)
+        return make
+
+    def callback(data, user_data=None):
+        def make(i):
+            q = F.FakeCallbackQuery(bot, data, F.FakeMessage(bot, text="Меню"))
+            ctx = F.FakeContext(bot, dict(user_data or {}))
+            return main.on_cb(F.FakeUpdate(callback_query=q), ctx)
+        return make
+
+    def text(i):
+        update = F.FakeUpdate(message=F.FakeMessage(bot, text=VOICE_TEXTS[i % len(VOICE_TEXTS)] + f" #{i}"))
+        return main.handle_text(update, F.FakeContext(bot, {"capture_mode": True}))
+
+    def voice(i):
+        size = bot.fakes.profiles["telegram"].payload
+        update = F.FakeUpdate(message=F.FakeMessage(bot, voice=F.FakeVoice(size)))
+        return main.handle_voice(update, F.FakeContext(bot))
+
+    return {
+        "status": command(main.status_cmd),
+        "status_refresh": callback("status::refresh"),
+        "day": callback("day"),
+        "week": callback("week"),
+        "month": callback("month"),
+        "pom": callback("POM::25::1", {"free_top": free_top}),
+        "cal": callback("CAL::TODAY19::60"),
+        "text": text,
+        "voice": voice,
+    }
+
+
+async def _drive(make: Callable[[int], object], n: int, concurrency: int) -> Tuple[List[float], int, float]:
+    """n вызовов, не больше concurrency одновременно (как concurrent_updates у PTB)."""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(n))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                await make(i)
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def _alloc(make: Callable[[int], object], n: int) -> Tuple[float, float]:
+    """Пик и прирост памяти (КиБ) на n последовательных вызовов под tracemalloc."""
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for i in range(n):
+            try:
+                await make(i)
+            except Exception:
+                pass
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (peak - base) / 1024, (current - base) / 1024
+
+
+async def run(args, fakes: F.Fakes) -> List[Result]:
+    import main
+    import services
+    import logic
+
+    main.GPT_STREAM = not args.no_stream
+    await main.on_startup(None)
+    bot = F.FakeBot(fakes)
+    try:
+        tasks = await services.fetch_ops_tasks(main.GOOGLE_SHEET_ID, main.GOOGLE_CREDENTIALS_JSON)
+        eff = await services.fetch_eff_actions(main.GOOGLE_SHEET_ID, main.GOOGLE_CREDENTIALS_JSON)
+        scenarios = _scenarios(main, bot, logic.pick_next(tasks, eff, top=3))
+        results = []
+        for name in args.scenarios:
+            make = scenarios[name]
+            for i in range(args.warmup):
+                try:
+                    await make(i)
+                except Exception:
+                    pass
+            before = Counter(fakes.calls)
+            latencies, errors, wall = await _drive(make, args.n, args.concurrency)
+            calls = Counter(fakes.calls)
+            calls.subtract(before)
+            res = Result(name, args.n, args.concurrency, errors, wall, latencies,
+                         {k: round(v / args.n, 2) for k, v in sorted(calls.items()) if v > 0})
+            if args.alloc_n:
+                res.alloc_peak_kib, res.alloc_retained_kib = (round(x, 1) for x in await _alloc(make, args.alloc_n))
+            results.append(res)
+            print(_row(res.summary()), flush=True)
+        return results
+    finally:
+        await main.on_shutdown(None)
+
+
+# ── Вывод ──────────────────────────────────────────────────────────
+HEADER = f"{'сценарий':<15}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>9}{'ошибок':>8}{'пик КиБ':>10}{'прирост':>10}  вызовы/оп"
+
+
+def _row(s: Dict) -> str:
+    alloc = (f"{s['alloc_peak_kib']:>10}{s['alloc_retained_kib']:>10}"
+             if s["alloc_peak_kib"] is not None else f"{'—':>10}{'—':>10}")
+    calls = ", ".join(f"{k}={v:g}" for k, v in s["calls"].items())
+    return (f"{s['scenario']:<15}{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}"
+            f"{s['throughput_rps']:>9}{s['errors']:>8}{alloc}  {calls}")
+
+
+def _overrides(values: List[str], attr: str, cast, fakes: F.Fakes) -> None:
+    """--latency openai=1.5 sheets=0.2 (или all=0)."""
+    for item in values or []:
+        service, _, raw = item.partition("=")
+        targets = F.SERVICES if service == "all" else (service,)
+        for name in targets:
+            if name not in fakes.profiles:
+                raise SystemExit(f"неизвестный сервис: {name} (есть: {', '.join(F.SERVICES)})")
+            setattr(fakes.profiles[name], attr, cast(raw))
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-s", "--scenarios", nargs="+", default=None,
+                    help="status status_refresh day week month pom cal text voice (по умолчанию все)")
+    ap.add_argument("-n", type=int, default=100, help="вызовов на сценарий")
+    ap.add_argument("-c", "--concurrency", type=int, default=8, help="одновременных апдейтов")
+    ap.add_argument("--warmup", type=int, default=2, help="прогревочных вызовов (не в статистике)")
+    ap.add_argument("--alloc-n", type=int, default=20, help="вызовов под tracemalloc (0 — не мерить память)")
+    ap.add_argument("--latency", nargs="*", metavar="SVC=SEC", help="задержка сервиса, секунды")
+    ap.add_argument("--jitter", nargs="*", metavar="SVC=SEC", help="разброс задержки, секунды")
+    ap.add_argument("--error-rate", nargs="*", metavar="SVC=P", help="доля ошибок 0..1")
+    ap.add_argument("--payload", nargs="*", metavar="SVC=N",
+                    help="строк листа / событий / символов ответа / байт голосового")
+    ap.add_argument("--zero", action="store_true", help="обнулить задержки всех сервисов")
+    ap.add_argument("--no-stream", action="store_true", help="GPT без потоковой выдачи")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", metavar="PATH", help="сохранить результаты в JSON")
+    return ap.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    fakes = F.Fakes(seed=args.seed)
+    if args.zero:
+        for p in fakes.profiles.values():
+            p.latency = p.jitter = p.interval = 0.0
+    _overrides(args.latency, "latency", float, fakes)
+    _overrides(args.jitter, "jitter", float, fakes)
+    _overrides(args.error_rate, "error_rate", float, fakes)
+    _overrides(args.payload, "payload", int, fakes)
+
+    F.configure_env()
+    logging.basicConfig(level=logging.WARNING)
+    F.install(fakes)
+
+    import main as bot_main
+    all_names = list(_scenarios(bot_main, None, []))
+    args.scenarios = args.scenarios or all_names
+    unknown = set(args.scenarios) - set(all_names)
+    if unknown:
+        raise SystemExit(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    print(f"n={args.n}, concurrency={args.concurrency}, stream={not args.no_stream}")
+    for name, p in fakes.profiles.items():
+        print(f"  {name:<9} latency={p.latency}s ±{p.jitter}s, errors={p.error_rate:.0%}, payload={p.payload}")
+    print(HEADER)
+    results = asyncio.run(run(args, fakes))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([r.summary() for r in results], f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
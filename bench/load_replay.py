@@ -0,0 +1,344 @@
+# bench/load_replay.py
+"""
+Нагрузочный прогон через настоящий webhook (webserver.serve, как в main).
+
+    python -m bench.load_replay --rates 5 10 20 40 --duration 20
+    python -m bench.load_replay --replay updates.jsonl --rates 10
+    python -m bench.load_replay --rates 20 --latency openai=2 --error-rate telegram=0.02
+
+Бот собирается main.build_app(), Bot API — локальный FakeBotAPI, Google /
+OpenAI / Yandex — подделки из bench/fakes.py. Генератор в отдельном
+потоке шлёт JSON апдейтов на локальный webhook с заданной частотой
+(пуассоновский поток) и для каждой ступени нагрузки считает:
+
+  webhook  — время ответа webhook-эндпоинта (приём апдейта);
+  очередь  — от отправки апдейта до старта обработки (ожидание слота
+             concurrent_updates и очередь PTB);
+  хендлер  — от старта обработки до её завершения;
+  ошибки   — исключения в хендлерах, не-200 от webhook, незавершённые.
+
+Апдейты: синтетическая смесь (команды, кнопки, текст, голос) или записанный
+поток — JSONL, по объекту Update на строку (update_id перенумеровываются).
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import itertools
+import threading
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from bench import fakes as F
+from bench.handlers_bench import _overrides
+
+HOOK_PATH = "bench-hook"
+_update_ids = itertools.count(1)
+
+# вид апдейта -> вес в синтетической смеси
+MIX = {
+    "status": 10, "start": 3, "diag": 2,
+    "day": 12, "week": 8, "month": 5, "cal": 4, "status_refresh": 3,
+    "capture": 8, "text": 15, "voice": 10,
+}
+COMMANDS = {"status": "/status", "start": "/start", "diag": "/diag"}
+CALLBACKS = {"day": "day", "week": "week", "month": "month", "cal": "CAL::TODAY19::60",
+             "status_refresh": "status::refresh", "capture": "capture"}
+TEXTS = ("купить лёд к пятнице", "позвонить поставщику завтра в 10:00", "обновить меню через неделю")
+
+
+def _pct(data: List[float], q: float) -> float:
+    if not data:
+        return 0.0
+    data = sorted(data)
+    return data[min(len(data) - 1, int(q * len(data)))]
+
+
+# ── Апдейты ────────────────────────────────────────────────────────
+class UpdateFactory:
+    def __init__(self, users: int, voice_size: int, seed: int = 1):
+        self.users = max(1, users)
+        self.voice_size = voice_size
+        self.rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._kinds, self._weights = zip(*MIX.items())
+
+    def _user(self) -> Dict:
+        uid = 10_000 + self.rng.randrange(self.users)
+        return {"id": uid, "is_bot": False, "first_name": f"User{uid}"}
+
+    def _message(self, user: Dict, **extra) -> Dict:
+        return {
+            "message_id": next(self._ids), "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"}, "from": user, **extra,
+        }
+
+    def make(self, kind: Optional[str] = None) -> Dict:
+        kind = kind or self.rng.choices(self._kinds, self._weights)[0]
+        user = self._user()
+        if kind in COMMANDS:
+            cmd = COMMANDS[kind]
+            body = {"message": self._message(user, text=cmd, entities=[
+                {"type": "bot_command", "offset": 0, "length": len(cmd)}])}
+        elif kind in CALLBACKS:
+            menu = self._message(user, text="Меню (inline):")
+            menu["from"] = F.FakeBotAPI.BOT_USER
+            body = {"callback_query": {"id": str(next(self._ids)), "from": user, "chat_instance": str(user["id"]),
+                                       "data": CALLBACKS[kind], "message": menu}}
+        elif kind == "voice":
+            body = {"message": self._message(user, voice={
+                "file_id": f"voice{next(self._ids)}", "file_unique_id": "bench", "duration": 5,
+                "mime_type": "audio/ogg", "file_size": self.voice_size})}
+        else:
+            body = {"message": self._message(user, text=self.rng.choice(TEXTS))}
+        return {"_kind": kind, **body}
+
+    def __iter__(self) -> Iterator[Dict]:
+        while True:
+            yield self.make()
+
+
+def _kind_of(update: Dict) -> str:
+    if "callback_query" in update:
+        return "cb:" + str(update["callback_query"].get("data", "")).split("::")[0]
+    msg = update.get("message") or {}
+    if "voice" in msg:
+        return "voice"
+    text = msg.get("text") or ""
+    return text.split()[0] if text.startswith("/") else "text"
+
+
+def replay_stream(path: str) -> Iterator[Dict]:
+    """Записанные апдейты по кругу (пустые строки пропускаются)."""
+    with open(path, "r", encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    if not updates:
+        raise SystemExit(f"{path}: нет апдейтов")
+    for update in itertools.cycle(updates):
+        yield {**update, "_kind": _kind_of(update)}
+
+
+# ── Учёт ───────────────────────────────────────────────────────────
+class Tracker:
+    """Отметки времени по update_id: отправлен, принят webhook, старт, конец."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.items: Dict[int, Dict] = {}
+
+    def mark(self, update_id: int, key: str, value=None) -> None:
+        with self._lock:
+            item = self.items.setdefault(update_id, {})
+            item[key] = time.perf_counter() if value is None else value
+
+    def done(self, ids) -> int:
+        with self._lock:
+            return sum(1 for i in ids if "end" in self.items.get(i, {}))
+
+    def report(self, ids, offered: float) -> Dict:
+        with self._lock:
+            rows = [self.items.get(i, {}) for i in ids]
+        finished = [r for r in rows if "end" in r and "start" in r]
+        # факт — завершённые за время от первой отправки до последнего завершения
+        wall = (max(r["end"] for r in finished) - min(r["sent"] for r in rows)) if finished else 0.0
+        webhook = [(r["responded"] - r["sent"]) * 1000 for r in rows if "responded" in r]
+        queue = [(r["start"] - r["sent"]) * 1000 for r in finished]
+        handler = [(r["end"] - r["start"]) * 1000 for r in finished]
+        by_kind = defaultdict(list)
+        for r in finished:
+            by_kind[r.get("kind", "?")].append((r["end"] - r["start"]) * 1000)
+        return {
+            "offered_rps": offered,
+            "sent": len(rows),
+            "completed": len(finished),
+            "achieved_rps": round(len(finished) / wall, 2) if wall else 0.0,
+            "webhook_ms": [round(_pct(webhook, q), 1) for q in (0.5, 0.95, 0.99)],
+            "queue_ms": [round(_pct(queue, q), 1) for q in (0.5, 0.95, 0.99)],
+            "handler_ms": [round(_pct(handler, q), 1) for q in (0.5, 0.95, 0.99)],
+            "handler_errors": sum(1 for r in rows if r.get("error")),
+            "webhook_errors": sum(1 for r in rows if r.get("status", 200) != 200),
+            "unfinished": len(rows) - len(finished),
+            "by_kind": {k: [round(_pct(v, 0.5), 1), round(_pct(v, 0.95), 1), len(v)] for k, v in sorted(by_kind.items())},
+        }
+
+
+def _instrument(app, tracker: Tracker) -> None:
+    """Отметки старта/конца обработки — хендлерами до и после основных групп."""
+    async def started(update: Update, context) -> None:
+        tracker.mark(update.update_id, "start")
+
+    async def finished(update: Update, context) -> None:
+        tracker.mark(update.update_id, "end")
+
+    async def failed(update, context) -> None:
+        if isinstance(update, Update):
+            tracker.mark(update.update_id, "error", repr(context.error))
+
+    app.add_handler(TypeHandler(Update, started), group=-100)
+    app.add_handler(TypeHandler(Update, finished), group=100)
+    app.add_error_handler(failed)
+
+
+# ── Генератор нагрузки ─────────────────────────────────────────────
+async def _offer(client: httpx.AsyncClient, url: str, stream: Iterator[Dict], tracker: Tracker,
+                 rate: float, duration: float, drain: float, rng: random.Random) -> Dict:
+    ids: List[int] = []
+    pending = set()
+
+    async def post(update: Dict, uid: int) -> None:
+        tracker.mark(uid, "sent")
+        try:
+            resp = await client.post(url, json=update)
+            tracker.mark(uid, "status", resp.status_code)
+        except httpx.HTTPError as e:
+            tracker.mark(uid, "status", repr(e))
+        tracker.mark(uid, "responded")
+
+    started = time.perf_counter()
+    deadline = started + duration
+    at = started
+    while True:
+        at += rng.expovariate(rate)  # пуассоновский поток заявок
+        if at >= deadline:
+            break
+        await asyncio.sleep(max(0.0, at - time.perf_counter()))
+        update = dict(next(stream))
+        kind = update.pop("_kind", "?")
+        uid = update["update_id"] = next(_update_ids)
+        tracker.mark(uid, "kind", kind)
+        ids.append(uid)
+        task = asyncio.ensure_future(post(update, uid))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.wait(pending)
+    # ждём, пока бот дообработает хвост
+    until = time.perf_counter() + drain
+    while tracker.done(ids) < len(ids) and time.perf_counter() < until:
+        await asyncio.sleep(0.05)
+    return tracker.report(ids, rate)
+
+
+def _generator(args, stream: Iterator[Dict], tracker: Tracker, url: str, results: List[Dict], stop) -> None:
+    async def main():
+        rng = random.Random(args.seed)
+        limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+        async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+            # сервер поднимается после initialize и post_init — ждём, пока он начнёт отвечать
+            base = url.rsplit("/", 1)[0]
+            while True:
+                try:
+                    await client.get(f"{base}/healthz")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.05)
+            for rate in args.rates:
+                res = await _offer(client, url, stream, tracker, rate, args.duration, args.drain, rng)
+                results.append(res)
+                print(_row(res), flush=True)
+            if args.metrics:
+                resp = await client.get(f"{base}/metrics")
+                with open(args.metrics, "w", encoding="utf-8") as f:
+                    f.write(resp.text)
+    try:
+        asyncio.run(main())
+    finally:
+        stop()
+
+
+HEADER = (f"{'rps':>6}{'факт':>7}{'отпр.':>7}  {'webhook p50/p95/p99':>22}  {'очередь p50/p95/p99':>24}"
+          f"  {'хендлер p50/p95/p99':>24}{'ош.хенд':>8}{'ош.hook':>8}{'не зав.':>8}")
+
+
+def _row(r: Dict) -> str:
+    fmt = lambda v: "/".join(f"{x:g}" for x in v)
+    return (f"{r['offered_rps']:>6g}{r['achieved_rps']:>7g}{r['sent']:>7}  {fmt(r['webhook_ms']):>22}  "
+            f"{fmt(r['queue_ms']):>24}  {fmt(r['handler_ms']):>24}{r['handler_errors']:>8}"
+            f"{r['webhook_errors']:>8}{r['unfinished']:>8}")
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rates", nargs="+", type=float, default=[5, 10, 20], help="ступени нагрузки, апдейтов/с")
+    ap.add_argument("--duration", type=float, default=15, help="секунд на ступень")
+    ap.add_argument("--drain", type=float, default=30, help="сколько ждать дообработки хвоста, с")
+    ap.add_argument("--replay", metavar="JSONL", help="записанные апдейты вместо синтетики")
+    ap.add_argument("--users", type=int, default=50, help="разных пользователей в синтетике")
+    ap.add_argument("--port", type=int, default=8089, help="порт локального webhook")
+    ap.add_argument("--connections", type=int, default=64, help="соединений генератора к webhook")
+    ap.add_argument("--latency", nargs="*", metavar="SVC=SEC")
+    ap.add_argument("--jitter", nargs="*", metavar="SVC=SEC")
+    ap.add_argument("--error-rate", nargs="*", metavar="SVC=P")
+    ap.add_argument("--payload", nargs="*", metavar="SVC=N")
+    ap.add_argument("--zero", action="store_true", help="обнулить задержки всех сервисов")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", metavar="PATH", help="сохранить результаты в JSON")
+    ap.add_argument("--metrics", metavar="PATH", help="сохранить снимок /metrics после прогона")
+    return ap.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    fakes = F.Fakes(seed=args.seed)
+    if args.zero:
+        for p in fakes.profiles.values():
+            p.latency = p.jitter = p.interval = 0.0
+    _overrides(args.latency, "latency", float, fakes)
+    _overrides(args.jitter, "jitter", float, fakes)
+    _overrides(args.error_rate, "error_rate", float, fakes)
+    _overrides(args.payload, "payload", int, fakes)
+
+    F.configure_env()
+    logging.basicConfig(level=logging.WARNING)
+    F.install(fakes)
+    bot_api = F.FakeBotAPI(fakes).start()
+
+    import main as bot_main
+    import startup
+    import webserver
+    app = bot_main.build_app(base_url=bot_api.base_url, base_file_url=bot_api.base_file_url)
+    tracker = Tracker()
+    _instrument(app, tracker)
+
+    stream = replay_stream(args.replay) if args.replay else iter(
+        UpdateFactory(args.users, fakes.profiles["telegram"].payload, args.seed))
+    url = f"http://127.0.0.1:{args.port}/{HOOK_PATH}"
+    results: List[Dict] = []
+
+    async def serve() -> None:
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        threading.Thread(target=_generator,
+                         args=(args, stream, tracker, url, results, lambda: loop.call_soon_threadsafe(stop.set)),
+                         name="load-generator", daemon=True).start()
+        await webserver.serve(app, "127.0.0.1", args.port, HOOK_PATH, url, stop=stop, on_listen=startup.on_listen)
+
+    print(f"webhook {url}, concurrent_updates={bot_main.CONCURRENT_UPDATES}, "
+          f"ступени {args.rates} × {args.duration:g} с")
+    for name, p in fakes.profiles.items():
+        print(f"  {name:<9} latency={p.latency}s ±{p.jitter}s, errors={p.error_rate:.0%}, payload={p.payload}")
+    print(HEADER)
+    try:
+        asyncio.run(serve())
+    finally:
+        bot_api.stop()
+
+    if results:
+        print("\nхендлер по видам апдейтов (последняя ступень), мс p50/p95/n:")
+        for kind, (p50, p95, n) in results[-1]["by_kind"].items():
+            print(f"  {kind:<16}{p50:>9}{p95:>9}{n:>6}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# bench/parse_due_bench.py
+"""
+Корпус и микро-бенчмарк для logic.parse_due_ex.
+
+    python -m bench.parse_due_bench [--n 20000]
+
+Сначала сверяет разбор всех фраз корпуса с ожидаемыми значениями (дата
+относительно фиксированного «сегодня» — воскресенье 18.10.2026), затем
+замеряет холодный (без кеша) и тёплый (из lru_cache) разбор и, для
+сравнения, исходную цепочку проверок.
+"""
+import argparse
+import datetime as dt
+import re
+import sys
+import time
+
+import logic
+
+TODAY = dt.date(2026, 10, 18)  # воскресенье
+
+# фраза -> (дата "YYYY-MM-DD" или "", время "HH:MM" или "")
+CORPUS = [
+    ("купить картошку #семья завтра", "2026-10-19", ""),
+    ("послезавтра позвонить поставщику", "2026-10-20", ""),
+    ("сегодня", "2026-10-18", ""),
+    ("сегодня в 19:00 планёрка", "2026-10-18", "19:00"),
+    ("к 10:30 завтра отчёт", "2026-10-19", "10:30"),
+    ("через 3 дня", "2026-10-21", ""),
+    ("через день", "2026-10-19", ""),
+    ("через пару дней", "2026-10-20", ""),
+    ("через неделю", "2026-10-25", ""),
+    ("через две недели", "2026-11-01", ""),
+    ("через 2 недели", "2026-11-01", ""),
+    ("через месяц", "2026-11-18", ""),
+    ("к пятнице", "2026-10-23", ""),
+    ("в понедельник", "2026-10-19", ""),
+    ("во вторник", "2026-10-20", ""),
+    ("в среду", "2026-10-21", ""),
+    ("до четверга", "2026-10-22", ""),
+    ("в субботу", "2026-10-24", ""),
+    ("в воскресенье", "2026-10-18", ""),
+    ("в следующую пятницу", "2026-10-23", ""),
+    ("в пн", "2026-10-19", ""),
+    ("на следующей неделе", "2026-10-19", ""),
+    ("в выходные", "2026-10-18", ""),
+    ("25.12", "2026-12-25", ""),
+    ("25.12.2026", "2026-12-25", ""),
+    ("1/11/27", "2027-11-01", ""),
+    ("5 октября", "2027-10-05", ""),
+    ("5 окт 2027", "2027-10-05", ""),
+    ("2026-11-03", "2026-11-03", ""),
+    ("инвентаризация 30 ноября в 9:15", "2026-11-30", "09:15"),
+    ("в 7 вечера", "2026-10-18", "19:00"),
+    ("в 8 утра", "2026-10-18", "08:00"),
+    ("в 19 ч", "2026-10-18", "19:00"),
+    ("в 2 часа дня", "2026-10-18", "14:00"),
+    ("завтра в 9 часов утра", "2026-10-19", "09:00"),
+    ("12.03", "2027-03-12", ""),
+    ("18 октября", "2026-10-18", ""),
+    ("31.02", "", ""),
+    ("1.5.2027", "2027-05-01", ""),
+    ("до 3 марта", "2027-03-03", ""),
+    ("12 сент.", "2027-09-12", ""),
+    ("купить 2 мартини", "", ""),
+    ("взять 2 майонеза", "", ""),
+    ("заказать 5 декораций", "", ""),
+    ("купить 3 марки", "", ""),
+    ("повысить цену на 1.5", "", ""),
+    ("среди ночи", "", ""),
+    ("средний чек поднять", "", ""),
+    ("просто идея без срока", "", ""),
+    ("", "", ""),
+]
+
+
+def _legacy(text):
+    """Исходная реализация parse_due — для сравнения скорости."""
+    text = (text or "").lower()
+    today = TODAY
+    if "сегодня" in text: return today.isoformat()
+    if "завтра" in text: return (today + dt.timedelta(days=1)).isoformat()
+    if "послезавтра" in text: return (today + dt.timedelta(days=2)).isoformat()
+    m = re.search(r"через\s+(\d+)\s+д", text)
+    if m: return (today + dt.timedelta(days=int(m.group(1)))).isoformat()
+    for fmt in ("%d.%m.%Y", "%d.%m"):
+        try:
+            d = dt.datetime.strptime(text, fmt)
+            if fmt == "%d.%m": d = d.replace(year=today.year)
+            return d.date().isoformat()
+        except: pass
+    return ""
+
+
+def check() -> int:
+    failures = 0
+    for text, want_date, want_time in CORPUS:
+        due = logic.parse_due_ex(text, TODAY)
+        got_date = due.date.isoformat() if due.date else ""
+        got_time = due.time.strftime("%H:%M") if due.time else ""
+        if (got_date, got_time) != (want_date, want_time):
+            failures += 1
+            print(f"FAIL {text!r}: {got_date or '—'} {got_time or '—'}, ожидалось {want_date or '—'} {want_time or '—'}")
+    print(f"corpus: {len(CORPUS) - failures}/{len(CORPUS)} ok")
+    return failures
+
+
+def _timeit(fn, n: int) -> float:
+    phrases = [text for text, _, _ in CORPUS]
+    started = time.perf_counter()
+    for i in range(n):
+        fn(phrases[i % len(phrases)])
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def bench(n: int) -> None:
+    def cold(text):
+        logic._parse.cache_clear()
+        return logic.parse_due_ex(text, TODAY)
+
+    results = {
+        "parse_due_ex (без кеша)": _timeit(cold, n),
+        "parse_due_ex (кеш)": _timeit(lambda t: logic.parse_due_ex(t, TODAY), n),
+        "старый parse_due": _timeit(_legacy, n),
+    }
+    for name, us in results.items():
+        print(f"{name:<26} {us:8.2f} мкс/вызов")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=20000, help="число вызовов на замер")
+    args = ap.parse_args()
+    failures = check()
+    bench(args.n)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+# bench/startup_bench.py
+"""
+Холодный старт воркера: отложенные импорты (LAZY_IMPORTS=1) против
+прежнего жадного импорта (LAZY_IMPORTS=0).
+
+    python -m bench.startup_bench
+    python -m bench.startup_bench --runs 7 --top 20
+    python -m bench.startup_bench --modes lazy --no-warmup
+
+Каждый прогон — отдельный процесс (холодный интерпретатор, .pyc уже
+скомпилированы) с подделками из bench/fakes.py:
+
+  import   — import main;
+  build    — main.build_app();
+  listen   — от serve() до открытого порта (initialize, getMe, post_init);
+  first    — от открытого порта до ответа на первый /start;
+  TTFR     — сумма: время до первого ответа без учёта запуска интерпретатора
+             и подготовки подделок;
+  /status  — первый /status сразу после этого (Sheets + GPT: сюда
+             переезжает цена отложенных импортов, если прогрев не успел).
+
+Затем разбивка python -X importtime -c "import main" по пакетам верхнего
+уровня (собственное время модулей, мс) для каждого режима.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+from typing import Dict, List
+
+MODES = {"lazy": "1", "eager": "0"}
+STAGES = ("import_ms", "build_ms", "listen_ms", "first_ms", "ttfr_ms", "status_ms")
+HOOK_PATH = "bench-hook"
+
+
+def _env(mode: str, warmup: bool) -> Dict[str, str]:
+    from bench import fakes as F  # только в родительском процессе
+
+    env = dict(os.environ)
+    env.update(F.FAKE_ENV)
+    for key, value in F.FAKE_DEFAULTS.items():
+        env.setdefault(key, value)
+    env["LAZY_IMPORTS"] = MODES[mode]
+    env["WARMUP"] = "1" if warmup else "0"
+    return env
+
+
+# ── Дочерний процесс ───────────────────────────────────────────────
+def child(port: int) -> None:
+    started = time.perf_counter()
+    import main as bot_main
+    imported = time.perf_counter()
+
+    import asyncio
+    import logging
+    import httpx
+    import startup
+    import webserver
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from bench import fakes as F
+    from bench.load_replay import UpdateFactory
+
+    logging.basicConfig(level=logging.WARNING)
+    fakes = F.Fakes()
+    for p in fakes.profiles.values():
+        p.latency = p.jitter = p.interval = 0.0
+    F.install(fakes)
+    bot_api = F.FakeBotAPI(fakes).start()
+
+    built_from = time.perf_counter()
+    app = bot_main.build_app(base_url=bot_api.base_url, base_file_url=bot_api.base_file_url)
+    built = time.perf_counter()
+
+    done: Dict[int, float] = {}
+
+    async def finished(update: Update, context) -> None:
+        done[update.update_id] = time.perf_counter()
+
+    app.add_handler(TypeHandler(Update, finished), group=100)
+    factory = UpdateFactory(1, 0)
+    url = f"http://127.0.0.1:{port}/{HOOK_PATH}"
+    marks: Dict[str, float] = {}
+
+    def on_listen(application) -> None:
+        marks["listen"] = time.perf_counter()
+        startup.on_listen(application)
+
+    async def probe(stop: asyncio.Event) -> None:
+        async with httpx.AsyncClient(timeout=30) as client:
+            while "listen" not in marks:
+                await asyncio.sleep(0.001)
+            for n, kind in enumerate(("start", "status"), 1):
+                update = factory.make(kind)
+                update.pop("_kind")
+                update["update_id"] = n
+                sent = time.perf_counter()
+                await client.post(url, json=update)
+                while n not in done:
+                    await asyncio.sleep(0.001)
+                marks[kind] = done[n] - sent
+        stop.set()
+
+    async def run() -> None:
+        stop = asyncio.Event()
+        marks["serve"] = time.perf_counter()
+        task = asyncio.ensure_future(probe(stop))
+        await webserver.serve(app, "127.0.0.1", port, HOOK_PATH, url, stop=stop, on_listen=on_listen)
+        await task
+
+    try:
+        asyncio.run(run())
+    finally:
+        bot_api.stop()
+
+    ms = lambda s: round(s * 1000, 1)  # noqa: E731
+    result = {
+        "import_ms": ms(imported - started),
+        "build_ms": ms(built - built_from),
+        "listen_ms": ms(marks["listen"] - marks["serve"]),
+        "first_ms": ms(marks["start"]),
+        "status_ms": ms(marks["status"]),
+        "pending": startup.stats()["pending"],
+    }
+    result["ttfr_ms"] = round(result["import_ms"] + result["build_ms"] + result["listen_ms"] + result["first_ms"], 1)
+    print(json.dumps(result))
+
+
+# ── Родительский процесс ───────────────────────────────────────────
+def _run_child(mode: str, warmup: bool, port: int) -> Dict:
+    out = subprocess.run(
+        [sys.executable, "-m", "bench.startup_bench", "--child", "--port", str(port)],
+        env=_env(mode, warmup), capture_output=True, text=True, timeout=120,
+    )
+    if out.returncode != 0:
+        raise RuntimeError(f"{mode}: child failed\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def importtime(mode: str) -> Dict[str, float]:
+    """Собственное время импорта по пакетам верхнего уровня, мс."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=_env(mode, False), capture_output=True, text=True, timeout=120,
+    )
+    packages: Dict[str, float] = defaultdict(float)
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1000
+    return dict(packages)
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5, help="процессов на режим (медиана)")
+    ap.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["eager", "lazy"])
+    ap.add_argument("--no-warmup", action="store_true", help="WARMUP=0: без фонового прогрева после старта")
+    ap.add_argument("--top", type=int, default=12, help="строк в разбивке -X importtime")
+    ap.add_argument("--port", type=int, default=8791)
+    ap.add_argument("--json", metavar="PATH", help="сохранить результаты в JSON")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return ap.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.child:
+        child(args.port)
+        return 0
+
+    results: Dict[str, Dict] = {}
+    print(f"{'режим':<8}" + "".join(f"{s[:-3]:>10}" for s in STAGES) + "   (мс, медиана)")
+    for mode in args.modes:
+        _run_child(mode, not args.no_warmup, args.port)  # прогрев .pyc и файлового кеша
+        runs: List[Dict] = [_run_child(mode, not args.no_warmup, args.port) for _ in range(args.runs)]
+        median = {s: round(statistics.median(r[s] for r in runs), 1) for s in STAGES}
+        results[mode] = {"median": median, "runs": runs}
+        print(f"{mode:<8}" + "".join(f"{median[s]:>10}" for s in STAGES))
+
+    print("\n-X importtime, собственное время по пакетам (мс):")
+    breakdown = {mode: importtime(mode) for mode in args.modes}
+    names = sorted({n for b in breakdown.values() for n in b},
+                   key=lambda n: -max(b.get(n, 0.0) for b in breakdown.values()))[:args.top]
+    print(f"{'пакет':<28}" + "".join(f"{m:>10}" for m in args.modes))
+    for name in names:
+        print(f"{name:<28}" + "".join(f"{breakdown[m].get(name, 0.0):>10.1f}" for m in args.modes))
+    print(f"{'всего':<28}" + "".join(f"{sum(breakdown[m].values()):>10.1f}" for m in args.modes))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "importtime": breakdown}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
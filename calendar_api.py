@@ -1,25 +1,30 @@
 import os
 import json
+import time
 import datetime as dt
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple
 
 from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 from dateutil import tz as _tz
 
+import google_clients
+from resilience import CALENDAR, classify
+
 # Читаем дефолты из окружения (можно переопределять аргументами функций)
 CALENDAR_ID = os.getenv("CALENDAR_ID", "").strip()
 CREDS_INPUT = os.getenv("GOOGLE_CREDENTIALS_JSON", "").strip()
 TZ = os.getenv("TZ", "Europe/Berlin")
+SCOPES = ["https://www.googleapis.com/auth/calendar"]
+# Вставок в одном batch-запросе (Google принимает не больше 50)
+CALENDAR_BATCH_SIZE = int(os.getenv("CALENDAR_BATCH_SIZE", "50"))
 
 
-def _load_credentials(creds_input: str) -> Credentials:
+def _load_credentials(creds_input: str, scopes=SCOPES) -> Credentials:
     """
     Принимает либо путь к JSON-файлу сервис-аккаунта,
     либо «цельный» JSON-текст (как в Render Environment).
     Возвращает объект Credentials.
     """
-    scopes = ["https://www.googleapis.com/auth/calendar"]
     if not creds_input:
         raise RuntimeError("GOOGLE_CREDENTIALS_JSON is empty")
 
@@ -36,8 +41,11 @@ def _load_credentials(creds_input: str) -> Credentials:
 
 
 def _service(creds_input: Optional[str] = None):
-    creds = _load_credentials(creds_input or CREDS_INPUT)
-    return build("calendar", "v3", credentials=creds)
+    """Сервис Calendar из общего реестра (учётка и discovery — один раз на поток)."""
+    creds_input = creds_input or CREDS_INPUT
+    if not creds_input:
+        raise RuntimeError("GOOGLE_CREDENTIALS_JSON is empty")
+    return google_clients.calendar_service(creds_input, SCOPES, _load_credentials)
 
 
 def _to_rfc3339(dt_obj: dt.datetime) -> str:
@@ -51,6 +59,32 @@ def _to_rfc3339(dt_obj: dt.datetime) -> str:
     return dt_obj.astimezone(dt.timezone.utc).isoformat().replace("+00:00", "Z")
 
 
+def list_events_page(
+    calendar_id: str,
+    creds_input: str,
+    dt_from: dt.datetime,
+    dt_to: dt.datetime,
+    page_size: int = 100,
+    page_token: Optional[str] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Одна страница событий интервала [dt_from, dt_to) по возрастанию начала
+    и токен следующей (None — страница последняя).
+    """
+    svc = _service(creds_input)
+    request = svc.events().list(
+        calendarId=calendar_id,
+        timeMin=_to_rfc3339(dt_from),
+        timeMax=_to_rfc3339(dt_to),
+        singleEvents=True,
+        orderBy="startTime",
+        maxResults=page_size,
+        pageToken=page_token,
+    )
+    resp = CALENDAR.call("list", request.execute)
+    return resp.get("items", []), resp.get("nextPageToken")
+
+
 def list_events_between(
     calendar_id: str,
     creds_input: str,
@@ -64,23 +98,60 @@ def list_events_between(
       - calendar_id: ID календаря (…@group.calendar.google.com)
       - creds_input: путь к файлу или «цельный» JSON сервис-аккаунта
     """
+    return list_events_page(calendar_id, creds_input, dt_from, dt_to, max_results)[0]
+
+
+def freebusy(
+    calendar_ids: Sequence[str],
+    creds_input: str,
+    dt_from: dt.datetime,
+    dt_to: dt.datetime,
+) -> List[Tuple[dt.datetime, dt.datetime]]:
+    """Занятые интервалы всех календарей в [dt_from, dt_to) одним запросом freebusy.query."""
     svc = _service(creds_input)
-    time_min = _to_rfc3339(dt_from)
-    time_max = _to_rfc3339(dt_to)
-
-    resp = (
-        svc.events()
-        .list(
-            calendarId=calendar_id,
-            timeMin=time_min,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy="startTime",
-            maxResults=max_results,
-        )
-        .execute()
-    )
-    return resp.get("items", [])
+    body = {
+        "timeMin": _to_rfc3339(dt_from),
+        "timeMax": _to_rfc3339(dt_to),
+        "items": [{"id": cid} for cid in calendar_ids],
+    }
+    resp = CALENDAR.call("freebusy", svc.freebusy().query(body=body).execute)
+    out = []
+    for cid, info in resp.get("calendars", {}).items():
+        if info.get("errors"):
+            raise RuntimeError(f"freebusy {cid}: {info['errors'][0].get('reason', 'error')}")
+        for b in info.get("busy", []):
+            out.append((
+                dt.datetime.fromisoformat(b["start"].replace("Z", "+00:00")),
+                dt.datetime.fromisoformat(b["end"].replace("Z", "+00:00")),
+            ))
+    return out
+
+
+def _event_body(
+    summary: str,
+    minutes: int = 60,
+    start_dt: Optional[dt.datetime] = None,
+    description: str = "",
+) -> Dict:
+    """Тело events.insert; без start_dt — завтра 06:00 по TZ, «наивный» start_dt — в TZ."""
+    # Старт по умолчанию — завтра 06:00 локальной TZ
+    local_tz = _tz.gettz(TZ or "Europe/Berlin")
+    now_local = dt.datetime.now(local_tz)
+    if start_dt is None:
+        start_dt = (now_local + dt.timedelta(days=1)).replace(hour=6, minute=0, second=0, microsecond=0)
+    elif start_dt.tzinfo is None:
+        start_dt = start_dt.replace(tzinfo=local_tz)
+
+    end_dt = start_dt + dt.timedelta(minutes=int(minutes))
+
+    # str(tzinfo) у dateutil — "tzfile('...')", а API ждёт имя IANA; смещение и так в dateTime
+    zone = {"timeZone": TZ} if start_dt.tzinfo is local_tz else {}
+    return {
+        "summary": summary,
+        "description": description,
+        "start": {"dateTime": start_dt.isoformat(), **zone},
+        "end": {"dateTime": end_dt.isoformat(), **zone},
+    }
 
 
 def add_event(
@@ -101,32 +172,74 @@ def add_event(
         raise RuntimeError("CALENDAR_ID is not set")
 
     svc = _service(creds_input or CREDS_INPUT)
+    body = _event_body(summary, minutes, start_dt, description)
+    created = CALENDAR.call("insert", svc.events().insert(calendarId=cid, body=body).execute)
 
-    # Старт по умолчанию — завтра 06:00 локальной TZ
-    local_tz = _tz.gettz(TZ or "Europe/Berlin")
-    now_local = dt.datetime.now(local_tz)
-    if start_dt is None:
-        start_dt = (now_local + dt.timedelta(days=1)).replace(hour=6, minute=0, second=0, microsecond=0)
-    elif start_dt.tzinfo is None:
-        start_dt = start_dt.replace(tzinfo=local_tz)
+    # write-through в локальное хранилище событий (если оно уже загружено)
+    from calendar_cache import record_event
+    record_event(cid, creds_input, created)
+    return created
 
-    end_dt = start_dt + dt.timedelta(minutes=int(minutes))
 
-    body = {
-        "summary": summary,
-        "description": description,
-        "start": {
-            "dateTime": start_dt.isoformat(),
-            "timeZone": str(start_dt.tzinfo) if start_dt.tzinfo else TZ,
-        },
-        "end": {
-            "dateTime": end_dt.isoformat(),
-            "timeZone": str(end_dt.tzinfo) if end_dt.tzinfo else TZ,
-        },
-    }
+def add_events(
+    events: Sequence[Dict],
+    calendar_id: Optional[str] = None,
+    creds_input: Optional[str] = None,
+    batch_size: int = CALENDAR_BATCH_SIZE,
+) -> List[Tuple[Optional[Dict], Optional[Exception]]]:
+    """
+    Создаёт несколько событий: элементы — аргументы add_event (summary,
+    minutes, start_dt, description). Вставки уходят batch-запросами по
+    batch_size штук — ceil(N / 50) запросов вместо N.
+    Возвращает в порядке входа (созданное событие, None) или (None, ошибка).
+    """
+    cid = (calendar_id or CALENDAR_ID).strip()
+    if not cid:
+        raise RuntimeError("CALENDAR_ID is not set")
 
-    created = svc.events().insert(calendarId=cid, body=body).execute()
-    return created
+    svc = _service(creds_input or CREDS_INPUT)
+    bodies = [_event_body(**item) for item in events]
+    results: List[Tuple[Optional[Dict], Optional[Exception]]] = [(None, None)] * len(bodies)
+
+    def done(request_id, response, exception):
+        results[int(request_id)] = (None, exception) if exception is not None else (response, None)
+
+    def insert(chunk: Sequence[int]) -> None:
+        try:
+            if len(chunk) == 1:
+                i = chunk[0]
+                done(i, CALENDAR.call("insert", svc.events().insert(calendarId=cid, body=bodies[i]).execute), None)
+                return
+            batch = svc.new_batch_http_request(callback=done)
+            for i in chunk:
+                batch.add(svc.events().insert(calendarId=cid, body=bodies[i]), request_id=str(i))
+            # каждая вставка пакета — отдельный запрос для квоты; ошибки отдельных
+            # вставок приходят в done(), сюда — только сбой всего запроса
+            CALENDAR.call("insert_batch", batch.execute, cost=len(chunk))
+        except Exception as e:
+            for i in chunk:
+                if results[i] == (None, None):
+                    results[i] = (None, e)
+
+    size = max(1, min(batch_size, 50))
+    pending = list(range(len(bodies)))
+    for attempt in range(CALENDAR.retries + 1):
+        for lo in range(0, len(pending), size):
+            insert(pending[lo:lo + size])
+        # вставки, отклонённые лимитом (429 / rateLimitExceeded), не выполнены — повторяем их
+        limited = [i for i in pending if results[i][1] is not None and classify(results[i][1]) == "rate"]
+        if not limited or attempt == CALENDAR.retries:
+            break
+        time.sleep(max(CALENDAR.backoff(attempt, results[i][1]) for i in limited))
+        for i in limited:
+            results[i] = (None, None)
+        pending = limited
+
+    from calendar_cache import record_event
+    for created, _ in results:
+        if created is not None:
+            record_event(cid, creds_input, created)
+    return results
 
 
 def pretty_events(events: List[Dict]) -> str:
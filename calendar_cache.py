@@ -0,0 +1,279 @@
+# calendar_cache.py
+"""
+Локальное хранилище событий календаря с инкрементальной синхронизацией.
+
+Первый запрос загружает окно [сейчас − LOOKBACK, сейчас + HORIZON] целиком
+и получает nextSyncToken; дальше не чаще раза в CALENDAR_SYNC_INTERVAL
+секунд по syncToken приходят только изменения. На 410 Gone (токен протух)
+делается полная пересинхронизация. Виды «день / неделя / месяц» читаются
+из памяти; add_event дописывает созданное событие сюда же.
+"""
+import os
+import time
+import bisect
+import hashlib
+import logging
+import threading
+import datetime as dt
+from typing import Dict, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+import calendar_api
+from calendar_time import aware as _aware, parse_when as _parse_when
+from resilience import CALENDAR
+
+CALENDAR_SYNC_INTERVAL = float(os.getenv("CALENDAR_SYNC_INTERVAL", "30"))
+CALENDAR_LOOKBACK_DAYS = int(os.getenv("CALENDAR_LOOKBACK_DAYS", "7"))
+CALENDAR_HORIZON_DAYS = int(os.getenv("CALENDAR_HORIZON_DAYS", "120"))
+# Раз в сутки окно сдвигается полной пересинхронизацией
+CALENDAR_FULL_RESYNC = float(os.getenv("CALENDAR_FULL_RESYNC", "86400"))
+
+log = logging.getLogger(__name__)
+
+
+class CalendarStore:
+    def __init__(self, calendar_id: str, creds_input: str):
+        self.calendar_id = calendar_id
+        self.creds_input = creds_input
+
+        self._events: Dict[str, Dict] = {}
+        self._spans: Dict[str, Tuple[dt.datetime, dt.datetime]] = {}
+        self._index: Optional[List[Tuple[dt.datetime, str]]] = None
+        self._max_span = dt.timedelta(0)
+        self.version = 0  # растёт при каждом изменении набора событий (кеши поверх хранилища)
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+
+        self._sync_token: Optional[str] = None
+        self._window: Optional[Tuple[dt.datetime, dt.datetime]] = None
+        self._last_sync = 0.0
+        self._last_full = 0.0
+
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.deltas = 0
+        self.resyncs_410 = 0
+
+    # ── синхронизация ──────────────────────────────────────────────
+    def _list_pages(self, **params) -> Tuple[List[Dict], Optional[str]]:
+        svc = calendar_api._service(self.creds_input)
+        items: List[Dict] = []
+        page_token = None
+        while True:
+            request = svc.events().list(
+                calendarId=self.calendar_id, singleEvents=True, maxResults=2500, pageToken=page_token, **params
+            )
+            resp = CALENDAR.call("sync", request.execute)
+            items.extend(resp.get("items", []))
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                return items, resp.get("nextSyncToken")
+
+    def full_sync(self) -> None:
+        now = dt.datetime.now(dt.timezone.utc)
+        window = (now - dt.timedelta(days=CALENDAR_LOOKBACK_DAYS), now + dt.timedelta(days=CALENDAR_HORIZON_DAYS))
+        items, token = self._list_pages(
+            timeMin=calendar_api._to_rfc3339(window[0]),
+            timeMax=calendar_api._to_rfc3339(window[1]),
+        )
+        with self._lock:
+            self._events.clear()
+            self._spans.clear()
+            self._max_span = dt.timedelta(0)
+            for e in items:
+                self._put(e)
+            self._index = None
+            self.version += 1
+            self._sync_token = token
+            self._window = window
+            self._last_sync = self._last_full = time.monotonic()
+        self.full_syncs += 1
+        log.info("Calendar %s: full sync, %d events", self.calendar_id, len(items))
+
+    def incremental_sync(self) -> None:
+        try:
+            items, token = self._list_pages(syncToken=self._sync_token)
+        except HttpError as e:
+            if getattr(e.resp, "status", None) == 410:
+                # syncToken больше не действителен — начинаем заново
+                self.resyncs_410 += 1
+                log.info("Calendar %s: sync token expired, full resync", self.calendar_id)
+                self.full_sync()
+                return
+            raise
+        with self._lock:
+            for e in items:
+                if e.get("status") == "cancelled":
+                    self._drop(e.get("id"))
+                else:
+                    self._put(e)
+            if items:
+                self._index = None
+                self.version += 1
+            self._sync_token = token or self._sync_token
+            self._last_sync = time.monotonic()
+        self.incremental_syncs += 1
+        self.deltas += len(items)
+
+    def sync(self, force: bool = False) -> None:
+        """Догоняет сервер, если данные старше CALENDAR_SYNC_INTERVAL."""
+        with self._sync_lock:
+            now = time.monotonic()
+            if self._sync_token is None or now - self._last_full >= CALENDAR_FULL_RESYNC:
+                self.full_sync()
+            elif force or now - self._last_sync >= CALENDAR_SYNC_INTERVAL:
+                self.incremental_sync()
+
+    # ── хранилище ──────────────────────────────────────────────────
+    def _put(self, event: Dict) -> None:
+        eid = event.get("id")
+        start = _parse_when(event.get("start"))
+        if not eid or start is None:
+            return
+        end = _parse_when(event.get("end")) or start
+        self._events[eid] = event
+        self._spans[eid] = (start, end)
+        self._max_span = max(self._max_span, end - start)
+
+    def _drop(self, eid: Optional[str]) -> None:
+        self._events.pop(eid, None)
+        self._spans.pop(eid, None)
+
+    def _sorted(self) -> List[Tuple[dt.datetime, str]]:
+        if self._index is None:
+            self._index = sorted((span[0], eid) for eid, span in self._spans.items())
+        return self._index
+
+    def covers(self, dt_from: dt.datetime, dt_to: dt.datetime) -> bool:
+        w = self._window
+        return w is not None and w[0] <= _aware(dt_from) and _aware(dt_to) <= w[1]
+
+    def upsert(self, event: Dict) -> None:
+        """Write-through для созданных/изменённых нами событий."""
+        with self._lock:
+            self._put(event)
+            self._index = None
+            self.version += 1
+
+    def events_between(
+        self, dt_from: dt.datetime, dt_to: dt.datetime, max_results: int = 100, offset: int = 0
+    ) -> List[Dict]:
+        """
+        События, пересекающие [dt_from, dt_to), по возрастанию начала —
+        так же, как events.list(singleEvents=True, orderBy="startTime").
+        offset — сколько первых совпадений пропустить (постраничное чтение).
+        """
+        self.sync()
+        lo_t, hi_t = _aware(dt_from), _aware(dt_to)
+        with self._lock:
+            index = self._sorted()
+            # начало может быть раньше dt_from, если событие ещё идёт
+            lo = bisect.bisect_left(index, (lo_t - self._max_span,))
+            hi = bisect.bisect_left(index, (hi_t,))
+            out = []
+            for _, eid in index[lo:hi]:
+                if self._spans[eid][1] > lo_t:
+                    if offset:
+                        offset -= 1
+                        continue
+                    out.append(self._events[eid])
+                    if len(out) >= max_results:
+                        break
+        return out
+
+    def busy_between(self, dt_from: dt.datetime, dt_to: dt.datetime) -> List[Tuple[dt.datetime, dt.datetime]]:
+        """Интервалы занятости в [dt_from, dt_to): события, кроме «свободных» (transparency)."""
+        self.sync()
+        lo_t, hi_t = _aware(dt_from), _aware(dt_to)
+        with self._lock:
+            index = self._sorted()
+            lo = bisect.bisect_left(index, (lo_t - self._max_span,))
+            hi = bisect.bisect_left(index, (hi_t,))
+            return [
+                self._spans[eid] for _, eid in index[lo:hi]
+                if self._spans[eid][1] > lo_t and self._events[eid].get("transparency") != "transparent"
+            ]
+
+    def stats(self) -> Dict:
+        return {
+            "events": len(self._events),
+            "full_syncs": self.full_syncs,
+            "incremental_syncs": self.incremental_syncs,
+            "deltas": self.deltas,
+            "resyncs_410": self.resyncs_410,
+            "age_s": round(time.monotonic() - self._last_sync, 1) if self._last_sync else None,
+        }
+
+
+# ── реестр хранилищ ────────────────────────────────────────────────
+_stores: Dict[Tuple[str, str], CalendarStore] = {}
+_stores_lock = threading.Lock()
+# токены страниц, прочитанных из памяти (list_events_page)
+_STORE_TOKEN = "store:"
+
+
+def _store_key(calendar_id: str, creds_input: str) -> Tuple[str, str]:
+    return calendar_id, hashlib.sha256(str(creds_input).encode("utf-8")).hexdigest()
+
+
+def get_store(calendar_id: str, creds_input: Optional[str] = None) -> CalendarStore:
+    creds_input = creds_input or calendar_api.CREDS_INPUT
+    key = _store_key(calendar_id, creds_input)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = CalendarStore(calendar_id, creds_input)
+    return store
+
+
+def list_events_between(
+    calendar_id: str,
+    creds_input: str,
+    dt_from: dt.datetime,
+    dt_to: dt.datetime,
+    max_results: int = 100,
+) -> List[Dict]:
+    """
+    То же, что calendar_api.list_events_between, но из локального хранилища.
+    Запросы за пределами синхронизируемого окна уходят напрямую в API.
+    """
+    store = get_store(calendar_id, creds_input)
+    store.sync()
+    if not store.covers(dt_from, dt_to):
+        return calendar_api.list_events_between(calendar_id, creds_input, dt_from, dt_to, max_results)
+    return store.events_between(dt_from, dt_to, max_results)
+
+
+def list_events_page(
+    calendar_id: str,
+    creds_input: str,
+    dt_from: dt.datetime,
+    dt_to: dt.datetime,
+    page_size: int = 100,
+    page_token: Optional[str] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Как calendar_api.list_events_page, но из локального хранилища: токен
+    страницы — "store:<сдвиг>". Окно за пределами хранилища — в API.
+    """
+    store = get_store(calendar_id, creds_input)
+    if page_token is None:
+        store.sync()
+    from_store = page_token.startswith(_STORE_TOKEN) if page_token else store.covers(dt_from, dt_to)
+    if not from_store:
+        return calendar_api.list_events_page(calendar_id, creds_input, dt_from, dt_to, page_size, page_token)
+    offset = int(page_token[len(_STORE_TOKEN):]) if page_token else 0
+    items = store.events_between(dt_from, dt_to, page_size + 1, offset)
+    if len(items) > page_size:
+        return items[:page_size], f"{_STORE_TOKEN}{offset + page_size}"
+    return items, None
+
+
+def record_event(calendar_id: str, creds_input: Optional[str], event: Dict) -> None:
+    """Дописывает событие в хранилище, если оно уже загружено."""
+    creds_input = creds_input or calendar_api.CREDS_INPUT
+    with _stores_lock:
+        store = _stores.get(_store_key(calendar_id, creds_input))
+    if store is not None:
+        store.upsert(event)
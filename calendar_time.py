@@ -0,0 +1,36 @@
+# calendar_time.py
+"""
+Время событий Google Calendar без зависимостей от клиента API: общий
+разбор для хранилища (calendar_cache) и видов по нескольким календарям
+(calendar_views), в том числе на пути cached=False.
+"""
+import os
+import datetime as dt
+from typing import Dict, Optional
+
+from dateutil import tz as _tz
+
+TZ = os.getenv("TZ", "Europe/Berlin")
+
+
+def local_tz():
+    return _tz.gettz(TZ or "Europe/Berlin")
+
+
+def parse_when(part: Dict) -> Optional[dt.datetime]:
+    """start/end события → aware datetime (all-day — полночь в локальной TZ)."""
+    if not part:
+        return None
+    if part.get("dateTime"):
+        return dt.datetime.fromisoformat(part["dateTime"].replace("Z", "+00:00"))
+    if part.get("date"):
+        d = dt.date.fromisoformat(part["date"])
+        return dt.datetime(d.year, d.month, d.day, tzinfo=local_tz())
+    return None
+
+
+def aware(value: dt.datetime) -> dt.datetime:
+    # «наивные» даты трактуем так же, как calendar_api._to_rfc3339
+    if value.tzinfo is None:
+        return value.replace(tzinfo=local_tz())
+    return value
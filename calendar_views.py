@@ -0,0 +1,142 @@
+# calendar_views.py
+"""
+Виды «день / неделя / месяц» по нескольким календарям сразу (брони бара,
+смены персонала, личный календарь — CALENDAR_IDS в main.py).
+
+  • первые страницы всех календарей запрашиваются параллельно (пул
+    потоков), так что время ответа — как у самого медленного календаря,
+    а не сумма;
+  • каждая страница уже отсортирована по началу — слияние k-way через
+    кучу, общие события (приглашение в нескольких календарях) — один раз;
+  • следующая страница календаря запрашивается, только когда его текущая
+    кончилась, а список ещё не набран: лишние календари не тянут лишних
+    событий.
+
+Страницы читаются через calendar_cache.list_events_page (из хранилища)
+или calendar_api.list_events_page (cached=False — напрямую из API).
+"""
+import os
+import heapq
+import asyncio
+import logging
+import datetime as dt
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import startup
+from calendar_time import parse_when
+from executors import run_blocking
+
+calendar_api = startup.lazy("calendar_api")
+calendar_cache = startup.lazy("calendar_cache")
+
+# Событий на страницу одного календаря
+CALENDAR_PAGE_SIZE = int(os.getenv("CALENDAR_PAGE_SIZE", "50"))
+
+_NO_START = dt.datetime.min.replace(tzinfo=dt.timezone.utc)
+
+log = logging.getLogger(__name__)
+
+
+def parse_ids(spec: str) -> List[str]:
+    """"a@group…, b@group…" → ["a@group…", "b@group…"] без пустых и повторов."""
+    out: List[str] = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if part and part not in out:
+            out.append(part)
+    return out
+
+
+def _start(event: Dict) -> dt.datetime:
+    return parse_when(event.get("start")) or _NO_START
+
+
+def _identity(event: Dict) -> Tuple:
+    # у приглашения в разных календарях общий iCalUID; у экземпляров
+    # повторяющегося события он тоже общий, поэтому ещё и начало — как
+    # момент времени: календари в разных поясах отдают разные смещения
+    return event.get("iCalUID") or event.get("id"), _start(event)
+
+
+class _Source:
+    """Постраничное чтение одного календаря."""
+
+    def __init__(self, calendar_id: str, creds_input: str, dt_from: dt.datetime, dt_to: dt.datetime,
+                 page_size: int, cached: bool):
+        self.calendar_id = calendar_id
+        self._args = (calendar_id, creds_input, dt_from, dt_to, page_size)
+        self._pages = calendar_cache if cached else calendar_api
+        self._items: List[Dict] = []
+        self._pos = 0
+        self._token: Optional[str] = None
+        self._done = False
+        self.pages = 0
+
+    async def load(self) -> None:
+        self._items, self._token = await run_blocking(self._pages.list_events_page, *self._args, self._token)
+        self._pos = 0
+        self._done = self._token is None
+        self.pages += 1
+
+    async def next(self) -> Optional[Dict]:
+        while self._pos >= len(self._items):
+            if self._done:
+                return None
+            await self.load()
+        item = self._items[self._pos]
+        self._pos += 1
+        return item
+
+
+async def list_events_between(
+    calendar_ids: Sequence[str],
+    creds_input: str,
+    dt_from: dt.datetime,
+    dt_to: dt.datetime,
+    max_results: int = 100,
+    cached: bool = True,
+    page_size: int = CALENDAR_PAGE_SIZE,
+) -> Tuple[List[Dict], Dict[str, Exception]]:
+    """
+    Не больше max_results событий всех календарей по возрастанию начала и
+    {calendar_id: ошибка} для календарей, которые не удалось прочитать.
+    Если не прочитался ни один — исключение первого.
+    """
+    page_size = max(1, min(page_size, max_results))
+    sources = [_Source(cid, creds_input, dt_from, dt_to, page_size, cached) for cid in calendar_ids]
+    results = await asyncio.gather(*(s.load() for s in sources), return_exceptions=True)
+
+    failed: Dict[str, Exception] = {}
+    heap = []
+    for n, (source, result) in enumerate(zip(sources, results)):
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                raise result  # CancelledError и т.п.
+            log.warning("Calendar %s: cannot list events: %r", source.calendar_id, result)
+            failed[source.calendar_id] = result
+            continue
+        first = await source.next()
+        if first is not None:
+            heap.append((_start(first), n, first))
+    if sources and len(failed) == len(sources):
+        raise next(iter(failed.values()))
+    heapq.heapify(heap)
+
+    out: List[Dict] = []
+    seen = set()
+    while heap and len(out) < max_results:
+        _, n, event = heapq.heappop(heap)
+        key = _identity(event)
+        if key not in seen:
+            seen.add(key)
+            out.append(event)
+        try:
+            following = await sources[n].next()
+        except Exception as e:
+            # уже полученное не выбрасываем — календарь просто обрывается
+            log.warning("Calendar %s: cannot read next page: %r", sources[n].calendar_id, e)
+            failed[sources[n].calendar_id] = e
+            continue
+        if following is not None:
+            heapq.heappush(heap, (_start(following), n, following))
+    return out, failed
@@ -0,0 +1,44 @@
+# executors.py
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Размер пула потоков под блокирующие вызовы (Sheets, Calendar)
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "8"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Общий пул потоков процесса (создаётся лениво при первом вызове)."""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, BOT_WORKERS),
+                    thread_name_prefix="bot-io",
+                )
+    return _executor
+
+
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Выполняет синхронную функцию в пуле потоков и ждёт результат,
+    не блокируя event loop python-telegram-bot.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown(wait: bool = True) -> None:
+    """Останавливает пул (вызывается при остановке приложения)."""
+    global _executor
+    with _lock:
+        ex, _executor = _executor, None
+    if ex is not None:
+        ex.shutdown(wait=wait)
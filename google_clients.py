@@ -0,0 +1,145 @@
+# google_clients.py
+"""
+Процессный реестр Google-клиентов.
+
+Ключ — (хеш учётных данных, scopes[, id таблицы/листа]). Учётки парсятся
+один раз, токен переиспользуется до истечения и обновляется заранее
+(за GOOGLE_TOKEN_REFRESH_MARGIN секунд), клиенты gspread, таблицы и листы
+кешируются. Сервис Calendar (httplib2 внутри) не потокобезопасен, поэтому
+он создаётся по одному на поток пула.
+"""
+import os
+import hashlib
+import datetime as dt
+import threading
+from typing import Callable, Dict, Sequence, Tuple
+
+import gspread
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build
+
+# За сколько секунд до истечения токена обновлять его заранее
+REFRESH_MARGIN = int(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+
+CredsKey = Tuple[str, Tuple[str, ...]]
+Loader = Callable[[str, Sequence[str]], object]
+
+_lock = threading.Lock()
+_refresh_locks: Dict[CredsKey, threading.Lock] = {}
+_credentials: Dict[CredsKey, object] = {}
+_gspread_clients: Dict[CredsKey, gspread.Client] = {}
+_spreadsheets: Dict[Tuple[CredsKey, str], gspread.Spreadsheet] = {}
+_worksheets: Dict[Tuple[CredsKey, str, str], gspread.Worksheet] = {}
+_local = threading.local()
+_generation = 0  # растёт при invalidate(): потоки пересоздают свои сервисы
+_auth_request = Request()
+
+
+def _key(creds_src: str, scopes: Sequence[str]) -> CredsKey:
+    digest = hashlib.sha256(str(creds_src).strip().encode("utf-8")).hexdigest()
+    return digest, tuple(sorted(scopes))
+
+
+def _needs_refresh(creds) -> bool:
+    if not getattr(creds, "token", None):
+        return True
+    expiry = getattr(creds, "expiry", None)  # naive UTC, как в google-auth
+    if expiry is None:
+        return False
+    return expiry - dt.datetime.utcnow() <= dt.timedelta(seconds=REFRESH_MARGIN)
+
+
+def get_credentials(creds_src: str, scopes: Sequence[str], loader: Loader):
+    """
+    Возвращает общий объект Credentials для (creds_src, scopes).
+    loader(creds_src, scopes) вызывается только при первом обращении.
+    """
+    key = _key(creds_src, scopes)
+    with _lock:
+        creds = _credentials.get(key)
+        if creds is None:
+            creds = loader(creds_src, scopes)
+            _credentials[key] = creds
+            _refresh_locks[key] = threading.Lock()
+        refresh_lock = _refresh_locks[key]
+
+    if _needs_refresh(creds):
+        with refresh_lock:
+            # другой поток мог уже обновить токен, пока мы ждали
+            if _needs_refresh(creds):
+                creds.refresh(_auth_request)
+    return creds
+
+
+# ── Google Sheets ──────────────────────────────────────────────────
+def gspread_client(creds_src: str, scopes: Sequence[str], loader: Loader) -> gspread.Client:
+    key = _key(creds_src, scopes)
+    creds = get_credentials(creds_src, scopes, loader)
+    with _lock:
+        gc = _gspread_clients.get(key)
+        if gc is None:
+            gc = gspread.authorize(creds)
+            _gspread_clients[key] = gc
+    return gc
+
+
+def spreadsheet(sheet_id: str, creds_src: str, scopes: Sequence[str], loader: Loader) -> gspread.Spreadsheet:
+    key = _key(creds_src, scopes)
+    gc = gspread_client(creds_src, scopes, loader)
+    sh = _spreadsheets.get((key, sheet_id))
+    if sh is None:
+        sh = gc.open_by_key(sheet_id)
+        with _lock:
+            sh = _spreadsheets.setdefault((key, sheet_id), sh)
+    return sh
+
+
+def worksheet(
+    sheet_id: str, creds_src: str, title: str, scopes: Sequence[str], loader: Loader
+) -> gspread.Worksheet:
+    key = _key(creds_src, scopes)
+    sh = spreadsheet(sheet_id, creds_src, scopes, loader)
+    ws = _worksheets.get((key, sheet_id, title))
+    if ws is None:
+        ws = sh.worksheet(title)
+        with _lock:
+            ws = _worksheets.setdefault((key, sheet_id, title), ws)
+    return ws
+
+
+# ── Google Calendar ────────────────────────────────────────────────
+def calendar_service(creds_src: str, scopes: Sequence[str], loader: Loader):
+    """Сервис Calendar v3: один на поток и набор учётных данных."""
+    key = _key(creds_src, scopes)
+    creds = get_credentials(creds_src, scopes, loader)
+    services = getattr(_local, "calendar", None)
+    if services is None or getattr(_local, "generation", None) != _generation:
+        services = _local.calendar = {}
+        _local.generation = _generation
+    svc = services.get(key)
+    if svc is None:
+        # static discovery-документ из пакета — без сетевого запроса
+        svc = build("calendar", "v3", credentials=creds, cache_discovery=False, static_discovery=True)
+        services[key] = svc
+    return svc
+
+
+def invalidate(creds_src: str = None) -> None:
+    """Сбрасывает кеш клиентов (целиком или для одних учётных данных)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        if creds_src is None:
+            _credentials.clear()
+            _refresh_locks.clear()
+            _gspread_clients.clear()
+            _spreadsheets.clear()
+            _worksheets.clear()
+            return
+        digest = _key(creds_src, ())[0]
+        for store in (_credentials, _refresh_locks, _gspread_clients):
+            for k in [k for k in store if k[0] == digest]:
+                store.pop(k, None)
+        for store in (_spreadsheets, _worksheets):
+            for k in [k for k in store if k[0][0] == digest]:
+                store.pop(k, None)
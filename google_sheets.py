@@ -1,6 +1,12 @@
-import os, json, base64, datetime
+import os, re, json, base64, datetime
 from google.oauth2.service_account import Credentials
-import gspread
+from gspread.utils import numericise_all, rowcol_to_a1
+
+import google_clients
+from resilience import SHEETS
+from sheet_cache import cache as _cache
+from sheet_mirror import mirror as _mirror
+from sheet_rows import Record, Table
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
 SHEET_INBOX = "09_Inbox_Ideas"
@@ -8,7 +14,22 @@ SHEET_OPS = "02_Operations_Sobranie"
 SHEET_KPI = "03_Finance_KPI"
 SHEET_EFF = "10_Effectiveness_Checklist"
 
-def _open(sheet_id: str, creds_src: str):
+# Какие колонки реально нужны боту (остальные не скачиваем)
+KPI_FIELDS = ("План_выручка", "Факт_выручка", "Средний_чек", "%_НГ_дат_продано")
+OPS_FIELDS = ("Категория", "Проект", "Задача", "Дедлайн", "Статус", "Приоритет", "Приоритет(1-3)", "Прогресс_%")
+# Колонки фильтра и сортировки задач — их же индексирует sheet_mirror
+STATUS_FIELD, DEADLINE_FIELD, CATEGORY_FIELD = "Статус", "Дедлайн", "Категория"
+ACTIVE_STATUSES = ("в работе", "не начато", "ожидание", "новая")
+# Колонка Inbox сразу за колонками inbox_row — ключ идемпотентности записи из журнала
+INBOX_KEY_COLUMN = "H"
+# Сколько последних строк KPI читать (для статуса нужна одна)
+KPI_TAIL_ROWS = int(os.getenv("KPI_TAIL_ROWS", "1"))
+
+# Листы локальной копии (sheet_mirror); в первые два только дописывают
+MIRROR_SHEETS = (SHEET_INBOX, SHEET_KPI, SHEET_OPS, SHEET_EFF)
+APPEND_ONLY_SHEETS = (SHEET_INBOX, SHEET_KPI)
+
+def _load_credentials(creds_src: str, scopes=SCOPES) -> Credentials:
     """
     creds_src может быть:
     - путём к файлу service_account.json
@@ -24,53 +45,208 @@ def _open(sheet_id: str, creds_src: str):
     # Вариант 1: это JSON-строка (начинается с "{")
     if s.startswith("{"):
         info = json.loads(s)
-        creds = Credentials.from_service_account_info(info, scopes=SCOPES)
+        creds = Credentials.from_service_account_info(info, scopes=scopes)
 
     # Вариант 2: это путь к файлу
     elif os.path.isfile(s):
-        creds = Credentials.from_service_account_file(s, scopes=SCOPES)
+        creds = Credentials.from_service_account_file(s, scopes=scopes)
 
     else:
         # Вариант 3: возможно base64
         try:
             decoded = base64.b64decode(s).decode("utf-8")
             info = json.loads(decoded)
-            creds = Credentials.from_service_account_info(info, scopes=SCOPES)
+            creds = Credentials.from_service_account_info(info, scopes=scopes)
         except Exception as e:
             raise FileNotFoundError(
                 "GOOGLE_CREDENTIALS_JSON не является ни путём к файлу, ни валидной JSON/base64 строкой"
             ) from e
 
-    gc = gspread.authorize(creds)
-    return gc.open_by_key(sheet_id)
+    return creds
+
+def _open(sheet_id: str, creds_src: str):
+    """Таблица из общего реестра клиентов (авторизация и open_by_key — один раз)."""
+    if not creds_src or not str(creds_src).strip():
+        raise ValueError("GOOGLE_CREDENTIALS_JSON is empty")
+    return google_clients.spreadsheet(sheet_id, creds_src, SCOPES, _load_credentials)
+
+def _worksheet(sheet_id: str, creds_src: str, title: str):
+    """Закешированный хэндл листа — без повторного запроса метаданных."""
+    if not creds_src or not str(creds_src).strip():
+        raise ValueError("GOOGLE_CREDENTIALS_JSON is empty")
+    return google_clients.worksheet(sheet_id, creds_src, title, SCOPES, _load_credentials)
+
+def _revision(sheet_id: str, creds_src: str) -> str:
+    """
+    Дешёвый отпечаток таблицы — modifiedTime из Drive. Он общий на всю
+    книгу: любая запись в Inbox его меняет, и следующее чтение устаревшего
+    KPI/ops/чек-листа перечитывает лист (см. SHEET_CACHE_TTLS в sheet_cache).
+    """
+    sh = _open(sheet_id, creds_src)
+    return SHEETS.call("revision", sh.get_lastUpdateTime)
+
+def _cached(sheet_id: str, creds_src: str, title: str, loader):
+    """Чтение листа через общий кеш (TTL + сверка ревизии)."""
+    return _cache.get(sheet_id, title, loader, revision=lambda: _revision(sheet_id, creds_src))
+
+# ── Проекционные чтения ────────────────────────────────────────────
+_headers = {}  # (sheet_id, title) -> заголовок листа
+
+def _letter(pos: int) -> str:
+    """Индекс колонки (с 0) → буква A1-нотации."""
+    return re.sub(r"\d", "", rowcol_to_a1(1, pos + 1))
+
+def _header(ws, sheet_id: str, title: str, refresh: bool = False):
+    key = (sheet_id, title)
+    if refresh or key not in _headers:
+        _headers[key] = SHEETS.call("read", ws.row_values, 1)
+    return _headers[key]
+
+def _column(value_range):
+    """Ответ batch_get(major_dimension=COLUMNS) для одной колонки → список значений."""
+    return list(value_range[0]) if value_range else []
+
+def _by_columns(cols, count: int):
+    """Колонки значений → строки-кортежи (с приведением чисел, как get_all_records)."""
+    return [
+        tuple(numericise_all([col[i] if i < len(col) else "" for col in cols]))
+        for i in range(count)
+    ]
+
+def _read_columns(sheet_id: str, creds_src: str, title: str, fields) -> Table:
+    """
+    Только нужные колонки листа целиком (без остальных данных).
+    Заголовок кешируется; первая ячейка каждой колонки сверяется с именем
+    поля — если лист перестроили, заголовок перечитывается.
+    """
+    ws = _worksheet(sheet_id, creds_src, title)
+    for refresh in (False, True):
+        header = _header(ws, sheet_id, title, refresh)
+        names = [f for f in fields if f in header]
+        if not names:
+            return Table(fields, [])
+        ranges = [f"{_letter(header.index(f))}1:{_letter(header.index(f))}" for f in names]
+        value_ranges = SHEETS.call("read", ws.batch_get, ranges, major_dimension="COLUMNS")
+        columns = [_column(vr) for vr in value_ranges]
+        if [(c[0] if c else "") for c in columns] == names:
+            break
+    count = max(len(c) for c in columns) - 1
+    return Table(names, _by_columns([c[1:] for c in columns], count))
+
+def _read_tail(sheet_id: str, creds_src: str, title: str, fields, n: int) -> Table:
+    """
+    Последние n строк листа по нужным колонкам. Конец данных определяется
+    по первой колонке, сами строки читаются одним batch_get.
+    """
+    ws = _worksheet(sheet_id, creds_src, title)
+    head_vr, key_vr = SHEETS.call("read", ws.batch_get, ["1:1", "A:A"], major_dimension="COLUMNS")
+    header = [(c[0] if c else "") for c in head_vr]
+    _headers[(sheet_id, title)] = header
+    last = len(_column(key_vr))
+    names = [f for f in fields if f in header]
+    if last < 2 or not names:
+        return Table(names or fields, [])
+    first = max(2, last - n + 1)
+    ranges = [f"{_letter(header.index(f))}{first}:{_letter(header.index(f))}{last}" for f in names]
+    value_ranges = SHEETS.call("read", ws.batch_get, ranges, major_dimension="COLUMNS")
+    return Table(names, _by_columns([_column(vr) for vr in value_ranges], last - first + 1))
+
+# ── Чтения для локальной копии ─────────────────────────────────────
+def read_sheet_values(sheet_id: str, creds_src: str, title: str):
+    """Лист целиком: [заголовок, *строки] (значения строк — с приведением чисел)."""
+    ws = _worksheet(sheet_id, creds_src, title)
+    values = SHEETS.call("read", ws.get_values)
+    if not values:
+        return []
+    return [tuple(values[0])] + [tuple(numericise_all(r)) for r in values[1:]]
+
+def read_sheet_tail(sheet_id: str, creds_src: str, title: str, first: int):
+    """
+    Заголовок, строки с номера first до конца данных и номер последней
+    строки. Конец — по первой колонке, как в _read_tail.
+    """
+    ws = _worksheet(sheet_id, creds_src, title)
+    head_vr, key_vr = SHEETS.call("read", ws.batch_get, ["1:1", "A:A"], major_dimension="COLUMNS")
+    header = tuple((c[0] if c else "") for c in head_vr)
+    _headers[(sheet_id, title)] = list(header)
+    last = len(_column(key_vr))
+    if last < first:
+        return header, [], last
+    (rows,) = SHEETS.call("read", ws.batch_get, [f"{first}:{last}"])
+    rows = list(rows) + [[]] * (last - first + 1 - len(rows))
+    return header, [tuple(numericise_all(r)) for r in rows], last
+
+def inbox_row(text, category="", due_str="", author="В.П.", created=None, key=""):
+    """Строка листа Inbox в порядке колонок таблицы; key — ключ идемпотентности (колонка INBOX_KEY_COLUMN)."""
+    now = (created or datetime.datetime.now()).isoformat(timespec="seconds")
+    row = [now, category, text, due_str, "Новая", "", author]
+    return row + [key] if key else row
+
+def inbox_keys(sheet_id, creds_path):
+    """Ключи идемпотентности, уже записанные в Inbox (для сверки перед повторной отправкой)."""
+    ws = _worksheet(sheet_id, creds_path, SHEET_INBOX)
+    (value_range,) = SHEETS.call(
+        "read", ws.batch_get, [f"{INBOX_KEY_COLUMN}2:{INBOX_KEY_COLUMN}"], major_dimension="COLUMNS"
+    )
+    return {str(v) for v in _column(value_range) if v}
 
 def append_inbox(sheet_id, creds_path, text, category="", due_str="", author="В.П."):
-    sh = _open(sheet_id, creds_path)
-    ws = sh.worksheet(SHEET_INBOX)
-    now = datetime.datetime.now().isoformat(timespec="seconds")
-    ws.append_row([now, category, text, due_str, "Новая", "", author], value_input_option="USER_ENTERED")
+    ws = _worksheet(sheet_id, creds_path, SHEET_INBOX)
+    SHEETS.call("write", ws.append_row, inbox_row(text, category, due_str, author), value_input_option="USER_ENTERED")
+    _mirror.invalidate(sheet_id, SHEET_INBOX)
     return True
 
+def append_inbox_rows(sheet_id, creds_path, rows):
+    """Пачка строк Inbox одним запросом append_rows."""
+    if not rows:
+        return 0
+    ws = _worksheet(sheet_id, creds_path, SHEET_INBOX)
+    SHEETS.call("write", ws.append_rows, rows, value_input_option="USER_ENTERED")
+    _mirror.invalidate(sheet_id, SHEET_INBOX)
+    return len(rows)
+
 def fetch_kpi(sheet_id, creds_path):
-    sh = _open(sheet_id, creds_path)
-    ws = sh.worksheet(SHEET_KPI)
-    recs = ws.get_all_records()
-    return recs[-1] if recs else {}
+    table = fetch_kpi_history(sheet_id, creds_path, KPI_TAIL_ROWS)
+    return table.record(len(table) - 1).to_dict() if len(table) else {}
+
+def fetch_kpi_history(sheet_id, creds_path, n=KPI_TAIL_ROWS) -> Table:
+    """Последние n строк KPI (только колонки KPI_FIELDS)."""
+    if _mirror.ready(sheet_id, SHEET_KPI):
+        return _mirror.query(sheet_id, SHEET_KPI, KPI_FIELDS, order="-rownum", limit=n)
+    if n != KPI_TAIL_ROWS:
+        return _read_tail(sheet_id, creds_path, SHEET_KPI, KPI_FIELDS, n)
+    return _cached(
+        sheet_id, creds_path, SHEET_KPI,
+        lambda: _read_tail(sheet_id, creds_path, SHEET_KPI, KPI_FIELDS, KPI_TAIL_ROWS),
+    )
+
+def _deadline(value):
+    try: return datetime.datetime.strptime(str(value), "%Y-%m-%d").date()
+    except Exception: return datetime.date.max
 
 def fetch_ops_tasks(sheet_id, creds_path, limit=50):
-    import datetime as dt
-    sh = _open(sheet_id, creds_path)
-    ws = sh.worksheet(SHEET_OPS)
-    recs = ws.get_all_records()
-    # фильтруем только «активные»
-    recs = [r for r in recs if str(r.get("Статус","")).lower() in ("в работе","не начато","ожидание","новая")]
-    def to_date(s):
-        try: return dt.datetime.strptime(str(s), "%Y-%m-%d").date()
-        except: return dt.date.max
-    recs.sort(key=lambda r: to_date(r.get("Дедлайн","")))
-    return recs[:limit]
+    if _mirror.ready(sheet_id, SHEET_OPS):
+        # те же фильтр и порядок — по индексу (статус, дедлайн) в SQLite
+        return _mirror.query(
+            sheet_id, SHEET_OPS, OPS_FIELDS, statuses=ACTIVE_STATUSES, order="deadline", limit=limit
+        ).records()
+    table = _cached(
+        sheet_id, creds_path, SHEET_OPS,
+        lambda: _read_columns(sheet_id, creds_path, SHEET_OPS, OPS_FIELDS),
+    )
+    # фильтруем только «активные» и сортируем по дедлайну — прямо по кортежам
+    st, dl = table.position(STATUS_FIELD), table.position(DEADLINE_FIELD)
+    rows = [r for r in table.rows if st >= 0 and str(r[st]).lower() in ACTIVE_STATUSES]
+    rows.sort(key=lambda r: _deadline(r[dl]) if dl >= 0 else datetime.date.max)
+    return [Record(table.index, r) for r in rows[:limit]]
 
 def fetch_eff_actions(sheet_id, creds_path, limit=50):
-    sh = _open(sheet_id, creds_path)
-    ws = sh.worksheet(SHEET_EFF)
-    return ws.get_all_records()[:limit]
+    if _mirror.ready(sheet_id, SHEET_EFF):
+        return _mirror.query(sheet_id, SHEET_EFF, limit=limit).records()
+    def load():
+        ws = _worksheet(sheet_id, creds_path, SHEET_EFF)
+        values = SHEETS.call("read", ws.get_values)
+        if not values:
+            return Table([], [])
+        return Table(values[0], (tuple(numericise_all(r)) for r in values[1:]))
+    return _cached(sheet_id, creds_path, SHEET_EFF, load).records()[:limit]
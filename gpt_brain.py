@@ -1,14 +1,25 @@
 # gpt_brain.py
-import os
-from openai import OpenAI
+from openai import OpenAIError
+
+import http_pool
+import metrics
+from resilience import OPENAI, describe
+from gpt_cache import cache as _cache, cached_completion, make_key
+
+MODEL = "gpt-4o-mini"
 
 def _client():
-    key = os.getenv("OPENAI_API_KEY")
-    if not key:
-        return None
-    return OpenAI(api_key=key)
+    # AsyncOpenAI поверх общего пула соединений (None — нет OPENAI_API_KEY)
+    return http_pool.openai_client()
+
+def _reason(e: Exception) -> str:
+    # пользователю — короткая причина, а не текст ответа API
+    return describe(e, OPENAI)
 
-def gpt_analyze_free(tasks, eff_list):
+async def _once(text: str):
+    yield text
+
+async def gpt_analyze_free(tasks, eff_list, force=False):
     client = _client()
     if client is None:
         return "Добавь OPENAI_API_KEY в .env, чтобы получить умный совет."
@@ -29,71 +40,104 @@ def gpt_analyze_free(tasks, eff_list):
     )
 
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.6,
-            max_tokens=220,
+        text = await cached_completion(
+            client, MODEL, [{"role": "user", "content": prompt}], 0.6, 220, force=force
+        )
+        return text or "Нет ответа ИИ."
+    except Exception as e:
+        return f"Не удалось получить совет ИИ: {_reason(e)}"
+
+def _status_prompt(kpi: dict) -> str:
+    return (
+        "Ты — ассистент управляющего баром. Дай краткий отчёт: что хорошо, что риск, на что сфокусироваться сегодня.\n"
+        f"KPI: план выручки {kpi.get('План_выручка','?')}, факт {kpi.get('Факт_выручка','?')}, "
+        f"средний чек {kpi.get('Средний_чек','?')}, НГ-даты продано {kpi.get('%_НГ_дат_продано','?')}.\n"
+        "Структура ответа: 1) Что хорошо 2) Риски 3) Конкретные шаги на сегодня. Пиши лаконично."
+    )
+
+def _continue_messages(original_prompt: str, so_far: str):
+    return [
+        {"role": "user", "content": original_prompt},
+        {"role": "assistant", "content": so_far},
+        {"role": "user", "content": "Продолжи строго с места, где остановился. Не повторяй уже сказанное."}
+    ]
+
+async def _stream(client, messages, temperature, max_tokens, empty, error_prefix, cache_key=None):
+    """
+    Кусочки текста из потокового ответа; ошибки — последним кусочком.
+    С cache_key полный ответ после успешного завершения кладётся в кеш.
+    """
+    got = False
+    parts = []
+    try:
+        # таймер — до начала ответа (сам поток читается вместе с правками в Telegram)
+        stream = await OPENAI.acall(
+            "completion_stream",
+            client.chat.completions.create,
+            model=MODEL,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
         )
-        return (resp.choices[0].message.content.strip() if resp.choices else "Нет ответа ИИ.")
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                got = True
+                parts.append(delta)
+                yield delta
     except Exception as e:
-        return f"Не удалось получить совет ИИ: {e}"
+        got = True
+        yield f"\n{error_prefix}: {_reason(e)}"
+        return
+    if not got:
+        yield empty
+    elif cache_key:
+        _cache.put(cache_key, "".join(parts).strip())
 
-def gpt_analyze_status(kpi: dict):
-    """Возвращает строго ДВА значения: (text, prompt)."""
+async def gpt_analyze_status(kpi: dict, force=False):
+    """Возвращает строго ДВА значения: (text, prompt). force=True — мимо кеша."""
     client = _client()
     if client is None:
         return ("Добавь OPENAI_API_KEY в .env, чтобы получить аналитический комментарий.", "")
     if not kpi:
         return ("Пока нет KPI для анализа.", "")
 
-    prompt = (
-        "Ты — ассистент управляющего баром. Дай краткий отчёт: что хорошо, что риск, на что сфокусироваться сегодня.\n"
-        f"KPI: план выручки {kpi.get('План_выручка','?')}, факт {kpi.get('Факт_выручка','?')}, "
-        f"средний чек {kpi.get('Средний_чек','?')}, НГ-даты продано {kpi.get('%_НГ_дат_продано','?')}.\n"
-        "Структура ответа: 1) Что хорошо 2) Риски 3) Конкретные шаги на сегодня. Пиши лаконично."
-    )
+    prompt = _status_prompt(kpi)
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.5,
-            max_tokens=250,
+        text = await cached_completion(
+            client, MODEL, [{"role": "user", "content": prompt}], 0.5, 250, force=force
         )
-        text = resp.choices[0].message.content.strip() if resp.choices else "Нет ответа ИИ."
-        return (text, prompt)
+        return (text or "Нет ответа ИИ.", prompt)
     except Exception as e:
-        return (f"Ошибка анализа KPI: {e}", prompt)
+        return (f"Ошибка анализа KPI: {_reason(e)}", prompt)
 
-def gpt_continue_status(original_prompt: str, so_far: str):
+async def gpt_continue_status(original_prompt: str, so_far: str):
     client = _client()
     if client is None:
         return "Добавь OPENAI_API_KEY в .env, чтобы продолжать ответы."
     if not original_prompt or not so_far:
         return "Нет контекста для продолжения. Запроси /status заново."
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "user", "content": original_prompt},
-                {"role": "assistant", "content": so_far},
-                {"role": "user", "content": "Продолжи строго с места, где остановился. Не повторяй уже сказанное."}
-            ],
+        resp = await OPENAI.acall(
+            "completion",
+            client.chat.completions.create,
+            model=MODEL,
+            messages=_continue_messages(original_prompt, so_far),
             temperature=0.5,
             max_tokens=220,
         )
+        metrics.tokens(MODEL, getattr(resp, "usage", None))
         return resp.choices[0].message.content.strip() if resp.choices else "Нет продолжения."
     except Exception as e:
-        return f"Не удалось продолжить: {e}"
-from openai import OpenAI
-__gpt_client = None
+        return f"Не удалось продолжить: {_reason(e)}"
 def _gpt():
-    global __gpt_client
-    if __gpt_client is None:
-        __gpt_client = OpenAI()
-    return __gpt_client
+    client = _client()
+    if client is None:
+        raise OpenAIError("OPENAI_API_KEY is not set")
+    return client
 
-def gpt_prioritize(inbox_rows):
+async def gpt_prioritize(inbox_rows, force=False):
     tasks_text = "\n".join([f"- [{r.get('Категория','?')}] {r.get('Текст','?')} (срок: {r.get('Срок','—')})"
                             for r in inbox_rows[:30]])
     prompt = f"""Ты — личный ассистент. Расставь приоритеты очень кратко:
@@ -102,28 +146,41 @@ def gpt_prioritize(inbox_rows):
 3) Что убрать/перенести?
 Список задач:
 {tasks_text}"""
-    r = _gpt().chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role":"user","content":prompt}],
-        temperature=0.3, max_tokens=500
-    )
-    return r.choices[0].message.content.strip()
+    return await cached_completion(_gpt(), MODEL, [{"role":"user","content":prompt}], 0.3, 500, force=force)
 
-def gpt_daily_review(day_text, risks_text):
+async def gpt_daily_review(day_text, risks_text, force=False):
     prompt = f"Сформулируй понятный план дня по событиям:\n{day_text}\nРиски: {risks_text}\nВывод и 3 шага фокуса."
-    r = _gpt().chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role":"user","content":prompt}],
-        temperature=0.3, max_tokens=400
-    )
-    return r.choices[0].message.content.strip()
+    return await cached_completion(_gpt(), MODEL, [{"role":"user","content":prompt}], 0.3, 400, force=force)
 
-def gpt_weekly_review(week_text, goals_hint=""):
+async def gpt_weekly_review(week_text, goals_hint="", force=False):
     prompt = f"Краткий недельный обзор:\n{week_text}\n{goals_hint}\nПики нагрузки, свободные окна, 5 главных задач."
-    r = _gpt().chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role":"user","content":prompt}],
-        temperature=0.3, max_tokens=600
-    )
-    return r.choices[0].message.content.strip()
+    return await cached_completion(_gpt(), MODEL, [{"role":"user","content":prompt}], 0.3, 600, force=force)
+
+def status_cache_key(kpi: dict) -> str:
+    """Ключ кеша для анализа KPI (тот же, что у gpt_analyze_status)."""
+    return make_key(MODEL, [{"role": "user", "content": _status_prompt(kpi)}], 0.5, 250)
 
+def gpt_analyze_status_stream(kpi: dict, force=False):
+    """Потоковый вариант gpt_analyze_status: (асинхронный итератор кусочков текста, prompt)."""
+    client = _client()
+    if client is None:
+        return _once("Добавь OPENAI_API_KEY в .env, чтобы получить аналитический комментарий."), ""
+    if not kpi:
+        return _once("Пока нет KPI для анализа."), ""
+    prompt = _status_prompt(kpi)
+    key = status_cache_key(kpi)
+    cached = None if force else _cache.get(key)
+    if cached is not None:
+        return _once(cached), prompt
+    messages = [{"role": "user", "content": prompt}]
+    return _stream(client, messages, 0.5, 250, "Нет ответа ИИ.", "Ошибка анализа KPI", cache_key=key), prompt
+
+def gpt_continue_status_stream(original_prompt: str, so_far: str):
+    """Потоковый вариант gpt_continue_status: асинхронный итератор кусочков текста."""
+    client = _client()
+    if client is None:
+        return _once("Добавь OPENAI_API_KEY в .env, чтобы продолжать ответы.")
+    if not original_prompt or not so_far:
+        return _once("Нет контекста для продолжения. Запроси /status заново.")
+    messages = _continue_messages(original_prompt, so_far)
+    return _stream(client, messages, 0.5, 220, "Нет продолжения.", "Не удалось продолжить")
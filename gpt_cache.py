@@ -0,0 +1,176 @@
+# gpt_cache.py
+"""
+Кеш ответов GPT по содержимому запроса.
+
+Ключ — sha256 от (model, messages, temperature, max_tokens): одинаковый
+промпт (например, те же KPI) не уходит в OpenAI повторно, пока не истёк
+GPT_CACHE_TTL. Вытеснение — LRU по GPT_CACHE_SIZE записей. Если задан
+GPT_CACHE_PATH, кеш сохраняется в JSON-файл и переживает рестарт:
+запись отложена на GPT_CACHE_SAVE_DELAY секунд (пачка put — одно
+сохранение) и идёт в пуле потоков, а не в цикле событий.
+Ошибки и пустые ответы не кешируются.
+"""
+import os
+import json
+import time
+import asyncio
+import tempfile
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import metrics
+from executors import run_blocking
+from resilience import OPENAI
+
+GPT_CACHE_TTL = float(os.getenv("GPT_CACHE_TTL", "1800"))
+GPT_CACHE_SIZE = int(os.getenv("GPT_CACHE_SIZE", "256"))
+GPT_CACHE_PATH = os.getenv("GPT_CACHE_PATH", "").strip()
+GPT_CACHE_SAVE_DELAY = float(os.getenv("GPT_CACHE_SAVE_DELAY", "2"))
+
+log = logging.getLogger(__name__)
+
+
+def make_key(model: str, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = GPT_CACHE_TTL, max_size: int = GPT_CACHE_SIZE, path: str = GPT_CACHE_PATH):
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self.path = path
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (unix-время, текст)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_pending = False
+        self._save_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.path:
+            self._load()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or time.time() - item[0] >= self.ttl:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: str, text: str) -> None:
+        if not text:
+            return
+        with self._lock:
+            self._data[key] = (time.time(), text)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            if not self.path or self._save_pending:
+                return
+            self._save_pending = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()  # поток пула — цикл событий не ждёт, пишем сразу
+            return
+        self._save_task = loop.create_task(self._save_later())
+
+    def age(self, key: str) -> Optional[float]:
+        item = self._data.get(key)
+        return None if item is None else time.time() - item[0]
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    # ── диск ───────────────────────────────────────────────────────
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            log.warning("GPT cache %s is unreadable, starting empty: %r", self.path, e)
+            return
+        now = time.time()
+        for key, ts, text in items[-self.max_size:]:
+            if now - ts < self.ttl:
+                self._data[key] = (ts, text)
+
+    async def _save_later(self) -> None:
+        await asyncio.sleep(GPT_CACHE_SAVE_DELAY)
+        await run_blocking(self.flush)
+
+    def flush(self) -> None:
+        """Сохраняет кеш на диск, если с прошлого сохранения были put (блокирующе)."""
+        with self._lock:
+            if not self._save_pending:
+                return
+            self._save_pending = False
+            items = list(self._data.items())
+        with self._save_lock:
+            self._save(items)
+
+    def _save(self, items) -> None:
+        # свой временный файл на каждое сохранение — рядом с целевым, чтобы os.replace был атомарным
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp",
+                                   dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump([[k, ts, text] for k, (ts, text) in items], f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            log.warning("GPT cache %s was not saved: %r", self.path, e)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
+cache = ResponseCache()
+
+
+async def cached_completion(client, model: str, messages: List[Dict], temperature: float, max_tokens: int,
+                            force: bool = False) -> str:
+    """
+    chat.completions.create через кеш. force=True — спросить модель заново
+    (ответ всё равно попадёт в кеш). Возвращает текст или "" при пустом ответе.
+    """
+    key = make_key(model, messages, temperature, max_tokens)
+    if not force:
+        text = cache.get(key)
+        if text is not None:
+            return text
+    resp = await OPENAI.acall(
+        "completion",
+        client.chat.completions.create,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+    )
+    metrics.tokens(model, getattr(resp, "usage", None))
+    text = resp.choices[0].message.content.strip() if resp.choices else ""
+    cache.put(key, text)
+    return text
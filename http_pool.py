@@ -0,0 +1,97 @@
+# http_pool.py
+"""
+Общий пул исходящих HTTP-соединений для AI-сервисов (OpenAI, Yandex SpeechKit).
+
+Один httpx.AsyncClient на процесс: keep-alive, HTTP/2 (если установлен h2),
+ограниченный пул соединений и таймауты по хостам. Создаётся при старте бота
+(start) и закрывается при остановке (close); OpenAI-клиент работает поверх
+того же пула.
+"""
+import os
+import logging
+from typing import TYPE_CHECKING, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP2 = os.getenv("HTTP2", "1").strip().lower() in ("1", "true", "yes")
+
+# Таймауты по хостам: распознавание длинных записей и генерация бывают долгими,
+# а вот соединение должно устанавливаться быстро
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+HOST_TIMEOUTS: Dict[str, httpx.Timeout] = {
+    "stt.api.cloud.yandex.net": httpx.Timeout(60.0, connect=5.0),
+    "api.openai.com": httpx.Timeout(90.0, connect=5.0),
+}
+
+log = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+_openai: Optional["AsyncOpenAI"] = None
+
+
+def _http2_available() -> bool:
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def timeout_for(url: str) -> httpx.Timeout:
+    return HOST_TIMEOUTS.get(urlsplit(url).hostname or "", DEFAULT_TIMEOUT)
+
+
+def client() -> httpx.AsyncClient:
+    """Общий AsyncClient (создаётся при первом обращении, если start() не вызывали)."""
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = _http2_available()
+        _client = httpx.AsyncClient(
+            http2=http2,
+            timeout=DEFAULT_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        log.info("HTTP pool: http2=%s, max_connections=%d", http2, HTTP_MAX_CONNECTIONS)
+    return _client
+
+
+def openai_client(api_key: Optional[str] = None) -> Optional["AsyncOpenAI"]:
+    """AsyncOpenAI поверх общего пула; None, если нет OPENAI_API_KEY."""
+    global _openai
+    key = api_key or os.getenv("OPENAI_API_KEY")
+    if not key:
+        return None
+    if _openai is None or _openai.api_key != key or _openai._client is not client():
+        from openai import AsyncOpenAI  # SDK тяжёлый — импорт при первом клиенте
+        _openai = AsyncOpenAI(
+            api_key=key,
+            http_client=client(),
+            timeout=HOST_TIMEOUTS["api.openai.com"],
+            max_retries=0,  # повторы — в resilience.OPENAI
+        )
+    return _openai
+
+
+async def start() -> None:
+    client()
+
+
+async def close() -> None:
+    global _client, _openai
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _openai = None
@@ -0,0 +1,301 @@
+# inbox_queue.py
+"""
+Write-behind очередь для листа Inbox.
+
+Хендлер кладёт строку в очередь и сразу отвечает пользователю, а фоновый
+поток копит строки и отправляет их одним append_rows — как только набралось
+INBOX_BATCH_SIZE строк или самая старая ждёт дольше INBOX_FLUSH_INTERVAL
+секунд. При остановке бота очередь дописывается до конца.
+
+Журнал (INBOX_JOURNAL_PATH, SQLite): строка сначала записывается на диск —
+ответ пользователю ждёт только этой записи, — и удаляется оттуда, когда
+Sheets подтвердил append. Если Sheets лежит или бот перезапустили, строки
+из журнала досылаются по порядку при следующем старте/попытке.
+
+Идемпотентность: у каждой строки свой ключ (колонка INBOX_KEY_COLUMN в
+google_sheets). Если прошлая попытка могла дойти до таблицы (таймаут,
+5xx, перезапуск посреди записи), перед повтором ключи сверяются с листом
+и уже записанные строки не дублируются. Пустой INBOX_JOURNAL_PATH — только
+очередь в памяти, как раньше.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import startup
+from resilience import classify
+
+google_sheets = startup.lazy("google_sheets")
+
+INBOX_BATCH_SIZE = int(os.getenv("INBOX_BATCH_SIZE", "20"))
+INBOX_FLUSH_INTERVAL = float(os.getenv("INBOX_FLUSH_INTERVAL", "3"))
+# Пауза перед повтором, если Sheets ответил ошибкой
+INBOX_RETRY_DELAY = float(os.getenv("INBOX_RETRY_DELAY", "10"))
+INBOX_JOURNAL_PATH = os.getenv("INBOX_JOURNAL_PATH", "inbox_journal.sqlite3").strip()
+
+log = logging.getLogger(__name__)
+
+
+class InboxJournal:
+    """Неотправленные строки Inbox на диске (WAL: запись без fsync на каждую строку)."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS inbox (
+        seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+        key     TEXT NOT NULL UNIQUE,
+        row     TEXT NOT NULL,
+        created REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def append(self, key: str, row: list) -> None:
+        with self._lock:
+            self._db().execute(
+                "INSERT OR IGNORE INTO inbox (key, row, created) VALUES (?, ?, ?)",
+                (key, json.dumps(row, ensure_ascii=False), time.time()),
+            )
+
+    def pending(self) -> List[Tuple[str, list]]:
+        with self._lock:
+            rows = self._db().execute("SELECT key, row FROM inbox ORDER BY seq").fetchall()
+        return [(key, json.loads(row)) for key, row in rows]
+
+    def done(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            db.executemany("DELETE FROM inbox WHERE key = ?", [(k,) for k in keys])
+            db.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class InboxWriter:
+    def __init__(
+        self,
+        sheet_id: str,
+        creds_src: str,
+        batch_size: int = INBOX_BATCH_SIZE,
+        flush_interval: float = INBOX_FLUSH_INTERVAL,
+        writer: Optional[Callable[[str, str, List[list]], int]] = None,
+        journal_path: str = INBOX_JOURNAL_PATH,
+        verifier: Optional[Callable[[str, str], Set[str]]] = None,
+    ):
+        self.sheet_id = sheet_id
+        self.creds_src = creds_src
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._writer = writer
+        self._verifier = verifier
+        self._journal = InboxJournal(journal_path) if journal_path else None
+
+        self._pending: Deque[tuple] = deque()  # (время постановки, ключ, строка)
+        # ключи строк, чья прошлая попытка могла дойти до таблицы — сверить перед повтором
+        self._uncertain: Set[str] = set()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._retry_at = 0.0
+
+        self._flushes = 0
+        self._failures = 0
+        self._rows_written = 0
+        self._last_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._last_error = ""
+        self._replayed = 0
+        self._deduplicated = 0
+
+    # ── публичное API ──────────────────────────────────────────────
+    def submit(self, text, category="", due_str="", author="В.П.") -> int:
+        """Записывает задачу в журнал, ставит в очередь и возвращает текущий размер очереди."""
+        # буква впереди: Sheets (USER_ENTERED) превратил бы «0123…» или «12e45…» в число,
+        # и inbox_keys уже не нашёл бы ключ при сверке
+        key = "k" + uuid.uuid4().hex[:16] if self._journal else ""
+        row = google_sheets.inbox_row(text, category, due_str, author, key=key)
+        if self._journal:
+            try:
+                self._journal.append(key, row)
+            except Exception as e:  # диск недоступен — не теряем хотя бы очередь в памяти
+                log.error("Inbox journal append failed: %r", e)
+        with self._cond:
+            self._pending.append((time.monotonic(), key, row))
+            backlog = len(self._pending)
+            if backlog >= self.batch_size:
+                self._cond.notify()
+        return backlog
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._replay()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="inbox-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Останавливает фоновый поток и синхронно дописывает остаток."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        if self._journal:
+            self._journal.close()  # недописанное останется в журнале до следующего старта
+
+    def flush(self) -> int:
+        """Отправляет всё накопленное. Возвращает число обработанных строк (с уже записанными ранее)."""
+        written = 0
+        while True:
+            n = self._flush_batch()
+            if n <= 0:
+                return written
+            written += n
+
+    def stats(self) -> Dict:
+        with self._cond:
+            backlog = len(self._pending)
+            oldest = time.monotonic() - self._pending[0][0] if self._pending else 0.0
+        return {
+            "backlog": backlog,
+            "oldest_age_s": round(oldest, 1),
+            "flushes": self._flushes,
+            "failures": self._failures,
+            "rows_written": self._rows_written,
+            "last_flush_ms": round(self._last_flush_ms, 1),
+            "avg_flush_ms": round(self._total_flush_ms / self._flushes, 1) if self._flushes else 0.0,
+            "max_flush_ms": round(self._max_flush_ms, 1),
+            "last_error": self._last_error,
+            "journal": bool(self._journal),
+            "replayed": self._replayed,
+            "deduplicated": self._deduplicated,
+        }
+
+    # ── внутреннее ─────────────────────────────────────────────────
+    def _replay(self) -> None:
+        """Строки, оставшиеся в журнале с прошлого запуска, — в голову очереди."""
+        if not self._journal:
+            return
+        try:
+            rows = self._journal.pending()
+        except Exception as e:
+            log.error("Inbox journal read failed: %r", e)
+            return
+        with self._cond:
+            queued = {key for _, key, _ in self._pending}
+            backlog = [(time.monotonic(), key, row) for key, row in rows if key not in queued]
+            self._pending.extendleft(reversed(backlog))
+            # неизвестно, дошла ли последняя попытка до таблицы
+            self._uncertain.update(key for _, key, _ in backlog)
+        self._replayed += len(backlog)
+        if backlog:
+            log.info("Inbox journal: %d rows to replay", len(backlog))
+
+    def _journal_done(self, keys: List[str]) -> None:
+        keys = [k for k in keys if k]
+        if not (self._journal and keys):
+            return
+        try:
+            self._journal.done(keys)
+        except Exception as e:  # строки уйдут ещё раз, но сверка по ключам отсеет дубли
+            log.error("Inbox journal cleanup failed: %r", e)
+        self._uncertain.difference_update(keys)
+
+    def _due(self) -> bool:
+        if not self._pending:
+            return False
+        if time.monotonic() < self._retry_at and not self._stopping:
+            return False
+        if self._stopping or len(self._pending) >= self.batch_size:
+            return True
+        return time.monotonic() - self._pending[0][0] >= self.flush_interval
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._due() and not self._stopping:
+                    if self._pending:
+                        wait = self._pending[0][0] + self.flush_interval - time.monotonic()
+                        wait = max(wait, self._retry_at - time.monotonic(), 0.05)
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+                if self._stopping:
+                    return
+            self._flush_batch()
+
+    def _flush_batch(self) -> int:
+        with self._flush_lock:
+            with self._cond:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            if not batch:
+                return 0
+
+            taken = len(batch)
+            started = time.perf_counter()
+            try:
+                if any(key in self._uncertain for _, key, _ in batch):
+                    present = (self._verifier or google_sheets.inbox_keys)(self.sheet_id, self.creds_src)
+                    sent = [key for _, key, _ in batch if key in present]
+                    if sent:
+                        self._journal_done(sent)
+                        self._deduplicated += len(sent)
+                        batch = [item for item in batch if item[1] not in present]
+                if batch:
+                    (self._writer or google_sheets.append_inbox_rows)(
+                        self.sheet_id, self.creds_src, [row for _, _, row in batch]
+                    )
+            except Exception as e:
+                # возвращаем строки в голову очереди, порядок сохраняется
+                with self._cond:
+                    self._pending.extendleft(reversed(batch))
+                    self._retry_at = time.monotonic() + INBOX_RETRY_DELAY
+                    # отказ лимита / до отправки — запрос точно не выполнен, иначе сверяем ключи
+                    if classify(e) not in ("rate", "connect"):
+                        self._uncertain.update(key for _, key, _ in batch if key)
+                self._failures += 1
+                self._last_error = repr(e)
+                log.error("Inbox flush failed (%d rows), retry in %.0fs: %r", len(batch), INBOX_RETRY_DELAY, e)
+                return -1
+
+            self._journal_done([key for _, key, _ in batch])
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._flushes += 1
+            self._rows_written += len(batch)
+            self._last_flush_ms = elapsed_ms
+            self._total_flush_ms += elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+            self._retry_at = 0.0
+            log.info(
+                "Inbox flush: %d rows in %.0f ms, backlog %d",
+                len(batch), elapsed_ms, len(self._pending),
+            )
+            return taken
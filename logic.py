@@ -1,20 +1,157 @@
-import datetime, re
-
-def parse_due(text):
-    text = (text or "").lower()
-    today = datetime.date.today()
-    if "сегодня" in text: return today.isoformat()
-    if "завтра" in text: return (today + datetime.timedelta(days=1)).isoformat()
-    if "послезавтра" in text: return (today + datetime.timedelta(days=2)).isoformat()
-    m = re.search(r"через\s+(\d+)\s+д", text)
-    if m: return (today + datetime.timedelta(days=int(m.group(1)))).isoformat()
-    for fmt in ("%d.%m.%Y","%d.%m"):
-        try:
-            dt = datetime.datetime.strptime(text, fmt)
-            if fmt=="%d.%m": dt = dt.replace(year=today.year)
-            return dt.date().isoformat()
-        except: pass
-    return ""
+import datetime, re, heapq, calendar, functools
+from collections import namedtuple
+
+import startup
+
+# NumPy грузится при первом ранжировании; без него — тот же расчёт на чистом Python
+np = startup.optional("numpy")
+
+# ── Разбор сроков ─────────────────────────────────────────────────
+# Все выражения компилируются один раз; правила перебираются по таблице,
+# первое сработавшее задаёт дату. Время («в 19:00», «в 7 вечера») ищется
+# отдельно. Результат кешируется по (текст, сегодня).
+Due = namedtuple("Due", "date time")
+
+_NUMBERS = {
+    "один": 1, "одну": 1, "одна": 1, "пару": 2, "пара": 2, "два": 2, "две": 2, "три": 3,
+    "четыре": 4, "пять": 5, "шесть": 6, "семь": 7, "восемь": 8, "девять": 9, "десять": 10,
+}
+# Только настоящие формы месяца (именительный, родительный, сокращения):
+# «2 мартини», «5 декораций» — не даты
+_MONTH_FORMS = (
+    "январь января янв", "февраль февраля фев", "март марта мар", "апрель апреля апр",
+    "май мая", "июнь июня июн", "июль июля июл", "август августа авг",
+    "сентябрь сентября сент сен", "октябрь октября окт", "ноябрь ноября нояб ноя", "декабрь декабря дек",
+)
+_MONTHS = {form: n for n, forms in enumerate(_MONTH_FORMS, 1) for form in forms.split()}
+_WEEKDAYS = (
+    (r"понедельник\w*|пн", 0), (r"вторник\w*|вт", 1), (r"сред[аеуы]|ср", 2), (r"четверг\w*|чт", 3),
+    (r"пятниц\w*|пт", 4), (r"суббот\w*|сб", 5), (r"воскресень\w*|вс", 6),
+)
+
+def _add_months(d, n):
+    month = d.month - 1 + n
+    year, month = d.year + month // 12, month % 12 + 1
+    day = min(d.day, calendar.monthrange(year, month)[1])
+    return d.replace(year=year, month=month, day=day)
+
+def _safe_date(year, month, day):
+    try: return datetime.date(year, month, day)
+    except ValueError: return None
+
+def _year(raw, today):
+    if not raw: return today.year
+    year = int(raw)
+    return year + 2000 if year < 100 else year
+
+def _dated(raw_year, month, day, today):
+    """Дата без года — ближайшая такая же не раньше сегодня («до 3 марта» в октябре — следующий март)."""
+    if raw_year: return _safe_date(_year(raw_year, today), month, day)
+    date = _safe_date(today.year, month, day)
+    if date is None or date < today:
+        date = _safe_date(today.year + 1, month, day) or date
+    return date
+
+def _rule_iso(m, today):
+    return _safe_date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+
+def _rule_numeric(m, today):
+    # группа 2 — месяц при указанном годе, группа 4 — двузначный месяц без года
+    return _dated(m.group(3), int(m.group(2) or m.group(4)), int(m.group(1)), today)
+
+def _rule_month_name(m, today):
+    return _dated(m.group(3), _MONTHS[m.group(2)], int(m.group(1)), today)
+
+def _rule_shift(days):
+    return lambda m, today: today + datetime.timedelta(days=days)
+
+def _rule_through(m, today):
+    raw, unit = m.group(1), m.group(2)
+    n = int(raw) if raw and raw.isdigit() else _NUMBERS.get(raw, 1)
+    if unit.startswith("нед"): return today + datetime.timedelta(weeks=n)
+    if unit.startswith("мес"): return _add_months(today, n)
+    return today + datetime.timedelta(days=n)
+
+def _rule_weekday(weekday):
+    def rule(m, today):
+        if m.group(1):  # «в следующую пятницу» — пятница следующей недели
+            monday = today + datetime.timedelta(days=7 - today.weekday())
+            return monday + datetime.timedelta(days=weekday)
+        return today + datetime.timedelta(days=(weekday - today.weekday()) % 7)
+    return rule
+
+def _rule_next_week(m, today):
+    return today + datetime.timedelta(days=7 - today.weekday())
+
+def _rule_weekend(m, today):
+    return today + datetime.timedelta(days=(5 - today.weekday()) % 7 if today.weekday() < 6 else 0)
+
+_DATE_RULES = [
+    (re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b"), _rule_iso),
+    # «25.12», «1/11/27», «1.5.2027»; без года месяц двузначный — «на 1.5» это не дата
+    (re.compile(r"(?<![\d:.])(\d{1,2})[./](?:(\d{1,2})[./](\d{4}|\d{2})|(\d{2}))(?![\d:])"), _rule_numeric),
+    (re.compile(
+        r"\b(\d{1,2})\s+(" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\b\.?(?:\s+(\d{4}))?"
+    ), _rule_month_name),
+    (re.compile(r"\bпослезавтра\b"), _rule_shift(2)),
+    (re.compile(r"\bзавтра\b"), _rule_shift(1)),
+    (re.compile(r"\bсегодня\b"), _rule_shift(0)),
+    (re.compile(r"\bчерез\s+(?:(\d+|" + "|".join(_NUMBERS) + r")\s+)?(д|ден|нед|мес)[а-я]*"), _rule_through),
+    (re.compile(r"\b(?:на\s+)?следующей\s+неделе\b"), _rule_next_week),
+    (re.compile(r"\b(?:на|в|к)\s+выходны[ех]\b"), _rule_weekend),
+] + [
+    (re.compile(r"(?:\b(?:в|во|к|до|на)\s+)?(?:(следующ[а-я]*)\s+)?\b(?:" + pattern + r")\b"), _rule_weekday(wd))
+    for pattern, wd in _WEEKDAYS
+]
+
+_TIME_RULES = [
+    re.compile(r"\b(\d{1,2}):(\d{2})\b()"),
+    # «в 19 ч», «в 7 вечера», «в 2 часа дня»
+    re.compile(r"\bв\s+(\d{1,2})\s*()(?:ч(?:ас[а-я]*)?\b(?:\s+(утра|дня|вечера|ночи)\b)?|(утра|дня|вечера|ночи)\b)"),
+]
+
+def _parse_time(text):
+    for rx in _TIME_RULES:
+        m = rx.search(text)
+        if not m: continue
+        hour, minute = int(m.group(1)), int(m.group(2) or 0)
+        part = next((g for g in m.groups()[2:] if g), "")
+        if part in ("дня", "вечера") and hour < 12: hour += 12
+        if part == "ночи" and hour == 12: hour = 0
+        if hour < 24 and minute < 60:
+            return datetime.time(hour, minute)
+    return None
+
+@functools.lru_cache(maxsize=4096)
+def _parse(text, today):
+    date = None
+    for rx, rule in _DATE_RULES:
+        m = rx.search(text)
+        if m:
+            date = rule(m, today)
+            if date is not None: break
+    time = _parse_time(text)
+    if date is None and time is not None:
+        date = today
+    return Due(date, time)
+
+def parse_due_ex(text, today=None):
+    """Срок из фразы: Due(date, time); поля None, если не распознаны."""
+    text = (text or "").lower().replace("ё", "е").strip()
+    if not text:
+        return Due(None, None)
+    return _parse(text, today or datetime.date.today())
+
+def parse_due(text, today=None):
+    """Срок в ISO (YYYY-MM-DD) или "" — как раньше; время см. parse_due_ex."""
+    due = parse_due_ex(text, today)
+    return due.date.isoformat() if due.date else ""
+
+def due_str(text, today=None):
+    """Срок для колонки Inbox: дата и, если указано, время."""
+    due = parse_due_ex(text, today)
+    if due.date is None: return ""
+    return f"{due.date.isoformat()} {due.time:%H:%M}" if due.time else due.date.isoformat()
 
 def score_task(task, eff_list):
     prio = float(task.get("Приоритет", task.get("Приоритет(1-3)","2")) or 2)
@@ -34,6 +171,79 @@ def score_task(task, eff_list):
             except: pass
     return prio*2 + effect/5 + (100-progress)/50 + (30 - min(days_left,30))/10
 
+# ── Пакетное ранжирование ──────────────────────────────────────────
+class RankingEngine:
+    """
+    То же, что score_task, но для всего бэклога сразу: эффекты чек-листа
+    разбираются один раз и сворачиваются в индекс «категория → макс. эффект»,
+    задачи превращаются в колонки (NumPy, если установлен), top-k берётся
+    частичным отбором вместо полной сортировки. Баллы совпадают со score_task.
+    """
+
+    def __init__(self, eff_list):
+        self._eff = []
+        for e in eff_list:
+            try:
+                value = float(str(e.get("Потенциал_прироста_%","0")).replace("+","").replace(",",".") or 0)
+            except: continue
+            self._eff.append((str(e.get("Направление","")).lower(), value))
+        self._by_category = {}
+
+    def effect_for(self, category):
+        effect = self._by_category.get(category)
+        if effect is None:
+            effect = 0.0
+            for direction, value in self._eff:
+                if category in direction:
+                    effect = max(effect, value)
+            self._by_category[category] = effect
+        return effect
+
+    def columns(self, tasks, today=None):
+        """Задачи → колонки (приоритет, прогресс, дней до дедлайна, эффект)."""
+        today = today or datetime.date.today()
+        deadlines = {}
+        prio, progress, days, effect = [], [], [], []
+        for task in tasks:
+            prio.append(float(task.get("Приоритет", task.get("Приоритет(1-3)","2")) or 2))
+            progress.append(float(task.get("Прогресс_%", 0) or 0))
+            raw = str(task.get("Дедлайн",""))
+            left = deadlines.get(raw)
+            if left is None:
+                left = 30.0
+                try:
+                    d = datetime.datetime.strptime(raw, "%Y-%m-%d").date()
+                    left = max((d - today).days, 0)
+                except: pass
+                deadlines[raw] = left
+            days.append(left)
+            effect.append(self.effect_for(task.get("Категория","").lower()))
+        return prio, progress, days, effect
+
+    def scores(self, tasks, today=None):
+        prio, progress, days, effect = self.columns(tasks, today)
+        if np is None:
+            return [p*2 + e/5 + (100-g)/50 + (30 - min(d,30))/10
+                    for p, g, d, e in zip(prio, progress, days, effect)]
+        prio, progress, days, effect = (np.asarray(c, dtype=float) for c in (prio, progress, days, effect))
+        return prio*2 + effect/5 + (100-progress)/50 + (30 - np.minimum(days, 30))/10
+
+    def top(self, tasks, k=3, today=None):
+        """k лучших задач; при равных баллах раньше идёт та, что выше в списке (как у sorted)."""
+        tasks = list(tasks)
+        if k <= 0 or not tasks:
+            return []
+        scores = self.scores(tasks, today)
+        if np is None or k >= len(tasks):
+            order = heapq.nsmallest(k, range(len(tasks)), key=lambda i: (-scores[i], i))
+            return [tasks[i] for i in order]
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[: k - len(above)]
+        chosen = np.concatenate([above, ties])
+        chosen = chosen[np.lexsort((chosen, -scores[chosen]))]
+        return [tasks[i] for i in chosen]
+
+
 def pick_next(tasks, eff_list, top=3):
-    ranked = sorted(((score_task(t, eff_list), t) for t in tasks), key=lambda x: x[0], reverse=True)
-    return [t for _, t in ranked[:top]]
+    return RankingEngine(eff_list).top(tasks, top)
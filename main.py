@@ -1,6 +1,10 @@
 import os
 import logging
+import tempfile
 import datetime as dt
+
+import startup  # до тяжёлых импортов: от него считается время старта
+from dateutil import tz as _tz
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram import ReplyKeyboardMarkup
 from telegram.ext import (
@@ -10,12 +14,25 @@ from telegram.ext import (
     filters,
     ContextTypes,
     CallbackQueryHandler,
+    PersistenceInput,
 )
 
-from gpt_brain import gpt_analyze_status, gpt_continue_status
-from google_sheets import fetch_kpi, append_inbox
-from calendar_api import list_events_between, pretty_events, add_event
-from speech_recognition import recognize_speech
+import services
+import calendar_views
+import executors
+import http_pool
+import logic
+import metrics
+import prewarm
+import resilience
+import sheet_mirror
+import slots
+import webserver
+from inbox_queue import InboxWriter
+from persistence import PERSISTENCE_PATH, SQLitePersistence
+from sheet_cache import cache as SHEET_CACHE
+from tg_stream import ProgressiveMessage
+from gpt_cache import cache as GPT_CACHE
 
 # === НАСТРОЙКИ ===
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
@@ -24,7 +41,20 @@ GOOGLE_CREDENTIALS_JSON = os.getenv("GOOGLE_CREDENTIALS_JSON")
 AUTHOR_NAME = os.getenv("AUTHOR_NAME", "В.П.")
 BASE_URL = os.getenv("BASE_URL", "https://sobranie-bot.onrender.com")
 CALENDAR_ID = os.getenv("CALENDAR_ID", "").strip()
+# Календари видов «день / неделя / месяц» через запятую (по умолчанию — CALENDAR_ID);
+# новые события по-прежнему создаются в CALENDAR_ID
+CALENDAR_IDS = calendar_views.parse_ids(os.getenv("CALENDAR_IDS", CALENDAR_ID))
+# Свободные окна ищутся по всем календарям сразу, включая тот, куда пишем
+SLOT_CALENDARS = calendar_views.parse_ids(",".join([CALENDAR_ID, *CALENDAR_IDS]))
 TZ = os.getenv("TZ", "Europe/Berlin")
+# Сколько апдейтов обрабатывать параллельно (0/1 — строго по очереди, как раньше)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+# Показывать ответ GPT по мере генерации (правками сообщения-заглушки)
+GPT_STREAM = os.getenv("GPT_STREAM", "1").strip().lower() in ("1", "true", "yes")
+# Сколько свободных окон предлагать кнопками
+SLOT_CHOICES = int(os.getenv("SLOT_CHOICES", "3"))
+# Голосовые до этого размера держим в памяти, крупнее — во временном файле
+VOICE_MEM_LIMIT = int(os.getenv("VOICE_MEM_LIMIT", str(10 * 1024 * 1024)))
 def render_menu_inline() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup([
         [InlineKeyboardButton("📊 Статус", callback_data="status")],
@@ -33,7 +63,10 @@ def render_menu_inline() -> InlineKeyboardMarkup:
             InlineKeyboardButton("🗓 Неделя", callback_data="week"),
             InlineKeyboardButton("🗓️ Месяц", callback_data="month"),
         ],
-        [InlineKeyboardButton("➕ Внести", callback_data="capture")],
+        [
+            InlineKeyboardButton("➕ Внести", callback_data="capture"),
+            InlineKeyboardButton("🕳 Свободные окна", callback_data="slots"),
+        ],
         [InlineKeyboardButton("🧪 Диагностика", callback_data="diag")],
         [InlineKeyboardButton("🔗 Календарь (веб)", url="https://calendar.google.com")],
     ])
@@ -52,6 +85,9 @@ def render_menu_reply() -> ReplyKeyboardMarkup:
 
 logging.basicConfig(level=logging.INFO)
 
+# Очередь записи в Inbox: ответ пользователю сразу, строки уходят пачками
+INBOX = InboxWriter(GOOGLE_SHEET_ID, GOOGLE_CREDENTIALS_JSON)
+
 
 # --- Глобальный перехватчик ошибок: стек в логи, пользователю — короткое сообщение
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -72,6 +108,7 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
 
 
 # === КОМАНДЫ ===
+@metrics.handler("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "👋 Добро пожаловать! Выберите действие:",
@@ -79,6 +116,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     # и сразу кидаем inline-меню (кнопки с callback)
     await update.message.reply_text("Меню (inline):", reply_markup=render_menu_inline())
+@metrics.handler("menu")
 async def menu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # reply-клавиатура (нижняя большая)
     await update.message.reply_text("🧭 Меню:", reply_markup=render_menu_reply())
@@ -86,11 +124,33 @@ async def menu_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Меню (inline):", reply_markup=render_menu_inline())
 
 # === СТАТУС / KPI ===
+@metrics.handler("status")
 async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await show_status(update, context)
+
+
+async def show_status(update: Update, context: ContextTypes.DEFAULT_TYPE, force: bool = False):
+    # без метрик: кнопки приходят через on_cb, который уже считается
+    # force=True — кнопка «🔄 Обновить»: перечитать KPI и спросить GPT заново, мимо кешей
     logging.info("[CMD] /status")
-    await update.message.reply_text("⏳ Анализирую показатели...")
-    kpi = fetch_kpi(GOOGLE_SHEET_ID, GOOGLE_CREDENTIALS_JSON)
-    result = gpt_analyze_status(kpi)
+    placeholder = await update.message.reply_text("⏳ Анализирую показатели...")
+    if force:
+        SHEET_CACHE.invalidate(GOOGLE_SHEET_ID)
+        sheet_mirror.mirror.invalidate(GOOGLE_SHEET_ID)
+    kpi = await services.fetch_kpi(GOOGLE_SHEET_ID, GOOGLE_CREDENTIALS_JSON)
+    kb = InlineKeyboardMarkup([[
+        InlineKeyboardButton("⏭ Продолжить", callback_data="MORE::status"),
+        InlineKeyboardButton("🔄 Обновить", callback_data="status::refresh"),
+    ]])
+
+    if GPT_STREAM:
+        chunks, prompt = await services.gpt_analyze_status_stream(kpi, force)
+        comment = await ProgressiveMessage(placeholder, "🤖 Анализ:\n").consume(chunks, reply_markup=kb)
+        context.user_data["last_status_prompt"] = prompt
+        context.user_data["last_status_text"] = comment
+        return
+
+    result = await services.gpt_analyze_status(kpi, force)
 
     if isinstance(result, tuple) and len(result) >= 2:
         comment, prompt = result
@@ -100,12 +160,16 @@ async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["last_status_prompt"] = prompt
     context.user_data["last_status_text"] = comment
 
-    kb = InlineKeyboardMarkup([[InlineKeyboardButton("⏭ Продолжить", callback_data="MORE::status")]])
     await update.message.reply_text(f"🤖 Анализ:\n{comment}", reply_markup=kb)
 
 
 # === САМО-ДИАГНОСТИКА ===
+@metrics.handler("diag")
 async def diag_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await show_diag(update, context)
+
+
+async def show_diag(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logging.info("[CMD] /diag")
     from datetime import datetime, timedelta
     calendar_id = CALENDAR_ID
@@ -136,11 +200,13 @@ async def diag_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             cal_probe = "❌ CALENDAR_ID не задан"
         else:
             now = datetime.utcnow()
-            events = list_events_between(calendar_id, creds_raw, now, now + timedelta(days=3), max_results=3)
+            events = await services.list_events_between(
+                calendar_id, creds_raw, now, now + timedelta(days=3), max_results=3, cached=False
+            )
             if not events:
                 cal_probe = "✅ Календарь читается, событий нет."
             else:
-                cal_probe = "✅ Календарь читается. Ближайшие события:\n" + pretty_events(events)
+                cal_probe = "✅ Календарь читается. Ближайшие события:\n" + services.pretty_events(events)
     except Exception as e:
         cal_probe = f"❌ Ошибка чтения календаря: {e}"
 
@@ -148,19 +214,96 @@ async def diag_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     stt_probe.append("Yandex SpeechKit: " + ("✅ ключ задан" if y_key and y_folder else "❌ нет ключа/FolderID"))
     stt_probe.append("OpenAI: " + ("✅ ключ задан" if oai else "— (не используется)"))
 
+    st = INBOX.stats()
+    inbox_probe = (
+        f"очередь {st['backlog']}, записано {st['rows_written']}, "
+        f"flush {st['last_flush_ms']} мс (ср. {st['avg_flush_ms']}), ошибок {st['failures']}"
+        + (f", журнал: дослано {st['replayed']}, дублей отсеяно {st['deduplicated']}" if st["journal"] else "")
+    )
+    sc = SHEET_CACHE.stats()
+    cache_probe = f"hit {sc['hits']} / miss {sc['misses']} (ревизия ок: {sc['revalidated']}), доля {sc['hit_ratio']}"
+    if context.application.bot_data.get("sheet_mirror"):
+        ms = sheet_mirror.mirror.stats()
+        mirror_probe = (
+            f"{sheet_mirror.SHEET_MIRROR_PATH}: обновлений {ms['refreshes']} (последнее {ms['last_refresh_ms']} мс), "
+            f"без изменений {ms['skipped']}, строк записано {ms['rows_written']}, листов готово {ms['sheets']}"
+            + (f", ошибка: {ms['last_error']}" if ms["last_error"] else "")
+        )
+    else:
+        mirror_probe = "— (SHEET_MIRROR_PATH не задан)"
+    gc = GPT_CACHE.stats()
+    gpt_probe = f"{gc['entries']} ответов, hit {gc['hits']} / miss {gc['misses']}"
+    backends_probe = "; ".join(
+        f"{name}: {st['state']}, выз. {st['calls']}, повторов {st['retried']}, отказов {st['rejected']}"
+        for name, st in resilience.stats().items()
+    )
+    store = context.application.persistence
+    if isinstance(store, SQLitePersistence):
+        ps = store.stats()
+        state_probe = (
+            f"SQLite {store.path}: коммитов {ps['commits']} (последний {ps['last_commit_ms']} мс), "
+            f"записано {ps['rows_written']}, без изменений {ps['rows_skipped']}, в очереди {ps['pending']}"
+        )
+    else:
+        state_probe = "— (PERSISTENCE_PATH не задан)"
+    warmer = context.application.bot_data.get("prewarm")
+    if warmer is not None and warmer.runs:
+        ws = warmer.stats()
+        ago = (dt.datetime.now().timestamp() - ws["last_run"]) / 60
+        prewarm_probe = f"{ws['runs']} раз, последний {ago:.0f} мин назад ({ws['last_ms']} мс): " + ", ".join(
+            f"{name} {result}" for name, result in ws["last"].items()
+        )
+    else:
+        prewarm_probe = f"по расписанию {prewarm.PREWARM_TIMES or '—'}, ещё не было" if warmer else "— (выключен)"
+    boot = startup.stats()
+    marks = boot["marks_ms"]
+    boot_probe = (
+        f"готов {marks.get('built', '—')} мс, порт {marks.get('listening', '—')} мс, "
+        f"прогрев {marks.get('warm', '—')} мс" + (f", не загружены: {', '.join(boot['pending'])}" if boot["pending"] else "")
+    )
+    stt_lat = "; ".join(
+        f"{name}: {st['calls']} выз., побед {st['win_rate']:.0%}, p50 {st['p50_s'] or '—'} с, p95 {st['p95_s'] or '—'} с"
+        for name, st in services.stt_stats().items()
+    )
+
     msg = (
         "🧪 DIAG:\n"
         f"• CALENDAR_ID: {calendar_id or '—'}\n"
+        f"• CALENDAR_IDS (виды): {', '.join(CALENDAR_IDS) or '—'}\n"
         f"• GOOGLE_CREDENTIALS_JSON: {creds_kind}\n"
         f"• TZ: {tz}\n"
         f"• BASE_URL: {base_url or '—'}\n"
-        f"• STТ: {', '.join(stt_probe)}\n\n"
+        f"• STТ: {', '.join(stt_probe)}\n"
+        f"• STT ({services.stt_mode()}): {stt_lat}\n"
+        f"• Inbox: {inbox_probe}\n"
+        f"• Кеш таблиц: {cache_probe}\n"
+        f"• Копия таблицы: {mirror_probe}\n"
+        f"• Кеш GPT: {gpt_probe}\n"
+        f"• Бэкенды: {backends_probe}\n"
+        f"• Состояние: {state_probe}\n"
+        f"• Прогрев: {prewarm_probe}\n"
+        f"• Старт (lazy={boot['lazy']}): {boot_probe}\n\n"
         f"{cal_probe}"
     )
     await update.message.reply_text(msg)
 
 
 # === ОБРАБОТКА НАЖАТИЙ ===
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+# Маршруты on_cb для метрик (всё прочее — "other", чтобы не плодить метки)
+CB_ROUTES = {"diag", "status", "status::refresh", "day", "week", "month", "capture", "slots", "MORE::status"}
+CB_PREFIXES = {"POM", "CAL"}
+
+
+def cb_route(update: Update) -> str:
+    raw = (update.callback_query.data if update.callback_query else "") or ""
+    if raw in CB_ROUTES:
+        return raw
+    prefix = raw.split("::")[0]
+    return prefix if prefix in CB_PREFIXES else "other"
+
+
+@metrics.handler("callback", route=cb_route)
 async def on_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
@@ -172,13 +315,13 @@ async def on_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if raw == "diag":
         # «проксируем» на /diag, чтобы логика была одна
         fake_update = Update(update.update_id, message=q.message)
-        await diag_cmd(fake_update, context)
+        await show_diag(fake_update, context)
         return
     # --- Статус KPI по кнопке ---
-    if raw == "status":
+    if raw in ("status", "status::refresh"):
         # Проксируем в тот же хендлер, что и команда /status
         fake_update = Update(update.update_id, message=q.message)
-        await status_cmd(fake_update, context)
+        await show_status(fake_update, context, force=(raw == "status::refresh"))
         return
 
     # --- Список событий (день / неделя / месяц)
@@ -194,17 +337,22 @@ async def on_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
             end = now + dt.timedelta(days=30)
             title = "🗓️ На 30 дней"
 
-        if not CALENDAR_ID:
+        if not CALENDAR_IDS:
             await q.edit_message_text("❌ CALENDAR_ID не задан в переменных окружения.", reply_markup=None)
             return
 
         try:
-            events = list_events_between(CALENDAR_ID, GOOGLE_CREDENTIALS_JSON, now, end)
-            text = pretty_events(events)
+            events, failed = await services.list_events_merged(CALENDAR_IDS, GOOGLE_CREDENTIALS_JSON, now, end)
+            text = services.pretty_events(events)
             out = f"{title}:\n{text}" if text.strip() else f"{title}:\n—"
+            if failed:
+                out += "\n\n⚠️ Не удалось прочитать: " + "; ".join(
+                    f"{cid} ({resilience.describe(e, resilience.CALENDAR)})" for cid, e in failed.items()
+                )
             await q.edit_message_text(out, reply_markup=None)
         except Exception as e:
-            await q.edit_message_text(f"Не удалось получить события календаря: {e}", reply_markup=None)
+            reason = resilience.describe(e, resilience.CALENDAR)
+            await q.edit_message_text(f"Не удалось получить события календаря: {reason}", reply_markup=None)
         return
 
     # --- обработка кнопки «Внести задачу»
@@ -220,79 +368,125 @@ async def on_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not prompt or not so_far:
             await q.message.reply_text("Нечего продолжать. Сначала нажми «📊 Статус».")
             return
-        cont = gpt_continue_status(prompt, so_far)
+        if GPT_STREAM:
+            msg = await q.message.reply_text("🤖 Продолжение:\n⏳")
+            chunks = await services.gpt_continue_status_stream(prompt, so_far)
+            cont = await ProgressiveMessage(msg, "🤖 Продолжение:\n").consume(chunks)
+            context.user_data["last_status_text"] = so_far + "\n" + cont
+            return
+        cont = await services.gpt_continue_status(prompt, so_far)
         context.user_data["last_status_text"] = so_far + "\n" + cont
         await q.message.reply_text(f"🤖 Продолжение:\n{cont}")
         return
 
-    # --- обработка спринтов (если будут кнопки POM::dur::idx)
+    # --- обработка спринтов (если будут кнопки POM::dur::idx; idx=all — весь фокус-список подряд)
     if len(data) >= 3 and data[0] == "POM":
+        top = context.user_data.get("free_top", [])
         try:
             duration = int(data[1])
-            idx = int(data[2]) - 1
+            picked = range(len(top)) if data[2] == "all" else [int(data[2]) - 1]
         except Exception:
             await q.edit_message_text("Ошибка в данных кнопки. Попробуй снова.")
             return
 
-        top = context.user_data.get("free_top", [])
-        if not (0 <= idx < len(top)):
+        if not picked or not all(0 <= idx < len(top) for idx in picked):
             await q.edit_message_text("Список устарел. Нажми «🎯 Фокус» ещё раз.")
             return
 
-        t = top[idx]
-        ttl = f"{t.get('Категория','?')} — {t.get('Проект','?')}: {t.get('Задача','?')}"
+        # спринты — в свободные окна начиная с завтра 06:00 по TZ (не нашлось — встык)
+        now_local = dt.datetime.now(_tz.gettz(TZ))
+        first = (now_local + dt.timedelta(days=1)).replace(hour=6, minute=0, second=0, microsecond=0)
+        starts = await free_starts(duration, first, len(picked))
+        while len(starts) < len(picked):
+            starts.append(starts[-1] + dt.timedelta(minutes=duration) if starts else first)
+        sprints = []
+        for start, idx in zip(starts, picked):
+            t = top[idx]
+            ttl = f"{t.get('Категория','?')} — {t.get('Проект','?')}: {t.get('Задача','?')}"
+            sprints.append({
+                "summary": f"[СПРИНТ {duration} мин] {ttl}",
+                "minutes": duration,
+                "start_dt": start,
+                "description": "Автозапись из VP Assistant (🎯 Фокус)",
+            })
 
         # 1) фиксируем выбор в Inbox
-        append_inbox(
-            GOOGLE_SHEET_ID,
-            GOOGLE_CREDENTIALS_JSON,
-            f"[СПРИНТ {duration} мин] {ttl}",
-            category="Собрание",
-            due_str="завтра",
-            author=AUTHOR_NAME,
-        )
-        # 2) создаём событие завтра 06:00 по TZ
+        for sprint in sprints:
+            # окно может выпасть и позже завтрашнего дня — срок по фактическому старту
+            INBOX.submit(sprint["summary"], category="Собрание", due_str=f"{sprint['start_dt']:%Y-%m-%d %H:%M}",
+                         author=AUTHOR_NAME)
+        # 2) создаём события одним batch-запросом на каждые 50
         try:
-            created = add_event(
-                summary=f"[СПРИНТ {duration} мин] {ttl}",
-                minutes=duration,
-                start_dt=None,  # завтра 06:00 (см. calendar_api.add_event)
-                description="Автозапись из VP Assistant (🎯 Фокус)",
-            )
-            link = created.get("htmlLink", "—")
-            await q.edit_message_text(
-                f"🧭 Запланировал спринт: {duration} мин.\n"
-                f"Старт: завтра 06:00 ({TZ}).\n"
-                f"Календарь: {link}"
-            )
+            results = await services.add_events(sprints)
         except Exception as e:
+            results = [(None, e)] * len(sprints)
+        created = [event for event, _ in results if event is not None]
+        errors = [error for _, error in results if error is not None]
+        if not created:
             await q.edit_message_text(
                 "🧭 Спринт внесён в список дел, но событие в календарь не создалось.\n"
-                f"Причина: {e}"
+                f"Причина: {resilience.describe(errors[0], resilience.CALENDAR)}"
+            )
+            return
+        when = f"{starts[0]:%d.%m %H:%M} ({TZ})"
+        if len(sprints) == 1:
+            text = (
+                f"🧭 Запланировал спринт: {duration} мин.\n"
+                f"Старт: {when}.\n"
+                f"Календарь: {created[0].get('htmlLink', '—')}"
             )
+        else:
+            text = f"🧭 Запланировал спринтов: {len(created)} × {duration} мин.\nПервый: {when}, дальше — в свободные окна."
+        if errors:
+            text += f"\n⚠️ Не создано событий: {len(errors)} ({resilience.describe(errors[0], resilience.CALENDAR)})"
+        await q.edit_message_text(text)
+        return
+
+    # --- свободные окна: ближайшие SLOT_CHOICES окон по часу кнопками CAL::AT::<unix>::60
+    if raw == "slots":
+        try:
+            found = await services.find_free_slots(SLOT_CALENDARS, GOOGLE_CREDENTIALS_JSON, 60, count=SLOT_CHOICES)
+        except Exception as e:
+            await q.edit_message_text(f"Не удалось найти окна: {resilience.describe(e, resilience.CALENDAR)}")
+            return
+        if not found:
+            await q.edit_message_text(f"Свободных окон по 60 мин в ближайшие дни нет ({slots.WORK_HOURS}).")
+            return
+        kb = InlineKeyboardMarkup([
+            [InlineKeyboardButton(
+                f"{WEEKDAYS[start.weekday()]} {start:%d.%m %H:%M}–{end:%H:%M}",
+                callback_data=f"CAL::AT::{int(start.timestamp())}::60",
+            )]
+            for start, end in found
+        ])
+        await q.edit_message_text(f"🕳 Ближайшие свободные окна ({TZ}), 60 мин:", reply_markup=kb)
         return
 
-    # --- обработка быстрых пресетов календаря (если будут CAL::PRESET::DUR)
+    # --- обработка быстрых пресетов календаря (CAL::PRESET::DUR; AT — CAL::AT::<unix>::DUR)
     if len(data) >= 3 and data[0] == "CAL":
         preset = data[1]
         try:
-            duration = int(data[2])
+            duration = int(data[-1])
         except Exception:
             duration = 60
 
-        now_local = dt.datetime.now()
-        # делаем start_dt «наивным» — calendar_api сам подставит TZ
+        now_local = dt.datetime.now(_tz.gettz(TZ))
         if preset == "TODAY19":
-            start_dt = now_local.replace(hour=19, minute=0, second=0, microsecond=0)
-            if start_dt < now_local:
-                start_dt = start_dt + dt.timedelta(days=1)
-        elif preset == "TOMORROW06":
-            start_dt = (now_local + dt.timedelta(days=1)).replace(hour=6, minute=0, second=0, microsecond=0)
-        else:
-            start_dt = (now_local + dt.timedelta(days=1)).replace(hour=6, minute=0, second=0, microsecond=0)
+            wanted = now_local.replace(hour=19, minute=0, second=0, microsecond=0)
+            if wanted < now_local:
+                wanted = wanted + dt.timedelta(days=1)
+        elif preset == "AT" and len(data) >= 4 and data[2].isdigit():
+            wanted = dt.datetime.fromtimestamp(int(data[2]), now_local.tzinfo)
+        elif preset == "FREE":
+            wanted = now_local
+        else:  # TOMORROW06
+            wanted = (now_local + dt.timedelta(days=1)).replace(hour=6, minute=0, second=0, microsecond=0)
+
+        # не бронируем вслепую: первое свободное окно не раньше желаемого времени
+        start_dt = (await free_starts(duration, wanted, 1) or [wanted])[0]
 
         try:
-            created = add_event(
+            created = await services.add_event(
                 summary=f"[Слот {duration} мин] Фокус-набор",
                 minutes=duration,
                 start_dt=start_dt,
@@ -300,13 +494,29 @@ async def on_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             link = created.get("htmlLink", "—")
             when = start_dt.strftime("%Y-%m-%d %H:%M")
-            await q.edit_message_text(f"✅ Слот создан: {duration} мин • {when} ({TZ})\n{link}")
+            moved = ""
+            if preset != "FREE" and start_dt != wanted:
+                moved = f"\n(на {wanted:%d.%m %H:%M} занято — взял ближайшее свободное окно)"
+            await q.edit_message_text(f"✅ Слот создан: {duration} мин • {when} ({TZ}){moved}\n{link}")
         except Exception as e:
-            await q.edit_message_text(f"Не удалось создать слот: {e}")
+            await q.edit_message_text(f"Не удалось создать слот: {resilience.describe(e, resilience.CALENDAR)}")
         return
 
 
+async def free_starts(minutes: int, after: dt.datetime, count: int) -> list:
+    """Начала свободных окон (пусто, если календарь недоступен — тогда бронируем как просили)."""
+    if not SLOT_CALENDARS:
+        return []
+    try:
+        found = await services.find_free_slots(SLOT_CALENDARS, GOOGLE_CREDENTIALS_JSON, minutes, after, count)
+    except Exception as e:
+        logging.warning("Free slot search failed: %r", e)
+        return []
+    return [start for start, _ in found]
+
+
 # === ДОБАВЛЕНИЕ ТЕКСТА ===
+@metrics.handler("text")
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # ЛОГИРУЕМ полученный текст
     logging.info(f"[TXT] text={(update.message.text or '').strip()}")
@@ -314,31 +524,89 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get("capture_mode"):
         context.user_data["capture_mode"] = False
         text = update.message.text
-        append_inbox(GOOGLE_SHEET_ID, GOOGLE_CREDENTIALS_JSON, text, author=AUTHOR_NAME)
+        INBOX.submit(text, due_str=logic.due_str(text), author=AUTHOR_NAME)
         await update.message.reply_text(f"✅ Задача добавлена:\n{text}")
         return
 
     await update.message.reply_text("💬 Используйте кнопки меню для выбора действия.")
 
 # === ОБРАБОТКА ГОЛОСА ===
+@metrics.handler("voice")
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     voice = update.message.voice
     file = await context.bot.get_file(voice.file_id)
-    file_path = "voice.ogg"
-    await file.download_to_drive(file_path)
 
-    text = recognize_speech(file_path)
+    if (voice.file_size or 0) <= VOICE_MEM_LIMIT:
+        # один буфер на апдейт — его же получают все STT-бэкенды
+        audio = bytes(await file.download_as_bytearray())
+        text = await services.recognize_speech(audio)
+    else:
+        fd, file_path = tempfile.mkstemp(prefix="voice-", suffix=".ogg")
+        os.close(fd)
+        try:
+            await file.download_to_drive(file_path)
+            text = await services.recognize_speech(file_path)
+        finally:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
     if text.startswith("⚠️"):
         await update.message.reply_text(text)
         return
 
-    append_inbox(GOOGLE_SHEET_ID, GOOGLE_CREDENTIALS_JSON, text, author=AUTHOR_NAME)
+    INBOX.submit(text, due_str=logic.due_str(text), author=AUTHOR_NAME)
     await update.message.reply_text(f"🗣 Распознал и добавил:\n{text}")
 
 
-# === ГЛАВНАЯ ФУНКЦИЯ ===
-def main():
-    app = Application.builder().token(TELEGRAM_TOKEN).build()
+# === ЗАПУСК / ОСТАНОВКА ===
+async def on_startup(app: Application) -> None:
+    # общий пул соединений к OpenAI / Yandex — один на процесс
+    await http_pool.start()
+    INBOX.start()
+
+
+async def on_shutdown(app: Application) -> None:
+    # дописываем хвост очереди Inbox до остановки пула
+    await executors.run_blocking(INBOX.stop)
+    await executors.run_blocking(GPT_CACHE.flush)  # отложенное сохранение кеша GPT
+    await http_pool.close()
+    # дожидаемся незавершённых вызовов в пуле потоков
+    executors.shutdown(wait=True)
+
+
+# === СБОРКА ПРИЛОЖЕНИЯ ===
+def build_app(token: str = None, base_url: str = None, base_file_url: str = None) -> Application:
+    """
+    Application со всеми хендлерами. base_url / base_file_url — другой
+    адрес Bot API (локальный сервер, стенд нагрузочного теста).
+    """
+    builder = (
+        Application.builder()
+        .token(token or TELEGRAM_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES if CONCURRENT_UPDATES > 1 else False)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    if base_file_url:
+        builder = builder.base_file_url(base_file_url)
+    if PERSISTENCE_PATH:
+        # нужен только user_data: режим ввода, контекст «Продолжить», фокус-список
+        builder = builder.persistence(SQLitePersistence(
+            PERSISTENCE_PATH,
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+        ))
+    app = builder.build()
+
+    # прогрев календаря, KPI и анализа GPT перед рабочими часами
+    app.bot_data["prewarm"] = prewarm.schedule(
+        app.job_queue, GOOGLE_SHEET_ID, GOOGLE_CREDENTIALS_JSON, CALENDAR_IDS, TZ
+    )
+
+    # локальная копия таблицы: задачи, KPI и чек-лист читаются из SQLite
+    app.bot_data["sheet_mirror"] = sheet_mirror.schedule(app.job_queue, GOOGLE_SHEET_ID, GOOGLE_CREDENTIALS_JSON)
 
     # команды
     app.add_handler(CommandHandler("start", start))
@@ -355,13 +623,22 @@ def main():
 
     # глобальный обработчик ошибок
     app.add_error_handler(error_handler)
+    return app
+
+
+# === ГЛАВНАЯ ФУНКЦИЯ ===
+def main():
+    app = build_app()
+    logging.info("App built %.0f ms after start", startup.mark("built"))
 
-    # Webhook для Render
-    app.run_webhook(
+    # Webhook для Render (+ /metrics и /healthz на том же порту)
+    webserver.run(
+        app,
         listen="0.0.0.0",
         port=int(os.environ.get("PORT", 8080)),
         url_path=TELEGRAM_TOKEN,
         webhook_url=f"{BASE_URL}/{TELEGRAM_TOKEN}",
+        on_listen=startup.on_listen,  # после открытия порта — фоновый прогрев SDK
     )
 
 
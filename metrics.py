@@ -0,0 +1,277 @@
+# metrics.py
+"""
+Метрики бота в текстовом формате Prometheus (без внешних зависимостей).
+
+Счётчики, гистограммы и gauge с метками; render() отдаёт всё, что
+накоплено, для GET /metrics (см. webserver.py). Что меряется:
+
+  bot_handler_*        — вызовы и длительность хендлеров, маршруты on_cb, in-flight;
+  bot_external_call_*  — вызовы Sheets / Calendar / OpenAI / Yandex STT;
+  bot_backend_*, bot_circuit_state — повторы, лимиты и breaker'ы (resilience.py);
+  bot_openai_tokens_total — расход токенов по ответам API;
+  bot_cache_*          — попадания в кеши таблиц и GPT (считаются при опросе);
+  bot_prewarm_total    — цели прогрева по расписанию (prewarm.py) и их исход;
+  bot_webhook_*        — запросы к webhook-эндпоинту.
+
+METRICS_ENABLED=0 — декораторы возвращают исходные функции, а таймеры —
+общий пустой объект: накладные расходы почти нулевые.
+
+Сервер публичный, поэтому /metrics отдаётся только с
+"Authorization: Bearer <METRICS_TOKEN>" (bearer_token в scrape_config
+Prometheus); без METRICS_TOKEN — только запросам с localhost.
+"""
+import os
+import time
+import bisect
+import functools
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").strip().lower() in ("1", "true", "yes")
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+
+# секунды: от быстрых ответов кеша до долгой генерации / распознавания
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REGISTRY: List["_Metric"] = []
+
+Collect = Callable[[], Iterable[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), collect: Optional[Collect] = None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect  # значения, вычисляемые в момент опроса
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def _lines(self) -> Iterable[str]:
+        if self.collect is not None:
+            for labels, value in self.collect():
+                yield f"{self.name}{_labels(self.labels, self._key(labels))} {_num(value)}"
+            return
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labels, key)} {_num(value)}"
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self._lines())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [счётчики по корзинам (+Inf последним), сумма]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def _lines(self) -> Iterable[str]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                le = 'le="%s"' % _num(bound)
+                yield f"{self.name}_bucket{_labels(self.labels, key, le)} {running}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_num(round(total, 6))}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {running}"
+
+
+def render() -> str:
+    """Все метрики в формате text/plain; version=0.0.4."""
+    return "".join(m.render() for m in REGISTRY)
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ── Метрики бота ───────────────────────────────────────────────────
+HANDLER_REQUESTS = Counter("bot_handler_requests_total", "Вызовы хендлеров", ("handler", "route", "outcome"))
+HANDLER_SECONDS = Histogram("bot_handler_duration_seconds", "Длительность хендлеров", ("handler", "route"))
+HANDLER_IN_FLIGHT = Gauge("bot_handlers_in_flight", "Хендлеры в работе", ("handler",))
+
+EXTERNAL_CALLS = Counter("bot_external_calls_total", "Вызовы внешних сервисов", ("service", "op", "outcome"))
+EXTERNAL_SECONDS = Histogram("bot_external_call_duration_seconds", "Длительность вызовов внешних сервисов",
+                             ("service", "op"))
+EXTERNAL_IN_FLIGHT = Gauge("bot_external_calls_in_flight", "Незавершённые вызовы внешних сервисов", ("service",))
+
+OPENAI_TOKENS = Counter("bot_openai_tokens_total", "Токены OpenAI по ответам API", ("model", "kind"))
+
+BACKEND_RETRIES = Counter("bot_backend_retries_total", "Повторы запросов к внешним сервисам", ("service", "reason"))
+BACKEND_REJECTED = Counter("bot_backend_rejected_total", "Запросы, отклонённые разомкнутым breaker'ом", ("service",))
+BACKEND_WAIT_SECONDS = Histogram("bot_backend_wait_seconds", "Ожидание лимита запросов и свободного слота",
+                                 ("service",), buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+
+PREWARM_RUNS = Counter("bot_prewarm_total", "Прогрев кешей по расписанию", ("target", "result"))
+
+WEBHOOK_REQUESTS = Counter("bot_webhook_requests_total", "Запросы к webhook", ("status",))
+WEBHOOK_SECONDS = Histogram("bot_webhook_duration_seconds", "Время ответа webhook",
+                            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
+
+def _cache_stats():
+    # локальные импорты: metrics не тянет за собой модули с зависимостями
+    from sheet_cache import cache as sheets
+    from gpt_cache import cache as gpt
+    return {"sheets": sheets.stats(), "gpt": gpt.stats()}
+
+
+Gauge("bot_cache_hits", "Попадания в кеш (с момента запуска)", ("cache",),
+      collect=lambda: [({"cache": k}, s["hits"]) for k, s in _cache_stats().items()])
+Gauge("bot_cache_misses", "Промахи кеша (с момента запуска)", ("cache",),
+      collect=lambda: [({"cache": k}, s["misses"]) for k, s in _cache_stats().items()])
+Gauge("bot_cache_hit_ratio", "Доля попаданий в кеш", ("cache",),
+      collect=lambda: [({"cache": k}, s["hit_ratio"]) for k, s in _cache_stats().items()])
+
+
+def _circuit_states():
+    from resilience import BACKENDS
+    codes = {"closed": 0, "open": 1, "half_open": 2}
+    return [({"service": name}, codes[b.breaker.state]) for name, b in BACKENDS.items()]
+
+
+Gauge("bot_circuit_state", "Состояние breaker'а: 0 — закрыт, 1 — разомкнут, 2 — пробный запрос", ("service",),
+      collect=_circuit_states)
+
+
+# ── Инструментирование ─────────────────────────────────────────────
+class _Call:
+    """Таймер внешнего вызова; outcome можно переопределить внутри блока."""
+    __slots__ = ("service", "op", "outcome", "_started")
+
+    def __init__(self, service: str, op: str):
+        self.service = service
+        self.op = op
+        self.outcome = None
+
+    def __enter__(self) -> "_Call":
+        EXTERNAL_IN_FLIGHT.inc(service=self.service)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        elapsed = time.perf_counter() - self._started
+        EXTERNAL_IN_FLIGHT.dec(service=self.service)
+        outcome = self.outcome or ("error" if exc_type else "ok")
+        EXTERNAL_CALLS.inc(service=self.service, op=self.op, outcome=outcome)
+        EXTERNAL_SECONDS.observe(elapsed, service=self.service, op=self.op)
+
+
+class _NullCall:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+    def __setattr__(self, name, value) -> None:
+        pass  # call.outcome = ... при выключенных метриках ничего не делает
+
+
+_NULL_CALL = _NullCall()
+
+
+def external(service: str, op: str):
+    """with metrics.external("sheets", "read"): ... — таймер вызова внешнего сервиса."""
+    return _Call(service, op) if METRICS_ENABLED else _NULL_CALL
+
+
+def handler(name: str, route: Optional[Callable] = None):
+    """Декоратор async-хендлера PTB: вызовы, длительность и in-flight по имени (и маршруту)."""
+    def wrap(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        async def inner(update, context, *args, **kwargs):
+            label = route(update) if route else ""
+            HANDLER_IN_FLIGHT.inc(handler=name)
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await fn(update, context, *args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                HANDLER_IN_FLIGHT.dec(handler=name)
+                HANDLER_REQUESTS.inc(handler=name, route=label, outcome=outcome)
+                HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name, route=label)
+        return inner
+    return wrap
+
+
+def tokens(model: str, usage) -> None:
+    """usage из ответа OpenAI (prompt_tokens / completion_tokens)."""
+    if not METRICS_ENABLED or usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, kind, None)
+        if value:
+            OPENAI_TOKENS.inc(value, model=model, kind=kind.split("_")[0])
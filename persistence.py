@@ -0,0 +1,343 @@
+# persistence.py
+"""
+Состояние диалогов (context.user_data и др.) в SQLite — переживает рестарт.
+
+В отличие от PicklePersistence, которая при каждом сбросе переписывает
+один большой pickle, здесь каждая запись — отдельная строка таблицы
+(вид, ключ): сохраняются только изменившиеся пользователи/чаты.
+
+  • PTB раз в PERSISTENCE_INTERVAL секунд отдаёт изменённые данные; они
+    копятся в памяти и пишутся одной транзакцией через
+    PERSISTENCE_COMMIT_DELAY секунд — в пуле потоков, не в event loop;
+  • значения — pickle (крупные — ещё и zlib); неизменившиеся не пишутся:
+    по ключу помнится отпечаток последней записи (LRU на
+    PERSISTENCE_CACHE_SIZE ключей);
+  • при старте загружаются PERSISTENCE_PRELOAD последних активных
+    пользователей/чатов, остальные — при первом их апдейте (refresh_*);
+  • WAL и synchronous=NORMAL: запись не блокирует чтение и не ждёт fsync
+    на каждую транзакцию.
+
+PERSISTENCE_PATH пустой — без сохранения состояния (как раньше). На Render
+путь должен вести на постоянный диск, иначе файл пропадёт при деплое.
+"""
+import os
+import json
+import time
+import zlib
+import pickle
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from executors import run_blocking
+
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "bot_state.sqlite3").strip()
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "10"))
+PERSISTENCE_COMMIT_DELAY = float(os.getenv("PERSISTENCE_COMMIT_DELAY", "0.5"))
+# Пауза перед повтором неудавшегося коммита растёт вдвое до этого предела
+PERSISTENCE_RETRY_MAX = float(os.getenv("PERSISTENCE_RETRY_MAX", "30"))
+PERSISTENCE_CACHE_SIZE = int(os.getenv("PERSISTENCE_CACHE_SIZE", "1024"))
+PERSISTENCE_PRELOAD = int(os.getenv("PERSISTENCE_PRELOAD", "500"))
+# Значения крупнее порога сжимаются
+COMPRESS_MIN = 512
+
+USER, CHAT, BOT, CALLBACK, CONVERSATION = "user", "chat", "bot", "callback", "conv"
+
+_DELETED = object()  # отметка «удалить ключ» в очереди записи
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    kind    TEXT NOT NULL,
+    key     TEXT NOT NULL,
+    value   BLOB NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS state_recent ON state (kind, updated);
+"""
+
+
+def dumps(obj) -> bytes:
+    return pack(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def pack(raw: bytes) -> bytes:
+    """Готовый pickle → значение колонки (сжатое, если так короче)."""
+    if len(raw) >= COMPRESS_MIN:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return b"z" + packed
+    return b"p" + raw
+
+
+def loads(blob: bytes):
+    tag, body = blob[:1], blob[1:]
+    return pickle.loads(zlib.decompress(body) if tag == b"z" else body)
+
+
+def _digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+
+def _conv_key(name: str, key: Tuple) -> str:
+    return json.dumps([name, list(key)], ensure_ascii=False)
+
+
+class SQLitePersistence(BasePersistence):
+    def __init__(
+        self,
+        path: str = PERSISTENCE_PATH,
+        store_data: Optional[PersistenceInput] = None,
+        update_interval: float = PERSISTENCE_INTERVAL,
+        commit_delay: float = PERSISTENCE_COMMIT_DELAY,
+        cache_size: int = PERSISTENCE_CACHE_SIZE,
+        preload: int = PERSISTENCE_PRELOAD,
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.path = path
+        self.commit_delay = commit_delay
+        self.cache_size = max(1, cache_size)
+        self.preload = preload
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], object] = {}
+        self._commit_task: Optional[asyncio.Task] = None
+        self._commit_failures = 0  # неудачных коммитов подряд
+        self._closing = False
+        self._sleeping = False  # задача коммита ещё ждёт паузу, записи не начинала
+        # (вид, ключ) -> отпечаток последней записи (None — в базе нет)
+        self._seen: "OrderedDict[Tuple[str, str], Optional[bytes]]" = OrderedDict()
+        self._seen_lock = threading.Lock()
+
+        self.commits = 0
+        self.rows_written = 0
+        self.rows_skipped = 0
+        self.lazy_loads = 0
+        self.last_commit_ms = 0.0
+
+    # ── SQLite (в потоках пула) ────────────────────────────────────
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _select(self, sql: str, params: Iterable = ()) -> List[Tuple[str, bytes]]:
+        with self._db_lock:
+            return self._db().execute(sql, tuple(params)).fetchall()
+
+    def _load_kind(self, kind: str, limit: Optional[int] = None) -> Dict[str, object]:
+        sql = "SELECT key, value FROM state WHERE kind = ? ORDER BY updated DESC"
+        params: List = [kind]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        out = {}
+        for key, blob in self._select(sql, params):
+            out[key] = loads(blob)
+            self._remember((kind, key), _digest(blob))
+        return out
+
+    def _load_one(self, kind: str, key: str):
+        rows = self._select("SELECT value FROM state WHERE kind = ? AND key = ?", (kind, key))
+        if not rows:
+            self._remember((kind, key), None)
+            return None
+        blob = rows[0][0]
+        self._remember((kind, key), _digest(blob))
+        return loads(blob)
+
+    def _write(self, batch: Dict[Tuple[str, str], object]) -> None:
+        """batch — {(kind, key): pickle-байты или _DELETED}; снимок сделан в цикле событий."""
+        started = time.perf_counter()
+        now = time.time()
+        upserts, deletes = [], []
+        for (kind, key), raw in batch.items():
+            if raw is _DELETED:
+                deletes.append((kind, key))
+                continue
+            blob = pack(raw)
+            digest = _digest(blob)
+            if self._seen.get((kind, key)) == digest:
+                self.rows_skipped += 1
+                continue
+            upserts.append((kind, key, blob, now))
+            self._remember((kind, key), digest)
+        if not (upserts or deletes):
+            return
+        with self._db_lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                db.executemany(
+                    "INSERT INTO state (kind, key, value, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (kind, key) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+                    upserts,
+                )
+                db.executemany("DELETE FROM state WHERE kind = ? AND key = ?", deletes)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                with self._seen_lock:
+                    for kind, key, _, _ in upserts:
+                        self._seen.pop((kind, key), None)
+                raise
+        for item in deletes:
+            self._remember(item, None)
+        self.commits += 1
+        self.rows_written += len(upserts) + len(deletes)
+        self.last_commit_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def _remember(self, item: Tuple[str, str], digest: Optional[bytes]) -> None:
+        with self._seen_lock:
+            self._seen[item] = digest
+            self._seen.move_to_end(item)
+            while len(self._seen) > self.cache_size:
+                self._seen.popitem(last=False)
+
+    # ── пакетная запись ────────────────────────────────────────────
+    def _queue(self, kind: str, key: str, obj) -> None:
+        self._pending[(kind, key)] = obj
+        if self._commit_task is None or self._commit_task.done():
+            self._schedule(self.commit_delay)
+
+    def _schedule(self, delay: float) -> None:
+        if not self._closing:
+            self._commit_task = asyncio.create_task(self._commit_later(delay))
+
+    async def _commit_later(self, delay: float) -> None:
+        # все update_* одного прогона PTB попадают в одну транзакцию
+        self._sleeping = True
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._sleeping = False
+        await self._commit()
+        if self._pending:
+            # вернулись после ошибки или пришли, пока шла запись, — не ждём следующего апдейта
+            retry = min(PERSISTENCE_RETRY_MAX, self.commit_delay * 2 ** self._commit_failures)
+            self._schedule(retry if self._commit_failures else self.commit_delay)
+
+    async def _commit(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            # в очереди — живые user_data, которые хендлеры меняют в цикле событий;
+            # снимаем их здесь же, в поток уходят только байты
+            snapshot = {
+                item: obj if obj is _DELETED else pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+                for item, obj in batch.items()
+            }
+            await run_blocking(self._write, snapshot)
+        except Exception as e:
+            self._commit_failures += 1
+            log.error("Persistence commit failed (%d keys), will retry: %r", len(batch), e)
+            for item, obj in batch.items():
+                self._pending.setdefault(item, obj)
+        else:
+            self._commit_failures = 0
+
+    async def flush(self) -> None:
+        self._closing = True
+        task, self._commit_task = self._commit_task, None
+        if task is not None and not task.done():
+            if self._sleeping:
+                task.cancel()  # ещё ждёт паузы (или повтора) — хвост допишем ниже сами
+            try:
+                await task  # запись, уже ушедшую в поток, не отменяем
+            except asyncio.CancelledError:
+                pass
+        await self._commit()
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.close()
+                self._conn = None
+
+    # ── загрузка ───────────────────────────────────────────────────
+    async def get_user_data(self) -> Dict[int, Dict]:
+        data = await run_blocking(self._load_kind, USER, self.preload)
+        return {int(k): v for k, v in data.items()}
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        data = await run_blocking(self._load_kind, CHAT, self.preload)
+        return {int(k): v for k, v in data.items()}
+
+    async def get_bot_data(self) -> Dict:
+        value = await run_blocking(self._load_one, BOT, "")
+        return value if value is not None else {}
+
+    async def get_callback_data(self):
+        return await run_blocking(self._load_one, CALLBACK, "")
+
+    async def get_conversations(self, name: str) -> Dict:
+        data = await run_blocking(self._load_kind, CONVERSATION)
+        out = {}
+        for raw, state in data.items():
+            conv, key = json.loads(raw)
+            if conv == name:
+                out[tuple(key)] = state
+        return out
+
+    async def _refresh(self, kind: str, key: str, data: Dict) -> None:
+        # не загруженный при старте — дочитываем при первом апдейте
+        if data or (kind, key) in self._seen or (kind, key) in self._pending:
+            return
+        value = await run_blocking(self._load_one, kind, key)
+        if value:
+            self.lazy_loads += 1
+            data.update(value)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        await self._refresh(USER, str(user_id), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        await self._refresh(CHAT, str(chat_id), chat_data)
+
+    async def refresh_bot_data(self, bot_data: Dict) -> None:
+        pass  # bot_data целиком загружается при старте
+
+    # ── запись ─────────────────────────────────────────────────────
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        self._queue(USER, str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        self._queue(CHAT, str(chat_id), data)
+
+    async def update_bot_data(self, data: Dict) -> None:
+        self._queue(BOT, "", data)
+
+    async def update_callback_data(self, data) -> None:
+        self._queue(CALLBACK, "", data)
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        item = _conv_key(name, key)
+        self._queue(CONVERSATION, item, _DELETED if new_state is None else new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._queue(USER, str(user_id), _DELETED)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._queue(CHAT, str(chat_id), _DELETED)
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self._pending),
+            "commits": self.commits,
+            "rows_written": self.rows_written,
+            "rows_skipped": self.rows_skipped,
+            "lazy_loads": self.lazy_loads,
+            "last_commit_ms": self.last_commit_ms,
+        }
@@ -0,0 +1,178 @@
+# prewarm.py
+"""
+Прогрев кешей по расписанию — до того, как сотрудники откроют бота.
+
+JobQueue (PTB) в PREWARM_TIMES по TZ (и один раз через PREWARM_ON_START
+секунд после старта) делает то же, что первые утренние запросы:
+
+  • календари CALENDAR_IDS — виды «день / неделя / месяц» через хранилище
+    calendar_cache (полная или инкрементальная синхронизация);
+  • KPI — последняя строка листа в sheet_cache (заодно обновляется
+    OAuth-токен и строятся клиенты Google);
+  • анализ KPI от GPT — в gpt_cache под тем же ключом, что читает /status
+    (и потоковый, и обычный вариант).
+
+Свежее не трогаем: цель пропускается, если её данные в кеше моложе
+PREWARM_FRESH от срока жизни (или календарь синхронизирован позже
+CALENDAR_SYNC_INTERVAL) — прогрев после активной работы ничего не стоит.
+
+PREWARM_TIMES пустой — без расписания.
+"""
+import os
+import time
+import asyncio
+import logging
+import datetime as dt
+from typing import Dict, List, Optional, Sequence
+
+from dateutil import tz as _tz
+
+import metrics
+import services
+from gpt_cache import cache as GPT_CACHE
+from sheet_cache import cache as SHEET_CACHE
+
+# Местное время (TZ) через запятую: перед открытием и перед вечерней сменой
+PREWARM_TIMES = os.getenv("PREWARM_TIMES", "08:30,16:30").strip()
+# Первый прогрев через N секунд после старта (0 — не делать)
+PREWARM_ON_START = float(os.getenv("PREWARM_ON_START", "15"))
+# Запись «свежая», пока прожила меньше этой доли своего TTL
+PREWARM_FRESH = float(os.getenv("PREWARM_FRESH", "0.5"))
+
+# Окна видов day/week/month из main.on_cb, дней от текущего момента
+VIEW_DAYS = {"day": 1, "week": 7, "month": 30}
+
+WARMED, FRESH, SKIPPED, ERROR = "warmed", "fresh", "skipped", "error"
+
+log = logging.getLogger(__name__)
+
+
+def parse_times(spec: str, tzinfo) -> List[dt.time]:
+    """"08:30,16:30" → [time(8, 30, tzinfo), ...]; кривые значения пропускаются."""
+    out = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            hh, mm = part.split(":")
+            out.append(dt.time(int(hh), int(mm), tzinfo=tzinfo))
+        except ValueError:
+            log.warning("PREWARM_TIMES: cannot parse %r", part)
+    return out
+
+
+def _fresh(age: Optional[float], ttl: float) -> bool:
+    return age is not None and age < ttl * PREWARM_FRESH
+
+
+class Prewarmer:
+    def __init__(self, sheet_id: str, creds_src: str, calendar_ids: Sequence[str]):
+        self.sheet_id = sheet_id
+        self.creds_src = creds_src
+        self.calendar_ids = list(calendar_ids)
+        self._lock = asyncio.Lock()
+
+        self.runs = 0
+        self.last_run: Optional[float] = None  # time.time()
+        self.last_ms = 0.0
+        self.last: Dict[str, str] = {}
+
+    # ── цели ───────────────────────────────────────────────────────
+    async def _calendar(self) -> str:
+        if not self.calendar_ids:
+            return SKIPPED
+        ages = [
+            services.calendar_cache.get_store(cid, self.creds_src).stats()["age_s"] for cid in self.calendar_ids
+        ]
+        if all(age is not None and age < services.calendar_cache.CALENDAR_SYNC_INTERVAL for age in ages):
+            return FRESH
+        now = dt.datetime.utcnow()
+        for days in VIEW_DAYS.values():
+            _, failed = await services.list_events_merged(
+                self.calendar_ids, self.creds_src, now, now + dt.timedelta(days=days)
+            )
+            if failed:
+                return ERROR
+        return WARMED
+
+    async def _kpi(self) -> str:
+        if not self.sheet_id:
+            return SKIPPED
+        title = services.google_sheets.SHEET_KPI
+        if _fresh(SHEET_CACHE.age(self.sheet_id, title), SHEET_CACHE.ttl_for(title)):
+            return FRESH
+        await services.fetch_kpi(self.sheet_id, self.creds_src)
+        return WARMED
+
+    async def _gpt_status(self) -> str:
+        if not (self.sheet_id and os.getenv("OPENAI_API_KEY")):
+            return SKIPPED
+        # KPI уже в кеше (после _kpi) — это чтение из памяти
+        kpi = await services.fetch_kpi(self.sheet_id, self.creds_src)
+        if not kpi:
+            return SKIPPED
+        if _fresh(GPT_CACHE.age(services.gpt_brain.status_cache_key(kpi)), GPT_CACHE.ttl):
+            return FRESH
+        text, _ = await services.gpt_analyze_status(kpi)
+        # ошибка API возвращается текстом и в кеш не попадает
+        return WARMED if text and not text.startswith("Ошибка") else ERROR
+
+    async def _target(self, name: str, coro) -> str:
+        try:
+            result = await coro
+        except Exception as e:
+            log.warning("Prewarm %s failed: %r", name, e)
+            result = ERROR
+        metrics.PREWARM_RUNS.inc(target=name, result=result)
+        return result
+
+    # ── прогон ─────────────────────────────────────────────────────
+    async def run(self) -> Dict[str, str]:
+        """Прогревает всё устаревшее; {цель: warmed | fresh | skipped | error}."""
+        if self._lock.locked():
+            return dict(self.last)  # предыдущий прогон ещё идёт
+        async with self._lock:
+            started = time.perf_counter()
+            calendar, kpi = await asyncio.gather(
+                self._target("calendar", self._calendar()),
+                self._target("kpi", self._kpi()),
+            )
+            gpt = await self._target("gpt_status", self._gpt_status()) if kpi != ERROR else SKIPPED
+            self.last = {"calendar": calendar, "kpi": kpi, "gpt_status": gpt}
+            self.runs += 1
+            self.last_run = time.time()
+            self.last_ms = round((time.perf_counter() - started) * 1000, 1)
+            log.info("Prewarm done in %.0f ms: %s", self.last_ms, self.last)
+            return dict(self.last)
+
+    def stats(self) -> Dict:
+        return {
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_ms": self.last_ms,
+            "last": dict(self.last),
+        }
+
+
+async def _job(context) -> None:
+    await context.job.data.run()
+
+
+def schedule(
+    job_queue, sheet_id: str, creds_src: str, calendar_ids: Sequence[str], tz_name: str
+) -> Optional[Prewarmer]:
+    """Ставит прогрев в JobQueue; None — если расписание не задано или JobQueue нет."""
+    times = parse_times(PREWARM_TIMES, _tz.gettz(tz_name or "Europe/Berlin"))
+    if job_queue is None:
+        if times or PREWARM_ON_START > 0:
+            log.warning("Prewarm disabled: JobQueue is not available (python-telegram-bot[job-queue])")
+        return None
+    if not times and PREWARM_ON_START <= 0:
+        return None
+    warmer = Prewarmer(sheet_id, creds_src, calendar_ids)
+    for at in times:
+        job_queue.run_daily(_job, at, data=warmer, name=f"prewarm {at:%H:%M}")
+    if PREWARM_ON_START > 0:
+        job_queue.run_once(_job, PREWARM_ON_START, data=warmer, name="prewarm on start")
+    return warmer
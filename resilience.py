@@ -0,0 +1,424 @@
+# resilience.py
+"""
+Общий слой устойчивости для внешних сервисов (Sheets, Calendar, OpenAI, Yandex STT).
+
+Каждый бэкенд — объект Backend со своими настройками:
+
+  • token bucket — не больше <NAME>_RPS запросов в секунду (всплеск до <NAME>_BURST);
+  • семафор — не больше <NAME>_CONCURRENCY одновременных запросов;
+  • повторы — до <NAME>_RETRIES раз с экспоненциальной задержкой и полным
+    джиттером; Retry-After из ответа соблюдается (если он не больше
+    RETRY_AFTER_MAX — иначе ошибка сразу уходит наверх);
+  • circuit breaker — после <NAME>_BREAKER_FAILURES подряд вызовов, упавших
+    с временной ошибкой (уже после повторов), запросы <NAME>_BREAKER_RESET
+    секунд не отправляются вовсе (CircuitOpenError), затем пропускается
+    один пробный.
+
+Повторяются только временные ошибки: 429, 5xx, 408, таймауты и обрывы
+соединения. Записи (op из writes) повторяются лишь тогда, когда запрос
+заведомо не был выполнен: 429 и отказ до отправки (соединение не
+установлено, DNS) — иначе можно задвоить строку или событие. Сброс
+соединения посреди запроса (reset, broken pipe, RemoteDisconnected) мог
+прийти уже после записи, поэтому считается таймаутом.
+
+Синхронный call() — для потоков пула (gspread, googleapiclient),
+асинхронный acall() — для httpx / AsyncOpenAI. Каждая попытка меряется
+через metrics.external, повторы, ожидание лимитов и состояние breaker'а
+тоже видны в /metrics и /diag.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+import metrics
+
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))
+RETRY_AFTER_MAX = float(os.getenv("RETRY_AFTER_MAX", "30"))
+
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+
+log = logging.getLogger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    """Бэкенд помечен недоступным — запрос не отправлялся."""
+
+    def __init__(self, service: str, retry_in: float, title: str = ""):
+        self.service = service
+        self.retry_in = retry_in
+        super().__init__(f"{title or service} временно недоступен, повтор через {max(1, round(retry_in))} с")
+
+
+# ── Классификация ошибок ───────────────────────────────────────────
+def _status(exc: BaseException) -> Optional[int]:
+    """HTTP-статус из исключений openai / httpx / gspread / googleapiclient."""
+    status = getattr(exc, "status_code", None)  # openai.APIStatusError
+    if status is None:
+        response = getattr(exc, "response", None)  # httpx.HTTPStatusError, gspread.APIError
+        status = getattr(response, "status_code", None)
+    if status is None:
+        resp = getattr(exc, "resp", None)  # googleapiclient.errors.HttpError
+        status = getattr(resp, "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _headers(exc: BaseException):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        headers = getattr(exc, "resp", None)  # httplib2.Response — dict заголовков
+    return headers if hasattr(headers, "get") else {}
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Retry-After (секунды или HTTP-дата) из ответа, если есть."""
+    headers = _headers(exc)
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _rate_limited_403(exc: BaseException) -> bool:
+    # Google отдаёт превышение квоты и как 403 rateLimitExceeded / userRateLimitExceeded
+    return "ratelimitexceeded" in str(exc).lower()
+
+
+_connect_types: Optional[Tuple[type, ...]] = None
+_timeout_types: Optional[Tuple[type, ...]] = None
+
+
+def _transport_types() -> Tuple[Tuple[type, ...], Tuple[type, ...]]:
+    """
+    (запрос не отправлен, ответ не получен). В первую группу — только отказы
+    до отправки; обрывы установленного соединения — во вторую.
+    """
+    global _connect_types, _timeout_types
+    if _connect_types is None:
+        import socket
+        connect, timeout = [ConnectionRefusedError, socket.gaierror], [ConnectionError, TimeoutError]
+        try:
+            import httpx
+            connect += [httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout]
+            timeout += [httpx.TransportError]
+        except ImportError:
+            pass
+        try:
+            import openai
+            timeout += [openai.APIConnectionError]  # включая APITimeoutError
+        except ImportError:
+            pass
+        try:
+            import requests
+            # ConnectionError у requests — это и «Connection aborted» после отправки
+            connect += [requests.exceptions.ConnectTimeout]
+            timeout += [requests.exceptions.ConnectionError, requests.exceptions.Timeout]
+        except ImportError:
+            pass
+        try:
+            import httplib2
+            connect += [httplib2.ServerNotFoundError]
+        except ImportError:
+            pass
+        _connect_types, _timeout_types = tuple(connect), tuple(timeout)
+    return _connect_types, _timeout_types
+
+
+def classify(exc: BaseException) -> Optional[str]:
+    """
+    Вид временной ошибки или None (повторять бессмысленно):
+    "rate" — 429 / квота, "connect" — запрос не отправлен, "server" — 5xx / 408,
+    "timeout" — ответа не дождались или соединение оборвалось (запрос мог
+    быть выполнен).
+    """
+    if isinstance(exc, CircuitOpenError):
+        return None
+    status = _status(exc)
+    if status is not None:
+        if status == 429 or (status == 403 and _rate_limited_403(exc)):
+            return "rate"
+        return "server" if status in RETRYABLE_STATUSES else None
+    connect, timeout = _transport_types()
+    if isinstance(exc, connect):
+        return "connect"
+    if isinstance(exc, timeout):
+        return "timeout"
+    return None
+
+
+# ── Ограничители ───────────────────────────────────────────────────
+class TokenBucket:
+    """
+    Потокобезопасный token bucket. reserve() сразу списывает токен (баланс
+    может уйти в минус) и возвращает, сколько подождать — так очередь
+    ожидающих честная и для потоков, и для корутин.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost: float = 1.0) -> float:
+        """cost — сколько запросов на самом деле уходит (batch из N вставок — N)."""
+        if self.rate <= 0:
+            return 0.0  # без ограничения
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= cost
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures: int, reset: float):
+        self.threshold = max(1, failures)
+        self.reset = reset
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0  # сколько раз размыкался
+        self._opened_at = 0.0
+        self._probe = False
+        self._lock = threading.Lock()
+
+    def before(self) -> Optional[float]:
+        """None — запрос можно слать; иначе через сколько секунд попробовать снова."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return None
+            left = self._opened_at + self.reset - time.monotonic()
+            if self.state == self.OPEN and left <= 0:
+                self.state, self._probe = self.HALF_OPEN, False
+            if self.state == self.HALF_OPEN and not self._probe:
+                self._probe = True  # пропускаем один пробный запрос
+                return None
+            return max(left, 0.0)
+
+    def success(self) -> None:
+        with self._lock:
+            self.state, self.failures, self._probe = self.CLOSED, 0, False
+
+    def failure(self) -> bool:
+        """Временная ошибка; True — breaker только что разомкнулся."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                was_open = self.state == self.OPEN
+                self.state, self._probe = self.OPEN, False
+                self._opened_at = time.monotonic()
+                if not was_open:
+                    self.opened += 1
+                    return True
+            return False
+
+    def release(self) -> None:
+        """Попытка завершилась ошибкой, не говорящей о здоровье сервиса."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe = False
+
+
+# ── Бэкенд ─────────────────────────────────────────────────────────
+def _env(name: str, key: str, default: float) -> float:
+    return float(os.getenv(f"{name.upper()}_{key}", str(default)))
+
+
+class Backend:
+    def __init__(self, name: str, title: str, rps: float, burst: float, concurrency: int, retries: int,
+                 breaker_failures: int = 5, breaker_reset: float = 30.0, writes: Sequence[str] = ()):
+        self.name = name
+        self.title = title
+        self.rps = _env(name, "RPS", rps)
+        self.concurrency = max(1, int(_env(name, "CONCURRENCY", concurrency)))
+        self.retries = max(0, int(_env(name, "RETRIES", retries)))
+        self.writes = frozenset(writes)
+        self.bucket = TokenBucket(self.rps, _env(name, "BURST", burst))
+        self.breaker = CircuitBreaker(
+            int(_env(name, "BREAKER_FAILURES", breaker_failures)), _env(name, "BREAKER_RESET", breaker_reset)
+        )
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._aslots: Dict[int, asyncio.Semaphore] = {}  # по event loop'ам (bench запускает несколько)
+        self.calls = 0
+        self.retried = 0
+        self.rejected = 0
+        self.failed = 0
+
+    # ── политика ───────────────────────────────────────────────────
+    def _admit(self) -> None:
+        wait = self.breaker.before()
+        if wait is not None:
+            self.rejected += 1
+            if metrics.METRICS_ENABLED:
+                metrics.BACKEND_REJECTED.inc(service=self.name)
+            raise CircuitOpenError(self.name, wait, self.title)
+
+    def _delay(self, op: str, attempt: int, exc: BaseException) -> Optional[float]:
+        """Пауза перед следующей попыткой или None — ошибку отдаём наверх."""
+        kind = classify(exc)
+        if kind is None:
+            self.breaker.release()
+            return None
+        after = retry_after(exc)
+        retry = (
+            attempt < self.retries
+            and self.breaker.state != CircuitBreaker.HALF_OPEN  # пробный запрос — одна попытка
+            # запись могла выполниться — не задваиваем
+            and (op not in self.writes or kind in ("rate", "connect"))
+            and (after is None or after <= RETRY_AFTER_MAX)
+        )
+        if not retry:
+            # breaker считает вызовы, не попытки: сбой — когда повторы исчерпаны
+            if self.breaker.failure():
+                log.warning("%s: circuit open for %.0f s after %r", self.name, self.breaker.reset, exc)
+            return None
+        delay = self.backoff(attempt, exc)
+        self.retried += 1
+        if metrics.METRICS_ENABLED:
+            metrics.BACKEND_RETRIES.inc(service=self.name, reason=kind)
+        log.info("%s %s: %s error, retry %d in %.2f s: %r", self.name, op, kind, attempt + 1, delay, exc)
+        return delay
+
+    @staticmethod
+    def backoff(attempt: int, exc: Optional[BaseException] = None) -> float:
+        """Пауза перед повтором номер attempt (с 0): экспонента с полным джиттером, не меньше Retry-After."""
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+        after = retry_after(exc) if exc is not None else None
+        return max(delay, after) if after is not None else delay
+
+    def _waited(self, started: float) -> None:
+        if metrics.METRICS_ENABLED:
+            metrics.BACKEND_WAIT_SECONDS.observe(time.perf_counter() - started, service=self.name)
+
+    def _done(self, ok: bool) -> None:
+        if ok:
+            self.breaker.success()
+        else:
+            self.failed += 1
+
+    # ── вызовы ─────────────────────────────────────────────────────
+    def call(self, op: str, fn: Callable[..., Any], *args, cost: float = 1, **kwargs) -> Any:
+        """
+        Синхронный вызов fn(*args, **kwargs) по политике бэкенда (из потоков пула).
+        cost — сколько токенов лимита списать (batch-запрос из N операций — N).
+        """
+        self.calls += 1
+        attempt = 0
+        while True:
+            self._admit()
+            started = time.perf_counter()
+            time.sleep(self.bucket.reserve(cost))
+            with self._slots:
+                self._waited(started)
+                try:
+                    with metrics.external(self.name, op):
+                        result = fn(*args, **kwargs)
+                except Exception as e:
+                    delay = self._delay(op, attempt, e)
+                    if delay is None:
+                        self._done(False)
+                        raise
+                else:
+                    self._done(True)
+                    return result
+            time.sleep(delay)
+            attempt += 1
+
+    def _async_slots(self) -> asyncio.Semaphore:
+        loop = id(asyncio.get_running_loop())
+        sem = self._aslots.get(loop)
+        if sem is None:
+            if len(self._aslots) > 8:
+                self._aslots.clear()  # старые loop'ы (bench) уже закрыты
+            sem = self._aslots[loop] = asyncio.Semaphore(self.concurrency)
+        return sem
+
+    async def acall(self, op: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Асинхронный вариант call(): fn — корутинная функция (httpx, AsyncOpenAI)."""
+        self.calls += 1
+        attempt = 0
+        while True:
+            self._admit()
+            started = time.perf_counter()
+            await asyncio.sleep(self.bucket.reserve())
+            async with self._async_slots():
+                self._waited(started)
+                try:
+                    with metrics.external(self.name, op):
+                        result = await fn(*args, **kwargs)
+                except asyncio.CancelledError:
+                    self.breaker.release()  # отменили (хеджирование STT) — о сервисе ничего не узнали
+                    raise
+                except Exception as e:
+                    delay = self._delay(op, attempt, e)
+                    if delay is None:
+                        self._done(False)
+                        raise
+                else:
+                    self._done(True)
+                    return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.breaker.state,
+            "calls": self.calls,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "opened": self.breaker.opened,
+        }
+
+
+# ── Бэкенды бота ───────────────────────────────────────────────────
+# Квота Sheets — 60 запросов в минуту на пользователя; Calendar и STT
+# заметно щедрее; у OpenAI лимит RPM зависит от тарифа.
+SHEETS = Backend("sheets", "Google Sheets", rps=1.0, burst=10, concurrency=4, retries=3, writes=("write",))
+CALENDAR = Backend("calendar", "Google Calendar", rps=5.0, burst=10, concurrency=4, retries=3,
+                   writes=("insert", "insert_batch"))
+OPENAI = Backend("openai", "OpenAI", rps=5.0, burst=10, concurrency=8, retries=2)
+# у распознавания свой запасной путь (хеджирование) — повторяем не больше раза
+YANDEX = Backend("yandex", "Yandex SpeechKit", rps=5.0, burst=10, concurrency=8, retries=1)
+
+BACKENDS: Dict[str, Backend] = {b.name: b for b in (SHEETS, CALENDAR, OPENAI, YANDEX)}
+
+
+_REASONS = {
+    "rate": "{service} ограничивает частоту запросов, попробуйте через минуту",
+    "server": "{service} временно не отвечает",
+    "connect": "нет связи с {service}",
+    "timeout": "{service} не ответил вовремя",
+}
+
+
+def describe(exc: BaseException, backend: Backend) -> str:
+    """Короткая причина ошибки для пользователя (без трейсов и JSON ответа)."""
+    if isinstance(exc, CircuitOpenError):
+        return str(exc)
+    kind = classify(exc)
+    return _REASONS[kind].format(service=backend.title) if kind else str(exc)
+
+
+def stats() -> Dict[str, Dict]:
+    return {name: b.stats() for name, b in BACKENDS.items()}
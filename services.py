@@ -0,0 +1,156 @@
+# services.py
+"""
+Асинхронный слой над модулями google_sheets, calendar_api, gpt_brain и
+speech_recognition. Хендлеры в main.py вызывают только эти функции:
+синхронные запросы к Google уходят в пул потоков, а OpenAI/Yandex работают
+нативно async поверх общего пула соединений — ни то, ни другое не
+замораживает обработку апдейтов других чатов.
+"""
+import datetime as dt
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import startup
+import calendar_views
+import slots
+from executors import run_blocking
+
+# SDK Google / OpenAI грузятся при первом вызове (или прогревом после старта)
+google_sheets = startup.lazy("google_sheets")
+calendar_api = startup.lazy("calendar_api")
+calendar_cache = startup.lazy("calendar_cache")
+gpt_brain = startup.lazy("gpt_brain")
+speech_recognition = startup.lazy("speech_recognition")
+
+
+# ── Google Sheets ──────────────────────────────────────────────────
+async def fetch_kpi(sheet_id: str, creds_src: str) -> Dict:
+    return await run_blocking(google_sheets.fetch_kpi, sheet_id, creds_src)
+
+
+async def fetch_ops_tasks(sheet_id: str, creds_src: str, limit: int = 50) -> List[Dict]:
+    return await run_blocking(google_sheets.fetch_ops_tasks, sheet_id, creds_src, limit)
+
+
+async def fetch_eff_actions(sheet_id: str, creds_src: str, limit: int = 50) -> List[Dict]:
+    return await run_blocking(google_sheets.fetch_eff_actions, sheet_id, creds_src, limit)
+
+
+async def append_inbox(sheet_id, creds_src, text, category="", due_str="", author="В.П."):
+    return await run_blocking(
+        google_sheets.append_inbox,
+        sheet_id,
+        creds_src,
+        text,
+        category=category,
+        due_str=due_str,
+        author=author,
+    )
+
+
+# ── Google Calendar ────────────────────────────────────────────────
+async def list_events_between(
+    calendar_id: str,
+    creds_input: str,
+    dt_from: dt.datetime,
+    dt_to: dt.datetime,
+    max_results: int = 100,
+    cached: bool = True,
+) -> List[Dict]:
+    """cached=False — прямой запрос к API (например, для /diag)."""
+    source = calendar_cache if cached else calendar_api
+    return await run_blocking(
+        source.list_events_between, calendar_id, creds_input, dt_from, dt_to, max_results
+    )
+
+
+async def list_events_merged(
+    calendar_ids: List[str],
+    creds_input: str,
+    dt_from: dt.datetime,
+    dt_to: dt.datetime,
+    max_results: int = 100,
+    cached: bool = True,
+) -> Tuple[List[Dict], Dict[str, Exception]]:
+    """События нескольких календарей одним списком (см. calendar_views) и ошибки по календарям."""
+    return await calendar_views.list_events_between(
+        calendar_ids, creds_input, dt_from, dt_to, max_results, cached=cached
+    )
+
+
+async def add_event(
+    summary: str,
+    minutes: int = 60,
+    start_dt: Optional[dt.datetime] = None,
+    description: str = "",
+    calendar_id: Optional[str] = None,
+    creds_input: Optional[str] = None,
+) -> Dict:
+    return await run_blocking(
+        calendar_api.add_event,
+        summary,
+        minutes=minutes,
+        start_dt=start_dt,
+        description=description,
+        calendar_id=calendar_id,
+        creds_input=creds_input,
+    )
+
+
+async def add_events(
+    events: List[Dict],
+    calendar_id: Optional[str] = None,
+    creds_input: Optional[str] = None,
+) -> List[Tuple[Optional[Dict], Optional[Exception]]]:
+    """Пакетное создание событий (batch HTTP); результат или ошибка по каждому."""
+    return await run_blocking(calendar_api.add_events, events, calendar_id=calendar_id, creds_input=creds_input)
+
+
+async def find_free_slots(
+    calendar_ids: List[str],
+    creds_input: str,
+    minutes: int,
+    after: Optional[dt.datetime] = None,
+    count: int = 1,
+) -> List[Tuple[dt.datetime, dt.datetime]]:
+    """Ближайшие свободные окна во всех календарях (см. slots)."""
+    return await slots.find_free(calendar_ids, creds_input, minutes, after=after, count=count)
+
+
+def pretty_events(events: List[Dict]) -> str:
+    return calendar_api.pretty_events(events)
+
+
+# ── OpenAI (нативно async, поверх общего пула http_pool) ───────────
+async def gpt_analyze_status(kpi: dict, force: bool = False):
+    return await gpt_brain.gpt_analyze_status(kpi, force)
+
+
+async def gpt_continue_status(original_prompt: str, so_far: str) -> str:
+    return await gpt_brain.gpt_continue_status(original_prompt, so_far)
+
+
+async def gpt_analyze_status_stream(kpi: dict, force: bool = False) -> Tuple[AsyncIterator[str], str]:
+    """(асинхронный поток кусочков анализа, prompt)."""
+    return gpt_brain.gpt_analyze_status_stream(kpi, force)
+
+
+async def gpt_continue_status_stream(original_prompt: str, so_far: str) -> AsyncIterator[str]:
+    return gpt_brain.gpt_continue_status_stream(original_prompt, so_far)
+
+
+async def gpt_analyze_free(tasks, eff_list, force: bool = False) -> str:
+    return await gpt_brain.gpt_analyze_free(tasks, eff_list, force)
+
+
+# ── Распознавание речи ─────────────────────────────────────────────
+async def recognize_speech(audio: "speech_recognition.Audio") -> str:
+    # хеджированный запуск бэкендов (см. speech_recognition.STT_MODE)
+    return await speech_recognition.recognize_speech(audio)
+
+
+def stt_mode() -> str:
+    return speech_recognition.STT_MODE
+
+
+def stt_stats() -> Dict[str, Dict]:
+    return speech_recognition.stt_stats()
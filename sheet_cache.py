@@ -0,0 +1,136 @@
+# sheet_cache.py
+"""
+Кеш чтений из Google Sheets.
+
+У каждого листа свой TTL. Когда запись устарела, можно (SHEET_REVISION_CHECK=1)
+сначала дёшево сверить modifiedTime таблицы в Drive: если он не менялся —
+продлеваем запись без чтения листа. После наших собственных записей лист
+сбрасывается явно через invalidate().
+
+modifiedTime — одна на всю книгу, а в Inbox пишут постоянно, так что в
+рабочие часы сверка почти всегда «не совпала» и лист перечитывается по
+истечении TTL. Поэтому TTL по умолчанию подобраны под то, как часто
+меняется сам лист: KPI заполняют раз в день (и есть «🔄 Обновить»),
+чек-лист — редко, задачи правят постоянно.
+"""
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# TTL по умолчанию и переопределения вида "03_Finance_KPI=600,02_Operations_Sobranie=120"
+SHEET_CACHE_TTL = float(os.getenv("SHEET_CACHE_TTL", "300"))
+SHEET_CACHE_TTLS = os.getenv("SHEET_CACHE_TTLS", "03_Finance_KPI=900,10_Effectiveness_Checklist=900")
+SHEET_REVISION_CHECK = os.getenv("SHEET_REVISION_CHECK", "1").strip().lower() in ("1", "true", "yes")
+
+
+def _parse_ttls(spec: str) -> Dict[str, float]:
+    out = {}
+    for part in spec.split(","):
+        if "=" in part:
+            name, ttl = part.split("=", 1)
+            try:
+                out[name.strip()] = float(ttl)
+            except ValueError:
+                pass
+    return out
+
+
+Key = Tuple[str, str]  # (sheet_id, worksheet)
+
+
+class SheetCache:
+    def __init__(self, default_ttl: float = SHEET_CACHE_TTL, ttls: Optional[Dict[str, float]] = None,
+                 revision_check: bool = SHEET_REVISION_CHECK):
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.revision_check = revision_check
+
+        self._entries: Dict[Key, Tuple[float, Optional[str], Any]] = {}  # (время, ревизия, значение)
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Key, threading.Lock] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.invalidations = 0
+
+    def ttl_for(self, title: str) -> float:
+        return self.ttls.get(title, self.default_ttl)
+
+    def _key_lock(self, key: Key) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def get(
+        self,
+        sheet_id: str,
+        title: str,
+        loader: Callable[[], Any],
+        revision: Optional[Callable[[], str]] = None,
+    ) -> Any:
+        """
+        Значение листа из кеша или loader(). revision() — дешёвый отпечаток
+        таблицы (например, modifiedTime); вызывается только для устаревших записей.
+        """
+        key = (sheet_id, title)
+        ttl = self.ttl_for(title)
+
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < ttl:
+            self.hits += 1
+            return entry[2]
+
+        # один поток перечитывает лист, остальные ждут его результат
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < ttl:
+                self.hits += 1
+                return entry[2]
+
+            rev = None
+            if self.revision_check and revision is not None:
+                try:
+                    rev = revision()
+                except Exception:
+                    rev = None
+                if entry is not None and rev is not None and rev == entry[1]:
+                    self._entries[key] = (time.monotonic(), rev, entry[2])
+                    self.revalidated += 1
+                    self.hits += 1
+                    return entry[2]
+
+            self.misses += 1
+            value = loader()
+            self._entries[key] = (time.monotonic(), rev, value)
+            return value
+
+    def invalidate(self, sheet_id: Optional[str] = None, title: Optional[str] = None) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                if (sheet_id is None or key[0] == sheet_id) and (title is None or key[1] == title):
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def age(self, sheet_id: str, title: str) -> Optional[float]:
+        """Возраст записи в секундах (None — нет в кеше)."""
+        entry = self._entries.get((sheet_id, title))
+        return None if entry is None else time.monotonic() - entry[0]
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+# Общий кеш процесса
+cache = SheetCache(ttls=_parse_ttls(SHEET_CACHE_TTLS))
@@ -0,0 +1,315 @@
+# sheet_mirror.py
+"""
+Локальная копия рабочей таблицы в SQLite с запросами по индексам.
+
+Листы Inbox, Operations, KPI и Effectiveness периодически (раз в
+SHEET_MIRROR_INTERVAL секунд, JobQueue) переносятся в одну таблицу rows;
+статус, дедлайн и категория вынесены в отдельные колонки с индексами,
+так что «активные задачи по дедлайну», «последние n строк KPI» и т.п. —
+запрос к SQLite за доли миллисекунды вместо скачивания листа и
+фильтрации в Python.
+
+Обновление инкрементальное:
+  • сначала modifiedTime таблицы из Drive — не менялся, ничего не читаем;
+  • листы, куда в основном дописывают (Inbox, KPI), читаются с последних
+    SHEET_MIRROR_OVERLAP уже известных строк до нового конца — правки
+    сегодняшней строки KPI тоже подхватываются;
+  • листы, которые правят на месте (Operations, Effectiveness), читаются
+    целиком, но база переписывается, только если содержимое изменилось.
+
+google_sheets читает из копии, пока она свежее SHEET_MIRROR_MAX_AGE;
+иначе (копия выключена, ещё не загружена, обновление падает, «🔄 Обновить»
+сбросил лист) — напрямую из Sheets, как раньше. SHEET_MIRROR_PATH
+пустой — без копии.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import datetime
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sheet_rows import Table
+
+SHEET_MIRROR_PATH = os.getenv("SHEET_MIRROR_PATH", "sheet_mirror.sqlite3").strip()
+SHEET_MIRROR_INTERVAL = float(os.getenv("SHEET_MIRROR_INTERVAL", "60"))
+# Старше — читаем мимо копии (обновление, видимо, не проходит)
+SHEET_MIRROR_MAX_AGE = float(os.getenv("SHEET_MIRROR_MAX_AGE", str(3 * SHEET_MIRROR_INTERVAL)))
+# Сколько последних известных строк перечитывать на листах «только дописываем»
+SHEET_MIRROR_OVERLAP = int(os.getenv("SHEET_MIRROR_OVERLAP", "3"))
+
+NO_DEADLINE = "9999-12-31"  # как datetime.date.max в google_sheets._deadline
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    book     TEXT NOT NULL,
+    sheet    TEXT NOT NULL,
+    rownum   INTEGER NOT NULL,
+    status   TEXT NOT NULL,
+    deadline TEXT NOT NULL,
+    category TEXT NOT NULL,
+    data     TEXT NOT NULL,
+    PRIMARY KEY (book, sheet, rownum)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rows_status ON rows (book, sheet, status, deadline);
+CREATE INDEX IF NOT EXISTS rows_deadline ON rows (book, sheet, deadline);
+CREATE INDEX IF NOT EXISTS rows_category ON rows (book, sheet, category);
+CREATE TABLE IF NOT EXISTS meta (
+    book      TEXT NOT NULL,
+    sheet     TEXT NOT NULL,
+    header    TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    digest    TEXT NOT NULL,
+    PRIMARY KEY (book, sheet)
+);
+"""
+
+
+def _deadline(value) -> str:
+    try:
+        return datetime.datetime.strptime(str(value), "%Y-%m-%d").date().isoformat()
+    except Exception:
+        return NO_DEADLINE
+
+
+def _digest(header: Sequence, rows: Sequence) -> str:
+    raw = json.dumps([list(header), [list(r) for r in rows]], ensure_ascii=False, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SheetMirror:
+    def __init__(self, path: str = SHEET_MIRROR_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._headers: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+        self._revision: Dict[str, str] = {}
+        self._fresh: Dict[Tuple[str, str], float] = {}  # (книга, лист) -> monotonic последней сверки
+
+        self.refreshes = 0
+        self.skipped = 0  # ревизия не менялась
+        self.rows_written = 0
+        self.last_refresh_ms = 0.0
+        self.last_error = ""
+
+    # ── SQLite ─────────────────────────────────────────────────────
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _meta(self, book: str, sheet: str) -> Optional[Tuple[Tuple[str, ...], int, str]]:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT header, row_count, digest FROM meta WHERE book = ? AND sheet = ?", (book, sheet)
+            ).fetchone()
+        return None if row is None else (tuple(json.loads(row[0])), row[1], row[2])
+
+    @staticmethod
+    def _positions(header: Sequence[str]) -> Dict[str, int]:
+        """Индексируемые колонки (имя в базе -> позиция в листе) — те же, что у прямого чтения google_sheets."""
+        import google_sheets as gs
+
+        names = {"status": gs.STATUS_FIELD, "deadline": gs.DEADLINE_FIELD, "category": gs.CATEGORY_FIELD}
+        return {column: header.index(name) if name in header else -1 for column, name in names.items()}
+
+    def _store(self, book: str, sheet: str, header: Sequence[str], rows: Sequence[Tuple],
+               first: int, row_count: int, digest: str, replace_all: bool) -> None:
+        """rows — строки листа начиная с номера first (2 — первая после заголовка)."""
+        pos = self._positions(header)
+
+        def cell(r, column):
+            i = pos[column]
+            return r[i] if 0 <= i < len(r) else ""
+
+        records = [
+            (book, sheet, first + n, str(cell(r, "status")).lower(), _deadline(cell(r, "deadline")),
+             str(cell(r, "category")), json.dumps(list(r), ensure_ascii=False, default=str))
+            for n, r in enumerate(rows)
+        ]
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                if replace_all:
+                    db.execute("DELETE FROM rows WHERE book = ? AND sheet = ?", (book, sheet))
+                else:
+                    db.execute("DELETE FROM rows WHERE book = ? AND sheet = ? AND rownum >= ?", (book, sheet, first))
+                db.executemany("INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+                db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?, ?)",
+                    (book, sheet, json.dumps(list(header), ensure_ascii=False), row_count, digest),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        self._headers[(book, sheet)] = tuple(header)
+        self.rows_written += len(records)
+
+    # ── обновление (в пуле потоков) ────────────────────────────────
+    def refresh(self, book: str, creds_src: str, force: bool = False) -> bool:
+        """Догоняет таблицу; False — ревизия не менялась и читать было нечего."""
+        import google_sheets  # google_sheets сам импортирует этот модуль
+
+        with self._refresh_lock:
+            started = time.perf_counter()
+            try:
+                revision = google_sheets._revision(book, creds_src)
+                if not force and revision is not None and self._revision.get(book) == revision:
+                    self.skipped += 1
+                    self._touch(book, google_sheets.MIRROR_SHEETS)
+                    return False
+                for sheet in google_sheets.MIRROR_SHEETS:
+                    if sheet in google_sheets.APPEND_ONLY_SHEETS:
+                        self._refresh_tail(google_sheets, book, creds_src, sheet)
+                    else:
+                        self._refresh_full(google_sheets, book, creds_src, sheet)
+            except Exception as e:
+                self.last_error = repr(e)
+                log.warning("Sheet mirror refresh failed: %r", e)
+                raise
+            self._revision[book] = revision
+            self._touch(book, google_sheets.MIRROR_SHEETS)
+            self.refreshes += 1
+            self.last_error = ""
+            self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 1)
+            return True
+
+    def _touch(self, book: str, sheets: Sequence[str]) -> None:
+        now = time.monotonic()
+        for sheet in sheets:
+            self._fresh[(book, sheet)] = now
+
+    def _refresh_full(self, gs, book: str, creds_src: str, sheet: str) -> None:
+        values = gs.read_sheet_values(book, creds_src, sheet)
+        header, rows = (tuple(values[0]), values[1:]) if values else ((), [])
+        digest = _digest(header, rows)
+        meta = self._meta(book, sheet)
+        if meta is not None and meta[2] == digest:
+            return
+        self._store(book, sheet, header, rows, 2, len(rows) + 1, digest, replace_all=True)
+
+    def _refresh_tail(self, gs, book: str, creds_src: str, sheet: str) -> None:
+        meta = self._meta(book, sheet)
+        known = meta[1] if meta else 0
+        first = max(2, known - SHEET_MIRROR_OVERLAP + 1)
+        header, rows, row_count = gs.read_sheet_tail(book, creds_src, sheet, first)
+        if meta is None or meta[0] != tuple(header) or row_count < known:
+            # новый лист, перестроенный заголовок или удалённые строки — целиком
+            if first > 2:
+                header, rows, row_count = gs.read_sheet_tail(book, creds_src, sheet, 2)
+            self._store(book, sheet, header, rows, 2, row_count, _digest(header, rows), replace_all=True)
+            return
+        self._store(book, sheet, header, rows, first, row_count, meta[2], replace_all=False)
+
+    def invalidate(self, book: Optional[str] = None, sheet: Optional[str] = None) -> None:
+        """
+        Следующие чтения идут мимо копии, пока её не обновят (запись в лист,
+        кнопка «🔄 Обновить»); следующее обновление не пропускается по ревизии.
+        """
+        for key in list(self._fresh):
+            if (book is None or key[0] == book) and (sheet is None or key[1] == sheet):
+                self._fresh.pop(key, None)
+        if book is None:
+            self._revision.clear()
+        else:
+            self._revision.pop(book, None)
+
+    # ── чтение ─────────────────────────────────────────────────────
+    def ready(self, book: str, sheet: str) -> bool:
+        seen = self._fresh.get((book, sheet))
+        return seen is not None and time.monotonic() - seen < SHEET_MIRROR_MAX_AGE
+
+    def _header(self, book: str, sheet: str) -> Tuple[str, ...]:
+        header = self._headers.get((book, sheet))
+        if header is None:
+            meta = self._meta(book, sheet)
+            header = self._headers[(book, sheet)] = meta[0] if meta else ()
+        return header
+
+    def _select(self, sql: str, params: Sequence) -> List[list]:
+        with self._lock:
+            return [json.loads(data) for (data,) in self._db().execute(sql, tuple(params))]
+
+    def query(
+        self,
+        book: str,
+        sheet: str,
+        fields: Optional[Sequence[str]] = None,
+        statuses: Optional[Sequence[str]] = None,
+        category: Optional[str] = None,
+        order: str = "rownum",
+        limit: Optional[int] = None,
+    ) -> Table:
+        """
+        Строки листа из копии. statuses — без учёта регистра; order — "rownum",
+        "-rownum" (с конца) или "deadline" (пустые/кривые даты — в конце).
+        fields — только эти колонки (как проекционные чтения google_sheets).
+        """
+        sql = "SELECT data FROM rows WHERE book = ? AND sheet = ?"
+        params: List = [book, sheet]
+        if statuses:
+            sql += f" AND status IN ({','.join('?' * len(statuses))})"
+            params.extend(s.lower() for s in statuses)
+        if category is not None:
+            sql += " AND category = ?"
+            params.append(category)
+        sql += {"rownum": " ORDER BY rownum", "-rownum": " ORDER BY rownum DESC",
+                "deadline": " ORDER BY deadline, rownum"}[order]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._select(sql, params)
+        if order == "-rownum":
+            rows.reverse()
+        header = self._header(book, sheet)
+        if fields is None:
+            return Table(header, rows)
+        names = [f for f in fields if f in header]
+        positions = [header.index(f) for f in names]
+        return Table(names, ([r[i] if i < len(r) else "" for i in positions] for r in rows))
+
+    def stats(self) -> Dict:
+        return {
+            "refreshes": self.refreshes,
+            "skipped": self.skipped,
+            "rows_written": self.rows_written,
+            "last_refresh_ms": self.last_refresh_ms,
+            "last_error": self.last_error,
+            "sheets": len(self._fresh),
+        }
+
+
+# Общая копия процесса
+mirror = SheetMirror()
+
+
+async def _job(context) -> None:
+    from executors import run_blocking
+    book, creds_src = context.job.data
+    try:
+        await run_blocking(mirror.refresh, book, creds_src)
+    except Exception:
+        pass  # уже в логе; чтения пойдут мимо копии, когда она устареет
+
+
+def schedule(job_queue, book: str, creds_src: str) -> bool:
+    """Периодическое обновление копии в JobQueue; False — копия выключена."""
+    if not (SHEET_MIRROR_PATH and book and creds_src):
+        return False
+    if job_queue is None:
+        log.warning("Sheet mirror disabled: JobQueue is not available (python-telegram-bot[job-queue])")
+        return False
+    job_queue.run_repeating(_job, SHEET_MIRROR_INTERVAL, first=1.0, data=(book, creds_src), name="sheet mirror")
+    return True
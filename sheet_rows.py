@@ -0,0 +1,88 @@
+# sheet_rows.py
+"""
+Компактное представление строк листа.
+
+Вместо словаря на каждую строку (как get_all_records) храним один общий
+индекс «колонка → позиция» и кортежи значений. Record ведёт себя как
+dict только для чтения (get / [] / keys / items), поэтому существующий код
+вида t.get("Задача", "?") работает без изменений.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+
+class Record:
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index: Dict[str, int], values: Tuple):
+        self._index = index
+        self._values = values
+
+    def get(self, key: str, default: Any = None) -> Any:
+        pos = self._index.get(key)
+        if pos is None or pos >= len(self._values):
+            return default
+        return self._values[pos]
+
+    def __getitem__(self, key: str) -> Any:
+        pos = self._index[key]
+        return self._values[pos] if pos < len(self._values) else ""
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def keys(self):
+        return self._index.keys()
+
+    def values(self) -> List[Any]:
+        return [self[k] for k in self._index]
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(k, self[k]) for k in self._index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Record):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Record({self.to_dict()!r})"
+
+
+class Table:
+    """Заголовок + строки-кортежи; индекс колонок общий для всех строк."""
+
+    __slots__ = ("header", "index", "rows")
+
+    def __init__(self, header: Sequence[str], rows: Iterable[Sequence[Any]]):
+        self.header = tuple(header)
+        self.index = {name: i for i, name in enumerate(self.header) if name}
+        width = len(self.header)
+        self.rows = [tuple(r[:width]) + ("",) * (width - len(r)) for r in rows]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def position(self, name: str) -> int:
+        return self.index.get(name, -1)
+
+    def column(self, name: str) -> List[Any]:
+        pos = self.index.get(name)
+        return [""] * len(self.rows) if pos is None else [r[pos] for r in self.rows]
+
+    def record(self, i: int) -> Record:
+        return Record(self.index, self.rows[i])
+
+    def records(self) -> List[Record]:
+        index = self.index
+        return [Record(index, r) for r in self.rows]
@@ -0,0 +1,205 @@
+# slots.py
+"""
+Поиск свободного времени в календарях: «первое окно на N минут после T
+в рабочие часы».
+
+Индекс строится один раз на набор данных и дальше отвечает за O(log n):
+
+  • занятость всех календарей (события из хранилища calendar_cache или
+    freebusy API) и нерабочие часы (WORK_HOURS по TZ) сливаются в
+    отсортированные непересекающиеся интервалы;
+  • промежутки между ними — кандидаты; над их длинами (с учётом
+    выравнивания начала на SLOT_STEP минут) — дерево отрезков с максимумом:
+    первый промежуток не короче N после данного находится спуском по
+    дереву, а не перебором.
+
+Индекс кешируется по версиям хранилищ календарей и дате: пока события не
+менялись, повторный поиск — только запрос к дереву.
+"""
+import os
+import time
+import bisect
+import hashlib
+import logging
+import threading
+import datetime as dt
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dateutil import tz as _tz
+
+import startup
+from executors import run_blocking
+
+calendar_api = startup.lazy("calendar_api")
+calendar_cache = startup.lazy("calendar_cache")
+
+# Рабочие часы по TZ: "06:00-23:00"; конец раньше начала — смена через полночь
+WORK_HOURS = os.getenv("WORK_HOURS", "06:00-23:00").strip()
+# Начало окна выравнивается на столько минут
+SLOT_STEP = int(os.getenv("SLOT_STEP", "15"))
+# Насколько вперёд искать, дней
+SLOT_HORIZON_DAYS = int(os.getenv("SLOT_HORIZON_DAYS", "14"))
+TZ = os.getenv("TZ", "Europe/Berlin")
+
+log = logging.getLogger(__name__)
+
+Interval = Tuple[float, float]  # unix-время, [начало, конец)
+
+
+def parse_hours(spec: str) -> Tuple[dt.time, dt.time]:
+    """"09:00-23:00" → (time(9), time(23)); пустая строка — круглые сутки."""
+    if not spec:
+        return dt.time(0), dt.time(0)
+    start, end = (dt.time.fromisoformat(part.strip()) for part in spec.split("-"))
+    return start, end
+
+
+def off_hours(lo: float, hi: float, hours: Tuple[dt.time, dt.time], tzinfo) -> List[Interval]:
+    """Нерабочее время в [lo, hi) — те же «занятые» интервалы."""
+    start, end = hours
+    if start == end:
+        return []
+    out: List[Interval] = []
+    cursor = lo
+    day = dt.datetime.fromtimestamp(lo, tzinfo).date() - dt.timedelta(days=1)
+    while cursor < hi:
+        opens = dt.datetime.combine(day, start, tzinfo).timestamp()
+        closes_day = day + dt.timedelta(days=1) if end <= start else day
+        closes = dt.datetime.combine(closes_day, end, tzinfo).timestamp()
+        if opens > cursor:
+            out.append((cursor, min(opens, hi)))
+        cursor = max(cursor, closes)
+        day += dt.timedelta(days=1)
+    return out
+
+
+class BusyIndex:
+    """Занятые интервалы [lo, hi) и дерево отрезков над длинами промежутков."""
+
+    def __init__(self, busy: Sequence[Interval], lo: float, hi: float, step: float = SLOT_STEP * 60):
+        self.lo, self.hi, self.step = lo, hi, step
+        merged: List[List[float]] = []
+        for s, e in sorted(busy):
+            s, e = max(s, lo), min(e, hi)
+            if e <= s:
+                continue
+            if merged and s <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+        # промежуток k — [gap_lo[k], gap_hi[k]): до первого занятого, между ними, после последнего
+        self.gap_lo = [lo] + [e for _, e in merged]
+        self.gap_hi = [s for s, _ in merged] + [hi]
+        self.busy = len(merged)
+
+        n = len(self.gap_lo)
+        self._size = 1
+        while self._size < n:
+            self._size *= 2
+        self._tree = [-1.0] * (2 * self._size)
+        for k in range(n):
+            self._tree[self._size + k] = self.gap_hi[k] - self._align(self.gap_lo[k])
+        for i in range(self._size - 1, 0, -1):
+            self._tree[i] = max(self._tree[2 * i], self._tree[2 * i + 1])
+
+    def _align(self, t: float) -> float:
+        return -(-t // self.step) * self.step
+
+    def _first_fit(self, k: int, need: float, node: int = 1, left: int = 0, right: Optional[int] = None) -> int:
+        """Первый промежуток с номером ≥ k и длиной ≥ need (−1 — нет); O(log n)."""
+        if right is None:
+            right = self._size
+        if right <= k or self._tree[node] < need:
+            return -1
+        if right - left == 1:
+            return left
+        mid = (left + right) // 2
+        found = self._first_fit(k, need, 2 * node, left, mid)
+        return found if found >= 0 else self._first_fit(k, need, 2 * node + 1, mid, right)
+
+    def first_free(self, after: float, minutes: int) -> Optional[Interval]:
+        """Первое свободное окно на minutes минут, начинающееся не раньше after."""
+        need = minutes * 60
+        after = max(after, self.lo)
+        k = bisect.bisect_right(self.gap_lo, after) - 1
+        start = self._align(after)
+        if start + need <= self.gap_hi[k]:
+            return start, start + need
+        k = self._first_fit(k + 1, need)
+        if k < 0:
+            return None
+        start = self._align(self.gap_lo[k])
+        return start, start + need
+
+    def free_slots(self, after: float, minutes: int, count: int) -> List[Interval]:
+        """До count непересекающихся окон подряд."""
+        out: List[Interval] = []
+        while len(out) < count:
+            slot = self.first_free(after, minutes)
+            if slot is None:
+                break
+            out.append(slot)
+            after = slot[1]
+        return out
+
+
+# ── индекс по календарям ───────────────────────────────────────────
+_indexes: Dict[Tuple, BusyIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def build_index(
+    calendar_ids: Sequence[str], creds_input: str, cached: bool = True, work_hours: str = WORK_HOURS
+) -> BusyIndex:
+    """Индекс занятости на SLOT_HORIZON_DAYS вперёд (блокирующе — вызывать в пуле потоков)."""
+    tzinfo = _tz.gettz(TZ or "Europe/Berlin")
+    today = dt.datetime.now(tzinfo).replace(hour=0, minute=0, second=0, microsecond=0)
+    dt_from, dt_to = today, today + dt.timedelta(days=SLOT_HORIZON_DAYS + 1)
+
+    stores = [calendar_cache.get_store(cid, creds_input) for cid in calendar_ids] if cached else []
+    for store in stores:
+        store.sync()
+    if cached and all(store.covers(dt_from, dt_to) for store in stores):
+        creds_hash = hashlib.sha256(str(creds_input).encode("utf-8")).hexdigest()
+        key = (tuple(calendar_ids), creds_hash, tuple(s.version for s in stores), today, work_hours)
+        with _indexes_lock:
+            index = _indexes.get(key)
+        if index is not None:
+            return index
+        spans = [span for store in stores for span in store.busy_between(dt_from, dt_to)]
+    else:
+        key = None
+        spans = calendar_api.freebusy(calendar_ids, creds_input, dt_from, dt_to)
+
+    started = time.perf_counter()
+    lo, hi = dt_from.timestamp(), dt_to.timestamp()
+    busy = [(s.timestamp(), e.timestamp()) for s, e in spans]
+    busy += off_hours(lo, hi, parse_hours(work_hours), tzinfo)
+    index = BusyIndex(busy, lo, hi)
+    log.info("Slots: index of %d busy intervals built in %.1f ms", index.busy, (time.perf_counter() - started) * 1000)
+    if key is not None:
+        with _indexes_lock:
+            _indexes.clear()  # нужен только индекс для текущих версий
+            _indexes[key] = index
+    return index
+
+
+async def find_free(
+    calendar_ids: Sequence[str],
+    creds_input: str,
+    minutes: int,
+    after: Optional[dt.datetime] = None,
+    count: int = 1,
+    cached: bool = True,
+) -> List[Tuple[dt.datetime, dt.datetime]]:
+    """До count свободных окон на minutes минут после after (по умолчанию — сейчас), в TZ."""
+    index = await run_blocking(build_index, calendar_ids, creds_input, cached)
+    tzinfo = _tz.gettz(TZ or "Europe/Berlin")
+    if after is None:
+        after = dt.datetime.now(tzinfo)
+    elif after.tzinfo is None:
+        after = after.replace(tzinfo=tzinfo)
+    return [
+        (dt.datetime.fromtimestamp(s, tzinfo), dt.datetime.fromtimestamp(e, tzinfo))
+        for s, e in index.free_slots(after.timestamp(), minutes, count)
+    ]
@@ -1,14 +1,36 @@
 import os
 import json
-import requests
-from typing import Optional
-from openai import OpenAI
+import time
+import asyncio
+from collections import deque
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Union
+
+import httpx
+
+import http_pool
+from executors import run_blocking
+from resilience import OPENAI, YANDEX
+
+# Аудио: байты в памяти (обычный путь) или путь к временному файлу (большие записи)
+Audio = Union[bytes, bytearray, memoryview, str]
 
 # ── Переменные окружения ───────────────────────────────────────────
 YANDEX_API_KEY   = os.getenv("YANDEX_API_KEY")
 YANDEX_FOLDER_ID = os.getenv("YANDEX_FOLDER_ID")
 OPENAI_API_KEY   = os.getenv("OPENAI_API_KEY")
 
+# sequential — как раньше (Yandex, потом OpenAI); hedge — второй бэкенд
+# стартует, если первый молчит STT_HEDGE_DELAY секунд; race — оба сразу
+STT_MODE         = os.getenv("STT_MODE", "hedge").strip().lower()
+STT_HEDGE_DELAY  = float(os.getenv("STT_HEDGE_DELAY", "4"))
+STT_PRIMARY      = os.getenv("STT_PRIMARY", "yandex").strip().lower()
+
+FAILED_TEXT = (
+    "⚠️ Не удалось распознать голос. "
+    "Проверьте YANDEX_API_KEY / YANDEX_FOLDER_ID или квоту OpenAI."
+)
+
 # ── Вспомогательные ────────────────────────────────────────────────
 def _clean_text(t: str) -> str:
     """Аккуратная нормализация текста результата."""
@@ -24,10 +46,35 @@ def _clean_text(t: str) -> str:
         t += "."
     return t
 
+def _as_upload(audio: Audio, filename: str = "voice.ogg"):
+    """Байты отдаём как есть (без копии на диск); путь — как файл."""
+    if isinstance(audio, str):
+        return Path(audio)
+    return (filename, bytes(audio) if not isinstance(audio, bytes) else audio)
+
+async def _file_chunks(path: str, size: int = 256 * 1024) -> AsyncIterator[bytes]:
+    """Тело запроса из файла кусками (чтение диска — в пуле потоков)."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = await run_blocking(f.read, size)
+            if not chunk:
+                return
+            yield chunk
+
 # ── Распознавание через Yandex SpeechKit ───────────────────────────
-def _recognize_yandex(audio_path: str) -> Optional[str]:
+async def _post_yandex(url: str, headers: Dict, audio: Audio) -> httpx.Response:
+    """Одна попытка запроса (тело собирается заново — поток из файла одноразовый)."""
+    # большой файл — тело запроса читается потоком, байты уходят как есть
+    content = _file_chunks(audio) if isinstance(audio, str) else bytes(audio)
+    resp = await http_pool.client().post(
+        url, headers=headers, content=content, timeout=http_pool.timeout_for(url)
+    )
+    resp.raise_for_status()
+    return resp
+
+async def _recognize_yandex(audio: Audio) -> Optional[str]:
     """
-    Отправляет файл в Yandex STT.
+    Отправляет аудио в Yandex STT.
     Telegram voice = OGG/Opus — поддерживается STT напрямую.
     Документация: https://cloud.yandex.ru/docs/speechkit/stt/request
     """
@@ -41,10 +88,12 @@ def _recognize_yandex(audio_path: str) -> Optional[str]:
     headers = {"Authorization": f"Api-Key {YANDEX_API_KEY}"}
 
     try:
-        with open(audio_path, "rb") as f:
-            resp = requests.post(url, headers=headers, data=f.read(), timeout=60)
+        resp = await YANDEX.acall("stt", _post_yandex, url, headers, audio)
         # Пример ответа: {"result":"текст", "endOfUtterance":true}
         data = resp.json()
+    except httpx.HTTPStatusError as e:
+        print("Yandex STT error payload:", e.response.text)
+        return None
     except Exception as e:
         print("Yandex STT network/parse error:", repr(e))
         return None
@@ -57,7 +106,7 @@ def _recognize_yandex(audio_path: str) -> Optional[str]:
     return None
 
 # ── Распознавание через OpenAI (fallback) ──────────────────────────
-def _recognize_openai(audio_path: str) -> Optional[str]:
+async def _recognize_openai(audio: Audio) -> Optional[str]:
     """
     Fallback на OpenAI (Whisper via Chat Completions API).
     Требуется OPENAI_API_KEY.
@@ -66,40 +115,130 @@ def _recognize_openai(audio_path: str) -> Optional[str]:
         return None
 
     try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        with open(audio_path, "rb") as audio_file:
-            # gpt-4o-mini-transcribe — актуальная лёгкая модель для транскрибации
-            out = client.audio.transcriptions.create(
-                model="gpt-4o-mini-transcribe",
-                file=audio_file,
-                # Можно подсказать язык, чтобы ускорить/улучшить качество
-                # language="ru"
-            )
+        client = http_pool.openai_client(OPENAI_API_KEY)
+        # gpt-4o-mini-transcribe — актуальная лёгкая модель для транскрибации
+        out = await OPENAI.acall(
+            "transcription",
+            client.audio.transcriptions.create,
+            model="gpt-4o-mini-transcribe",
+            file=_as_upload(audio),
+            # Можно подсказать язык, чтобы ускорить/улучшить качество
+            # language="ru"
+        )
         text = getattr(out, "text", "") or ""
         return _clean_text(text)
     except Exception as e:
         print("OpenAI transcription error:", repr(e))
         return None
 
+# ── Хеджирование: статистика бэкендов ──────────────────────────────
+class BackendStats:
+    def __init__(self, window: int = 200):
+        self.calls = 0
+        self.ok = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.wins = 0
+        self.latencies = deque(maxlen=window)  # секунды успешных ответов
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        data = sorted(self.latencies)
+        return data[min(len(data) - 1, int(q * len(data)))]
+
+    def as_dict(self) -> Dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "ok": self.ok,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "wins": self.wins,
+            "win_rate": round(self.wins / self.calls, 3) if self.calls else 0.0,
+            "p50_s": round(p50, 2) if p50 is not None else None,
+            "p95_s": round(p95, 2) if p95 is not None else None,
+        }
+
+
+_BACKENDS = {"yandex": _recognize_yandex, "openai": _recognize_openai}
+STT_STATS: Dict[str, BackendStats] = {name: BackendStats() for name in _BACKENDS}
+
+
+def _configured() -> list:
+    """Бэкенды с ключами, основной — первым."""
+    names = [n for n, ok in (("yandex", YANDEX_API_KEY and YANDEX_FOLDER_ID), ("openai", OPENAI_API_KEY)) if ok]
+    names.sort(key=lambda n: n != STT_PRIMARY)
+    return names
+
+
+async def _run_backend(name: str, audio: Audio) -> Optional[str]:
+    st = STT_STATS[name]
+    st.calls += 1
+    started = time.perf_counter()
+    try:
+        text = await _BACKENDS[name](audio)
+    except asyncio.CancelledError:
+        st.cancelled += 1
+        raise
+    if text:
+        st.ok += 1
+        st.latencies.append(time.perf_counter() - started)
+    else:
+        st.failed += 1
+    return text
+
+
 # ── Публичная функция ──────────────────────────────────────────────
-def recognize_speech(audio_path: str) -> str:
+async def recognize_speech(audio: Audio, mode: Optional[str] = None,
+                           hedge_delay: Optional[float] = None) -> str:
     """
-    Универсальная точка входа:
-    1) Пытается Yandex SpeechKit;
-    2) Если не удалось — OpenAI;
-    3) Если и это не удалось — возвращает предупреждение.
+    Универсальная точка входа (audio — байты OGG/Opus или путь к файлу).
+    sequential: Yandex, при неудаче — OpenAI. hedge/race: берётся первый
+    непустой результат, второй запрос отменяется; если бэкенд вернул
+    ошибку раньше таймера — следующий стартует сразу. Если не удалось
+    ничего — возвращает предупреждение.
     """
-    # 1) Yandex
-    text = _recognize_yandex(audio_path)
-    if text:
-        return text
+    mode = (mode or STT_MODE).lower()
+    delay = STT_HEDGE_DELAY if hedge_delay is None else hedge_delay
+    queue = _configured()
 
-    # 2) OpenAI
-    text = _recognize_openai(audio_path)
-    if text:
-        return text
+    if mode == "sequential":
+        for name in queue:
+            text = await _run_backend(name, audio)
+            if text:
+                STT_STATS[name].wins += 1
+                return text
+        return FAILED_TEXT
 
-    return (
-        "⚠️ Не удалось распознать голос. "
-        "Проверьте YANDEX_API_KEY / YANDEX_FOLDER_ID или квоту OpenAI."
-    )
+    running: Dict[asyncio.Task, str] = {}
+
+    def launch() -> None:
+        name = queue.pop(0)
+        running[asyncio.ensure_future(_run_backend(name, audio))] = name
+
+    try:
+        while queue and (mode == "race" or not running):
+            launch()
+        while running:
+            timeout = delay if queue else None
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()  # основной молчит дольше порога — подключаем запасной
+                continue
+            for task in done:
+                name = running.pop(task)
+                text = task.result() if not task.cancelled() else None
+                if text:
+                    STT_STATS[name].wins += 1
+                    return text
+            if queue and not running:
+                launch()
+        return FAILED_TEXT
+    finally:
+        for task in running:
+            task.cancel()
+
+
+def stt_stats() -> Dict[str, Dict]:
+    return {name: st.as_dict() for name, st in STT_STATS.items()}
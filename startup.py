@@ -0,0 +1,137 @@
+# startup.py
+"""
+Быстрый холодный старт: тяжёлые SDK (openai, gspread, googleapiclient,
+numpy) не импортируются, пока webhook не начал слушать порт.
+
+  google_sheets = startup.lazy("google_sheets")
+
+— объект-заместитель: модуль импортируется при первом обращении к
+атрибуту (importlib, потокобезопасно). После того как сервер поднялся,
+warm-up в фоне (в пуле потоков) импортирует всё отложенное, так что
+первый настоящий запрос обычно уже не платит за импорт.
+
+LAZY_IMPORTS=0 — импорт сразу, как раньше; WARMUP=0 — без фонового
+прогрева (модули грузятся при первом использовании).
+
+Отметки времени (от импорта этого модуля, т.е. почти от старта main) —
+в stats() и /diag; разбивка по модулям: python -m bench.startup_bench.
+"""
+import os
+import sys
+import time
+import logging
+import importlib
+import importlib.util
+import threading
+from typing import Dict, List
+
+LAZY_IMPORTS = os.getenv("LAZY_IMPORTS", "1").strip().lower() in ("1", "true", "yes")
+WARMUP = os.getenv("WARMUP", "1").strip().lower() in ("1", "true", "yes")
+
+STARTED = time.perf_counter()
+
+log = logging.getLogger(__name__)
+
+_marks: Dict[str, float] = {}  # событие -> мс от STARTED
+_load_ms: Dict[str, float] = {}  # модуль -> мс на импорт (включая зависимости)
+_lazy: List["LazyModule"] = []
+_lock = threading.Lock()
+
+
+def mark(event: str) -> float:
+    """Запоминает момент события (первый раз) и возвращает его в мс."""
+    with _lock:
+        if event not in _marks:
+            _marks[event] = round((time.perf_counter() - STARTED) * 1000, 1)
+        return _marks[event]
+
+
+class LazyModule:
+    """Заместитель модуля: import при первом обращении к атрибуту."""
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self._name)  # блокировки импорта — на стороне importlib
+            with _lock:
+                if self.__dict__["_module"] is None:
+                    self.__dict__["_module"] = module
+                    _load_ms[self._name] = round((time.perf_counter() - started) * 1000, 1)
+        return module
+
+    @property
+    def loaded(self) -> bool:
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value) -> None:
+        setattr(self._load(), attr, value)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}{'' if self.loaded else ' (not loaded)'}>"
+
+
+def lazy(name: str):
+    """Модуль, загружаемый при первом использовании (или сразу, если LAZY_IMPORTS=0 / уже загружен)."""
+    if not LAZY_IMPORTS or name in sys.modules:
+        return importlib.import_module(name)
+    proxy = LazyModule(name)
+    _lazy.append(proxy)
+    return proxy
+
+
+def optional(name: str):
+    """Как lazy(), но None, если пакет не установлен (numpy и т.п.)."""
+    if name not in sys.modules and importlib.util.find_spec(name) is None:
+        return None
+    return lazy(name)
+
+
+# ── Прогрев ────────────────────────────────────────────────────────
+def warmup() -> Dict[str, float]:
+    """Импортирует всё отложенное (блокирующе — вызывать в пуле потоков)."""
+    started = time.perf_counter()
+    for proxy in list(_lazy):
+        try:
+            proxy._load()
+        except Exception as e:  # сломанный SDK не должен ронять бота — ошибка всплывёт при вызове
+            log.warning("Warm-up: cannot import %s: %r", proxy._name, e)
+    mark("warm")
+    log.info("Warm-up done in %.0f ms: %s", (time.perf_counter() - started) * 1000, _load_ms)
+    return dict(_load_ms)
+
+
+async def _warmup_async() -> None:
+    from executors import run_blocking
+    await run_blocking(warmup)
+
+
+_warm_task = None  # ссылка на фоновую задачу, чтобы её не собрал GC
+
+
+def on_listen(application) -> None:
+    """Хук webserver.serve: сервер слушает порт — отмечаем и греем модули в фоне."""
+    import asyncio
+    global _warm_task
+    log.info("Listening %.0f ms after start", mark("listening"))
+    if WARMUP and any(not p.loaded for p in _lazy):
+        # порт уже открыт, а application.start() ещё нет — application.create_task
+        # тут предупреждает, что задачу никто не дождётся; она и не должна
+        _warm_task = asyncio.get_running_loop().create_task(_warmup_async())
+
+
+def stats() -> Dict:
+    return {
+        "lazy": LAZY_IMPORTS,
+        "marks_ms": dict(_marks),
+        "pending": [p._name for p in _lazy if not p.loaded],
+        "load_ms": dict(_load_ms),
+    }
+
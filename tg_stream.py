@@ -0,0 +1,82 @@
+# tg_stream.py
+"""
+Постепенное обновление сообщения Telegram по мере прихода текста.
+
+Правки идут не чаще раза в STREAM_EDIT_INTERVAL секунд и только если текст
+заметно вырос (Telegram ограничивает частоту editMessageText; на RetryAfter
+просто пропускаем правки до указанного времени). Финальная правка
+выполняется всегда и вешает клавиатуру.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+from telegram import InlineKeyboardMarkup, Message
+from telegram.error import BadRequest, RetryAfter
+
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.2"))
+STREAM_MIN_DELTA = int(os.getenv("STREAM_MIN_DELTA", "40"))
+TG_LIMIT = 4096
+
+log = logging.getLogger(__name__)
+
+
+class ProgressiveMessage:
+    def __init__(self, message: Message, prefix: str = "", interval: float = STREAM_EDIT_INTERVAL,
+                 min_delta: int = STREAM_MIN_DELTA):
+        self.message = message
+        self.prefix = prefix
+        self.interval = interval
+        self.min_delta = min_delta
+        self.text = ""
+        self._shown = 0
+        self._next_edit = 0.0
+        self.edits = 0
+
+    def _render(self, cursor: bool) -> str:
+        body = self.prefix + self.text + (" ▍" if cursor else "")
+        if len(body) > TG_LIMIT:
+            body = body[: TG_LIMIT - 1] + "…"
+        return body
+
+    async def _edit(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+        try:
+            await self.message.edit_text(text, reply_markup=reply_markup)
+            self.edits += 1
+        except RetryAfter as e:
+            log.info("Stream edit throttled, retry after %ss (final=%s)", e.retry_after, reply_markup is not None)
+            self._next_edit = time.monotonic() + float(e.retry_after)
+            if reply_markup is not None:
+                # финальную правку нельзя терять — дождёмся окна
+                await asyncio.sleep(float(e.retry_after))
+                await self.message.edit_text(text, reply_markup=reply_markup)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                log.warning("Stream edit failed: %s", e)
+                raise
+
+    async def push(self, delta: str) -> None:
+        self.text += delta
+        now = time.monotonic()
+        if now < self._next_edit or len(self.text) - self._shown < self.min_delta:
+            return
+        self._shown = len(self.text)
+        self._next_edit = now + self.interval
+        await self._edit(self._render(cursor=True))
+
+    async def finish(self, reply_markup: Optional[InlineKeyboardMarkup] = None) -> str:
+        """Финальная правка; хвост длиннее лимита Telegram уходит отдельными сообщениями."""
+        self.text = self.text.strip()
+        full = self.prefix + self.text
+        await self._edit(full[:TG_LIMIT], reply_markup=reply_markup)
+        for i in range(TG_LIMIT, len(full), TG_LIMIT):
+            await self.message.reply_text(full[i:i + TG_LIMIT])
+        return self.text
+
+    async def consume(self, chunks: AsyncIterator[str],
+                      reply_markup: Optional[InlineKeyboardMarkup] = None) -> str:
+        async for delta in chunks:
+            await self.push(delta)
+        return await self.finish(reply_markup)
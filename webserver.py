@@ -0,0 +1,162 @@
+# webserver.py
+"""
+Веб-сервер бота: webhook Telegram и служебные маршруты на одном порту.
+
+Встроенный сервер run_webhook у PTB не позволяет добавить свои маршруты,
+поэтому приложение запускается вручную (initialize → post_init →
+setWebhook → start), а апдейты из webhook кладутся в application.update_queue
+так же, как это делает PTB. Маршруты:
+
+  POST /<url_path>  — апдейты Telegram;
+  GET  /metrics     — метрики Prometheus (METRICS_PATH, если METRICS_ENABLED;
+                      с METRICS_TOKEN или только с localhost);
+  GET  /healthz     — проверка живости.
+"""
+import re
+import hmac
+import json
+import time
+import signal
+import asyncio
+import logging
+from http import HTTPStatus
+from typing import Callable, Optional
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram import Update
+from telegram.ext import Application
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+class WebhookHandler(tornado.web.RequestHandler):
+    SUPPORTED_METHODS = ("POST",)
+
+    def initialize(self, bot_app: Application, secret_token: Optional[str] = None) -> None:
+        self.bot_app = bot_app
+        self.secret_token = secret_token
+
+    async def post(self) -> None:
+        started = time.perf_counter()
+        status = HTTPStatus.OK
+        try:
+            await self._accept()
+        except tornado.web.HTTPError as e:
+            status = e.status_code
+            raise
+        finally:
+            if metrics.METRICS_ENABLED:
+                metrics.WEBHOOK_REQUESTS.inc(status=int(status))
+                metrics.WEBHOOK_SECONDS.observe(time.perf_counter() - started)
+
+    async def _accept(self) -> None:
+        if self.request.headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+            raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+        if self.secret_token and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.secret_token:
+            raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+        try:
+            data = json.loads(self.request.body)
+            update = Update.de_json(data, self.bot_app.bot)
+        except Exception as e:
+            log.error("Webhook: cannot parse update: %r", e)
+            raise tornado.web.HTTPError(HTTPStatus.BAD_REQUEST)
+        if update:
+            await self.bot_app.update_queue.put(update)
+        self.set_status(HTTPStatus.OK)
+
+    def log_exception(self, typ, value, tb) -> None:
+        if not isinstance(value, tornado.web.HTTPError):
+            super().log_exception(typ, value, tb)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def prepare(self) -> None:
+        if metrics.METRICS_TOKEN:
+            given = self.request.headers.get("Authorization", "")
+            if not hmac.compare_digest(given.encode(), f"Bearer {metrics.METRICS_TOKEN}".encode()):
+                raise tornado.web.HTTPError(HTTPStatus.UNAUTHORIZED)
+        elif self.request.remote_ip not in ("127.0.0.1", "::1"):
+            # за прокси Render remote_ip — реальный клиент (xheaders=True)
+            raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+
+    def get(self) -> None:
+        self.set_header("Content-Type", metrics.CONTENT_TYPE)
+        self.write(metrics.render())
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self) -> None:
+        self.write("ok")
+
+
+def make_web_app(application: Application, url_path: str, secret_token: Optional[str] = None) -> tornado.web.Application:
+    routes = [
+        (rf"/{re.escape(url_path.strip('/'))}/?", WebhookHandler, {"bot_app": application, "secret_token": secret_token}),
+        (r"/healthz", HealthHandler),
+    ]
+    if metrics.METRICS_ENABLED:
+        routes.append((metrics.METRICS_PATH, MetricsHandler))
+    return tornado.web.Application(routes)
+
+
+async def serve(
+    application: Application,
+    listen: str,
+    port: int,
+    url_path: str,
+    webhook_url: str,
+    secret_token: Optional[str] = None,
+    stop: Optional[asyncio.Event] = None,
+    on_listen: Optional[Callable[[Application], None]] = None,
+) -> None:
+    """
+    Жизненный цикл как у run_webhook: post_init, post_stop и post_shutdown
+    вызываются; работа продолжается, пока не установлен stop. Порт
+    открывается до setWebhook, чтобы холодный старт не ждал Bot API;
+    on_listen вызывается сразу после этого.
+    """
+    stop = stop or asyncio.Event()
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        server = HTTPServer(make_web_app(application, url_path, secret_token), xheaders=True)
+        server.listen(port, listen)
+        log.info("Webhook server on %s:%s/%s", listen, port, url_path.strip("/"))
+        try:
+            if on_listen:
+                on_listen(application)
+            # порт уже открыт: апдейты, пришедшие до start(), ждут в update_queue
+            await application.bot.set_webhook(url=webhook_url, secret_token=secret_token)
+            await application.start()
+            try:
+                await stop.wait()
+            finally:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+        finally:
+            server.stop()
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run(application: Application, listen: str, port: int, url_path: str, webhook_url: str,
+        secret_token: Optional[str] = None, on_listen: Optional[Callable[[Application], None]] = None) -> None:
+    """Блокирующий запуск до SIGINT / SIGTERM."""
+    async def main() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows / не главный поток
+        await serve(application, listen, port, url_path, webhook_url, secret_token, stop, on_listen)
+
+    asyncio.run(main())